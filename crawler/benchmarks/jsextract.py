@@ -0,0 +1,121 @@
+"""
+Micro-benchmarks of jsextract against the string munging it replaced.
+
+Run from crawler directory:
+    python -m benchmarks.jsextract --number 200
+"""
+import argparse
+import json
+import random
+import timeit
+
+from dealcrawler.util.jsextract import extract_balanced, loads_js, loads_jsonp
+
+
+def legacy_substr_surrounded_by_chars(full_str, char_pair, offset=0):
+    # Previous helper.substr_surrounded_by_chars, it scans char by char and ignores string literals.
+    open_tag, close_tag = char_pair
+    stack = []
+    open_index = -1
+    close_index = -1
+    for i in range(offset, len(full_str)):
+        ch = full_str[i]
+        if ch == open_tag:
+            if open_index == -1:
+                open_index = i
+            stack.append(ch)
+        elif ch == close_tag:
+            if len(stack) < 1:
+                raise ValueError("Invalid str value, close tag before open tag")
+            stack.pop()
+            if len(stack) == 0:
+                close_index = i
+                break
+    if len(stack) > 0:
+        raise ValueError('Invalid str value, open tag and close tag are not paired.')
+    return full_str[open_index:close_index + 1]
+
+
+def legacy_loads_lasoo_store_js(lasoo_store_js):
+    # Previous parsing of lasoo.util.parse_lasoo_store_js.
+    lasoo_store_js = lasoo_store_js.replace("\t", "").replace("\n", "").replace("\r", "").replace('\'"', '"')
+    if lasoo_store_js.find("\"id\"") > 0:
+        return json.loads(lasoo_store_js)
+    store_json = lasoo_store_js \
+        .replace('{id:', '{"id":') \
+        .replace(',latitude:', ',"latitude":') \
+        .replace(',longitude:', ',"longitude":') \
+        .replace(',displayName:', ',"displayName":')
+    return json.loads(store_json)
+
+
+def legacy_loads_jsonp(response_body):
+    # Previous LasooCoNzDealSpider._get_jsonp_response_data.
+    json_raw_data = response_body.decode('utf8')
+    last_bracket = json_raw_data.rindex(')')
+    json_raw_data = json_raw_data[json_raw_data.index('(') + 1:last_bracket]
+    return json.loads(json_raw_data)
+
+
+def make_store_script(num_stores, rand):
+    """
+    Lasoo store map script, e.g. showOfferDetailNearStoreMap([{id:1,latitude:...}], ...).
+    """
+    stores = ',\n\t'.join(
+        '{{id:{0},latitude:{1:.8f},longitude:{2:.8f},displayName:"Store {0} -- Mowers &amp; Chainsaws Ltd"}}'
+        .format(1352419184723 + i, rand.uniform(-47, -34), rand.uniform(166, 179)) for i in range(num_stores))
+    padding = 'var config = {a: 1, b: [1, 2, 3]};\n' * 50
+    return padding + 'showOfferDetailNearStoreMap([\n\t' + stores + '\n], {zoom: 12});\n' + padding
+
+
+def make_jsonp_body(num_offers, rand):
+    offers = [{'id': i, 'type': 'offer', 'title': 'Offer {0} (save $5)'.format(i),
+               'priceValue': round(rand.uniform(1, 100), 2), 'landingLink': '/offer/{0}'.format(i)}
+              for i in range(num_offers)]
+    return 'cb_{0}([{1}]);'.format(rand.randint(0, 10 ** 9), json.dumps({'offers': offers})).encode('utf-8')
+
+
+def run(number, num_stores, num_offers, log=print):
+    """
+    :param number: times each function is run.
+    :return: list of (name, legacy seconds, new seconds) per call.
+    """
+    rand = random.Random(0)
+    script = make_store_script(num_stores, rand)
+    offset = script.find('showOfferDetailNearStoreMap')
+    store_js = extract_balanced(script, ('[', ']'), offset)
+    body = make_jsonp_body(num_offers, rand)
+    cases = [
+        ('extract store array ({0} stores)'.format(num_stores),
+         lambda: legacy_substr_surrounded_by_chars(script, ('[', ']'), offset),
+         lambda: extract_balanced(script, ('[', ']'), offset)),
+        ('parse store js ({0} stores)'.format(num_stores),
+         lambda: legacy_loads_lasoo_store_js(store_js),
+         lambda: loads_js(store_js)),
+        ('extract & parse store js ({0} stores)'.format(num_stores),
+         lambda: legacy_loads_lasoo_store_js(legacy_substr_surrounded_by_chars(script, ('[', ']'), offset)),
+         lambda: loads_js(extract_balanced(script, ('[', ']'), offset))),
+        ('parse jsonp ({0} offers)'.format(num_offers),
+         lambda: legacy_loads_jsonp(body),
+         lambda: loads_jsonp(body)),
+    ]
+    results = []
+    log('{0:<40} {1:>12} {2:>12} {3:>8}'.format('case', 'legacy (ms)', 'new (ms)', 'speedup'))
+    for name, legacy, new in cases:
+        if legacy() != new():
+            raise AssertionError('Results differ: {0}'.format(name))
+        legacy_time = min(timeit.repeat(legacy, number=number, repeat=3)) / number
+        new_time = min(timeit.repeat(new, number=number, repeat=3)) / number
+        results.append((name, legacy_time, new_time))
+        log('{0:<40} {1:>12.3f} {2:>12.3f} {3:>7.1f}x'.format(
+            name, legacy_time * 1000, new_time * 1000, legacy_time / new_time))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark jsextract against legacy string munging.')
+    parser.add_argument('--number', type=int, default=100, help='Times each function is run.')
+    parser.add_argument('--stores', type=int, default=500, help='Stores in store map script.')
+    parser.add_argument('--offers', type=int, default=500, help='Offers in jsonp response.')
+    args = parser.parse_args()
+    run(args.number, args.stores, args.offers)
@@ -0,0 +1,38 @@
+from django.db import connection
+from psycopg2.extras import execute_values
+
+DEFAULT_BULK_BATCH_SIZE = 500
+
+
+def bulk_update(model, objs, fields, batch_size=DEFAULT_BULK_BATCH_SIZE):
+    """
+    Update fields of model instances with one UPDATE ... FROM (VALUES ...) statement per batch.
+
+    Notes: Django 2.0 has no QuerySet.bulk_update, this is the PostgreSQL equivalent.
+    Fields with auto_now (e.g. updated_time) are refreshed like Model.save() does.
+    :param model: django model class.
+    :param objs: model instances to update, primary key must be set.
+    :param fields: names of the fields to update.
+    :param batch_size: max rows in one statement.
+    :return: number of updated instances.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    meta = model._meta
+    qn = connection.ops.quote_name
+    columns = [meta.pk] + [meta.get_field(name) for name in fields]
+    sql = 'UPDATE {table} AS t SET {assignments} FROM (VALUES %s) AS v ({columns}) WHERE t.{pk} = v.{pk}'.format(
+        table=qn(meta.db_table),
+        assignments=', '.join('{0} = v.{0}'.format(qn(f.column)) for f in columns[1:]),
+        columns=', '.join(qn(f.column) for f in columns),
+        pk=qn(meta.pk.column))
+    # Explicit casts, otherwise PostgreSQL infers text type for the columns in VALUES list.
+    # rel_db_type gives the column type without serial (auto field) or check constraint.
+    template = '(' + ', '.join('%s::' + f.rel_db_type(connection) for f in columns) + ')'
+    rows = []
+    for obj in objs:
+        rows.append([f.get_db_prep_save(f.pre_save(obj, False), connection) for f in columns])
+    with connection.cursor() as cursor:
+        execute_values(cursor.cursor, sql, rows, template=template, page_size=batch_size)
+    return len(rows)
@@ -0,0 +1,86 @@
+from dealcrawler.common.bulk import bulk_update
+
+
+class DiffResult:
+    """
+    Result of diff, items to add, update and delete.
+    """
+
+    def __init__(self):
+        self.added = []         # new items
+        self.updated = []       # (existing item, new item)
+        self.unchanged = []     # existing items
+        self.deleted = []       # existing items
+
+    def has_changes(self):
+        return bool(self.added or self.updated or self.deleted)
+
+
+def diff(existing, incoming, key_func, equals_func=None):
+    """
+    Compare existing items with incoming items in O(n+m).
+    Items are matched by key, the last one wins if incoming items have duplicated keys.
+    :param existing: existing items (e.g. from database).
+    :param incoming: new items.
+    :param key_func: function to get hashable identity of an item.
+    :param equals_func: function(existing, new) returns True if they have same values,
+        items with the same key are always equal by default.
+    :return: DiffResult.
+    """
+    remaining = {key_func(item): item for item in existing}
+    new_items = {key_func(item): item for item in incoming}
+    result = DiffResult()
+    for key, item in new_items.items():
+        found = remaining.pop(key, None)
+        if found is None:
+            result.added.append(item)
+        elif equals_func is None or equals_func(found, item):
+            result.unchanged.append(found)
+        else:
+            result.updated.append((found, item))
+    result.deleted = list(remaining.values())
+    return result
+
+
+def sync_properties(model, owner_attname, existing, incoming, delete_missing=False):
+    """
+    Write the changes between existing and incoming properties with bulk queries.
+    Properties are matched by (owner id, name), so properties of many owners can be synced together.
+    :param model: property model class, e.g. ProductProperty.
+    :param owner_attname: owner foreign key attribute name, e.g. product_id.
+    :param existing: property instances in database.
+    :param incoming: new property instances, owner must be set.
+    :param delete_missing: delete existing properties which are not in incoming properties.
+    :return: DiffResult.
+    """
+    result = diff(existing, incoming,
+                  lambda p: (getattr(p, owner_attname), p.name),
+                  lambda ex_prop, prop: ex_prop.value_equals_to(prop))
+    if result.added:
+        model.objects.bulk_create(result.added)
+    if result.updated:
+        for ex_prop, prop in result.updated:
+            ex_prop.value = prop.value
+        bulk_update(model, [ex_prop for ex_prop, _ in result.updated], ('value',))
+    if delete_missing and result.deleted:
+        model.objects.filter(pk__in=[p.pk for p in result.deleted]).delete()
+    return result
+
+
+def sync_m2m(through_model, owner_attname, target_attname, existing_pairs, incoming_pairs):
+    """
+    Insert missing many to many links with one bulk query.
+    :param through_model: many to many through model, e.g. Product.stores.through.
+    :param owner_attname: owner foreign key attribute name, e.g. product_id.
+    :param target_attname: target foreign key attribute name, e.g. store_id.
+    :param existing_pairs: (owner id, target id) links in database.
+    :param incoming_pairs: (owner id, target id) links to keep.
+    :return: DiffResult of pairs.
+    """
+    result = diff(existing_pairs, incoming_pairs, lambda pair: pair)
+    if result.added:
+        through_model.objects.bulk_create([
+            through_model(**{owner_attname: owner_id, target_attname: target_id})
+            for owner_id, target_id in result.added
+        ])
+    return result
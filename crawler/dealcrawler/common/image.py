@@ -0,0 +1,220 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from common.utils.hash import calculate_hash
+from common.utils.image import EDGE_LONG, FORMAT_JPG, open_image, plan_renditions, save_renditions
+from product.models import ImageBlob
+
+logger = logging.getLogger(__name__)
+
+# Number of images downloaded at the same time.
+DEFAULT_IMAGE_POOL_SIZE = 4
+# Number of processes resizing images, one per core by default.
+DEFAULT_IMAGE_RENDER_POOL_SIZE = None
+# Crawler process runs many threads (reactor, pipeline, image downloads), forking it may deadlock
+# on a lock held by another thread, render processes are started by a fork server instead.
+RENDER_START_METHOD = 'forkserver'
+# Seconds to wait for an image download.
+DEFAULT_IMAGE_DOWNLOAD_TIMEOUT = 30
+# Downloaded images larger than this are spooled to a temp file instead of memory.
+DOWNLOAD_SPOOL_SIZE = 1024 * 1024
+
+
+class ProcessedImage:
+    """
+    Result of a processed image.
+    """
+
+    def __init__(self, product_id, original_url, unique_hash, renditions, perceptual_hash=None):
+        self.product_id = product_id
+        self.original_url = original_url
+        # Hex SHA-256 of downloaded image bytes.
+        self.unique_hash = unique_hash
+        # List of (length, format, (width, height), path relative to media root), see ImageBlob.make_path.
+        self.renditions = renditions
+        self.perceptual_hash = perceptual_hash
+
+    @property
+    def main_rendition(self):
+        """
+        The largest JPEG rendition.
+        """
+        return max((r for r in self.renditions if r[1] == FORMAT_JPG), key=lambda r: r[0])
+
+    @property
+    def paths(self):
+        return [path for _, _, _, path in self.renditions]
+
+
+class ImageProcessor:
+    """
+    Download and hash images in a thread pool, resize them in a process pool,
+    off the crawl and database write path.
+
+    Each image is stored as several renditions (lengths x formats, e.g. 160/320/640 in JPEG and WebP).
+    Images are stored by content (see ImageBlob), an image is only written once however many
+    products or urls it has, and an url being processed is not downloaded again for another product.
+    Workers do no database access, processed images are collected and taken by
+    the product repository on next flush (see take_processed).
+    """
+
+    def __init__(self, media_root, lengths, format_params, edge=EDGE_LONG, user_agent=None,
+                 pool_size=DEFAULT_IMAGE_POOL_SIZE, render_pool_size=DEFAULT_IMAGE_RENDER_POOL_SIZE,
+                 download_timeout=DEFAULT_IMAGE_DOWNLOAD_TIMEOUT, perceptual_hash=False):
+        """
+        :param media_root: directory to save resized images.
+        :param lengths: rendition lengths, e.g. OFFER_IMAGE_RENDITION_SIZES.
+        :param format_params: dict of format -> save params, must include JPEG,
+            e.g. {FORMAT_JPG: IMAGE_JPG_QUALITY_PARAMS, FORMAT_WEBP: IMAGE_WEBP_QUALITY_PARAMS}.
+        :param edge: lengths are of the long edge (EDGE_LONG) or the short edge (EDGE_SHORT).
+        :param perceptual_hash: calculate perceptual hash of images, so near duplicates can share a blob.
+        """
+        self.media_root = media_root
+        self.lengths = lengths
+        self.format_params = format_params
+        self.edge = edge
+        self.user_agent = user_agent
+        self.pool_size = pool_size
+        self.render_pool_size = render_pool_size
+        self.download_timeout = download_timeout
+        self.perceptual_hash = perceptual_hash
+        self._executor = None
+        self._render_pool = None
+        self._product_ids_by_url = {}   # url in processing -> ids of products waiting for it
+        self._processed = []
+        self._failed = []               # (product id, image url) of failed images
+        self._lock = threading.Lock()
+        # Notified when no image is in processing.
+        self._idle = threading.Condition(self._lock)
+
+    def start(self):
+        """
+        Start worker pools, e.g. when spider is opened, before any image is submitted.
+        """
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size)
+            # ProcessPoolExecutor only takes a start method (mp_context) since Python 3.7.
+            self._render_pool = multiprocessing.get_context(RENDER_START_METHOD).Pool(self.render_pool_size)
+
+    def submit(self, product_id, image_url):
+        """
+        Process an image in background.
+        :param product_id: id of the product which owns the image.
+        :param image_url: original image url.
+        """
+        with self._lock:
+            if self._executor is None:
+                raise RuntimeError('Image processor is not started.')
+            if image_url in self._product_ids_by_url:
+                self._product_ids_by_url[image_url].append(product_id)
+                return
+            self._product_ids_by_url[image_url] = [product_id]
+            future = self._executor.submit(self._process, image_url, self._render_pool)
+        future.add_done_callback(lambda f: self._on_done(image_url, f))
+
+    def take_processed(self):
+        """
+        :return: list of ProcessedImage finished since last call.
+        """
+        with self._lock:
+            processed, self._processed = self._processed, []
+        return processed
+
+    def take_failed(self):
+        """
+        :return: list of (product id, image url) failed since last call, e.g. download error.
+        """
+        with self._lock:
+            failed, self._failed = self._failed, []
+        return failed
+
+    def wait(self):
+        """
+        Wait for all submitted images.
+        """
+        with self._idle:
+            while self._product_ids_by_url:
+                self._idle.wait()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            render_pool, self._render_pool = self._render_pool, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+            render_pool.close()
+            render_pool.join()
+
+    def remove_files(self, paths):
+        """
+        Remove image files which are not referenced, e.g. renditions of a near duplicate of an existing blob.
+        """
+        for path in paths:
+            try:
+                os.remove(os.path.join(self.media_root, path))
+            except FileNotFoundError:
+                pass
+
+    def _on_done(self, image_url, future):
+        with self._lock:
+            product_ids = self._product_ids_by_url.pop(image_url, [])
+            result = None if future.cancelled() or future.exception() is not None else future.result()
+            if result is not None:
+                unique_hash, renditions, perceptual_hash = result
+                self._processed.extend(
+                    ProcessedImage(product_id, image_url, unique_hash, renditions, perceptual_hash)
+                    for product_id in product_ids)
+            else:
+                self._failed.extend((product_id, image_url) for product_id in product_ids)
+            if not self._product_ids_by_url:
+                self._idle.notify_all()
+
+    def _process(self, image_url, render_pool):
+        try:
+            with self._download(image_url) as data:
+                unique_hash = calculate_hash(data)
+                with open_image(data) as image:
+                    # Only the header is read to get the size.
+                    size = image.size
+                renditions = []
+                targets = {}
+                for length, fmt, new_size in plan_renditions(size, self.lengths, self.edge, list(self.format_params)):
+                    path = ImageBlob.make_path(unique_hash, fmt, length)
+                    renditions.append((length, fmt, new_size, path))
+                    file_path = os.path.join(self.media_root, path)
+                    if not os.path.exists(file_path):
+                        # Same image of other products or urls is only resized once.
+                        targets[(length, fmt)] = file_path
+                perceptual_hash = None
+                if targets or self.perceptual_hash:
+                    data.seek(0)
+                    perceptual_hash = render_pool.apply(
+                        save_renditions, (data.read(), targets, self.edge, self.format_params, self.perceptual_hash))
+                return unique_hash, renditions, perceptual_hash
+        except Exception:
+            logger.warning('Failed to process image %s', image_url, exc_info=True)
+            return None
+
+    def _download(self, url):
+        """
+        :return: spooled temp file of image content.
+        """
+        headers = {'User-Agent': self.user_agent} if self.user_agent else {}
+        request = urllib.request.Request(url, headers=headers)
+        data = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE)
+        try:
+            with urllib.request.urlopen(request, timeout=self.download_timeout) as response:
+                shutil.copyfileobj(response, data)
+        except Exception:
+            data.close()
+            raise
+        data.seek(0)
+        return data
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+# Duplicate request filter which ignores volatile query params.
+# See: https://doc.scrapy.org/en/latest/topics/settings.html#dupefilter-class
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import request_fingerprint
+from w3lib.url import url_query_cleaner
+
+
+def canonical_request_fingerprint(request, ignore_query_params=None):
+    """
+    Fingerprint of a request without the given query params, e.g. a random jsonp callback name.
+    """
+    if ignore_query_params:
+        request = request.replace(url=url_query_cleaner(request.url, ignore_query_params, remove=True))
+    return request_fingerprint(request)
+
+
+class CanonicalUrlDupeFilter(RFPDupeFilter):
+    """
+    Filter requests by fingerprint without query params listed in DUPEFILTER_IGNORE_QUERY_PARAMS,
+    so the same data requested with a new random param is still a duplicate, e.g. when a crawl resumes from JOBDIR.
+    """
+
+    def __init__(self, path=None, debug=False, ignore_query_params=None):
+        super().__init__(path, debug)
+        self.ignore_query_params = ignore_query_params or []
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(job_dir(settings), settings.getbool('DUPEFILTER_DEBUG'),
+                   settings.getlist('DUPEFILTER_IGNORE_QUERY_PARAMS'))
+
+    def request_fingerprint(self, request):
+        return canonical_request_fingerprint(request, self.ignore_query_params)
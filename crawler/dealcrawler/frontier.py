@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# Scrapy scheduler backed by the shared crawl frontier, so a crawl can be split across many crawler workers.
+# See: https://doc.scrapy.org/en/latest/topics/settings.html#scheduler
+
+import logging
+import time
+from datetime import datetime
+
+from django.core.exceptions import ObjectDoesNotExist
+from scrapy import signals
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.reqser import request_from_dict, request_to_dict
+
+from source.models import CrawlHost, CrawlRequest
+from .dupefilter import canonical_request_fingerprint
+from .squeues import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Request meta key of frontier request id.
+FRONTIER_ID_META = 'frontier_id'
+# Seconds between checks whether the crawl is finished.
+PENDING_CHECK_INTERVAL = 1.0
+# Min seconds to wait before polling the frontier again, scrapy only polls every 5 seconds otherwise.
+MIN_POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 5.0
+
+
+class FrontierScheduler:
+    """
+    Schedule requests through the shared crawl frontier (source.models.CrawlRequest) instead of memory.
+
+    Run the same spider with the same FRONTIER_CRAWL on many workers, they pull requests of the crawl
+    from the same database and write items through the same repositories:
+        scrapy crawl lasoo.co.nz -s FRONTIER_CRAWL=lasoo-2018-03-01
+    FRONTIER_CRAWL is the spider name and today's date (UTC) by default.
+
+    Requests are deduplicated by fingerprint across the crawl, including dont_filter requests (e.g. start urls
+    of every worker), except retries of a request. Query params in DUPEFILTER_IGNORE_QUERY_PARAMS are ignored.
+    Requests of a host are FRONTIER_HOST_DELAY seconds apart across all workers, AdaptiveThrottle still
+    throttles each worker.
+    A request is done once its response is received, a request claimed but not done in FRONTIER_CLAIM_TIMEOUT
+    seconds (worker died or download failed) is put back to the queue, up to FRONTIER_MAX_ATTEMPTS times.
+    A worker keeps running until all requests of the crawl are done, as others may still add requests.
+    Note: request meta is pickled, so it must be picklable, model instances are stored by primary key
+    (see dealcrawler.squeues).
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.crawl = settings.get('FRONTIER_CRAWL')
+        self.database = settings.get('FRONTIER_DATABASE', 'default')
+        self.host_delay = settings.getfloat('FRONTIER_HOST_DELAY', 0.0)
+        self.claim_timeout = settings.getfloat('FRONTIER_CLAIM_TIMEOUT', 600.0)
+        self.max_attempts = settings.getint('FRONTIER_MAX_ATTEMPTS', 3)
+        self.ignore_query_params = settings.getlist('DUPEFILTER_IGNORE_QUERY_PARAMS')
+        self.requests = CrawlRequest.objects.db_manager(self.database)
+        self.spider = None
+        self._known_hosts = set()
+        self._done_ids = set()          # requests received since last flush
+        self._last_release_time = 0
+        self._pending = (0, True)       # (time checked, has unfinished requests)
+        crawler.signals.connect(self._response_received, signal=signals.response_received)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open(self, spider):
+        self.spider = spider
+        if not self.crawl:
+            self.crawl = '{0}:{1}'.format(spider.name, datetime.utcnow().strftime('%Y-%m-%d'))
+        logger.info('Crawl frontier: %s', self.crawl)
+
+    def close(self, reason):
+        self._flush_done()
+
+    def has_pending_requests(self):
+        now = time.monotonic()
+        checked_time, pending = self._pending
+        if now - checked_time >= PENDING_CHECK_INTERVAL:
+            pending = self.requests.has_unfinished(self.crawl)
+            self._pending = (now, pending)
+        return pending
+
+    def enqueue_request(self, request):
+        parent_id = request.meta.pop(FRONTIER_ID_META, None)
+        fingerprint = canonical_request_fingerprint(request, self.ignore_query_params)
+        data = dumps(request_to_dict(request, self.spider))
+        if parent_id is not None and parent_id not in self._done_ids:
+            # No response of parent was received, the request is a retry or a redirect.
+            if self.requests.requeue(parent_id, fingerprint, request.priority, data):
+                self._on_enqueued()
+                return True
+            self._done_ids.add(parent_id)
+        host = urlparse_cached(request).hostname or ''
+        if host not in self._known_hosts:
+            CrawlHost.ensure(self.crawl, host, using=self.database)
+            self._known_hosts.add(host)
+        if not self.requests.add(self.crawl, fingerprint, host, request.priority, data):
+            self.stats.inc_value('frontier/filtered', spider=self.spider)
+            return False
+        self._on_enqueued()
+        return True
+
+    def next_request(self):
+        self._flush_done()
+        self._release_expired()
+        db_request, wait = self.requests.claim(self.crawl, self.host_delay)
+        if db_request is None:
+            if wait is not None:
+                self._poll_later(wait)
+            return None
+        try:
+            request = request_from_dict(loads(bytes(db_request.data)), self.spider)
+        except ObjectDoesNotExist:
+            logger.warning('Dropped request %d, its meta refers to a deleted model instance.', db_request.pk)
+            self._done_ids.add(db_request.pk)
+            return None
+        request.meta[FRONTIER_ID_META] = db_request.pk
+        self.stats.inc_value('scheduler/dequeued', spider=self.spider)
+        self.stats.inc_value('scheduler/dequeued/frontier', spider=self.spider)
+        return request
+
+    def __len__(self):
+        return self.requests.filter(crawl=self.crawl, state=CrawlRequest.STATE_PENDING).count()
+
+    def _on_enqueued(self):
+        self._pending = (time.monotonic(), True)
+        self.stats.inc_value('scheduler/enqueued', spider=self.spider)
+        self.stats.inc_value('scheduler/enqueued/frontier', spider=self.spider)
+
+    def _response_received(self, response, request, spider):
+        request_id = request.meta.get(FRONTIER_ID_META)
+        if request_id is not None:
+            self._done_ids.add(request_id)
+
+    def _flush_done(self):
+        if self._done_ids:
+            self.requests.finish(list(self._done_ids))
+            self._done_ids.clear()
+
+    def _release_expired(self):
+        now = time.monotonic()
+        if now - self._last_release_time < self.claim_timeout / 4:
+            return
+        self._last_release_time = now
+        released = self.requests.release_expired(self.crawl, self.claim_timeout, self.max_attempts)
+        if released:
+            logger.info('Put %d expired requests back to crawl frontier %s', released, self.crawl)
+
+    def _poll_later(self, wait):
+        # Hosts are due before scrapy engine polls again.
+        slot = getattr(self.crawler.engine, 'slot', None)
+        if slot is not None and wait < MAX_POLL_INTERVAL:
+            slot.nextcall.schedule(max(wait, MIN_POLL_INTERVAL))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+# HTTP cache storage and policy for Scrapy HttpCacheMiddleware.
+# See: https://doc.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
+
+import hashlib
+import os
+
+from scrapy.extensions.httpcache import FilesystemCacheStorage, RFC2616Policy
+from w3lib.url import canonicalize_url, url_query_cleaner
+
+
+class CanonicalUrlCacheStorage(FilesystemCacheStorage):
+    """
+    Filesystem cache storage keyed by canonical request url.
+
+    Query params listed in HTTPCACHE_IGNORE_QUERY_PARAMS are removed from the cache key,
+    e.g. a random jsonp callback name makes no two requests of the same data equal.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.ignore_query_params = settings.getlist('HTTPCACHE_IGNORE_QUERY_PARAMS')
+
+    def _get_request_path(self, spider, request):
+        key = self.get_cache_key(request)
+        return os.path.join(self.cachedir, spider.name, key[0:2], key)
+
+    def get_cache_key(self, request):
+        url = request.url
+        if self.ignore_query_params:
+            url = url_query_cleaner(url, self.ignore_query_params, remove=True)
+        key = hashlib.sha1()
+        key.update(request.method.encode('ascii'))
+        key.update(canonicalize_url(url).encode('utf-8'))
+        key.update(request.body or b'')
+        return key.hexdigest()
+
+
+class RevalidatingCachePolicy(RFC2616Policy):
+    """
+    Cache every successful response and revalidate it on each request.
+
+    Cached responses are never used without asking the server, a conditional request with
+    If-None-Match / If-Modified-Since is sent instead, and the cached response is used if the server
+    answers 304 Not Modified. Servers which mark responses no-cache or give no freshness can still
+    save the transfer of unchanged content.
+    """
+
+    def should_cache_response(self, response, request):
+        return response.status == 200
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        self._set_conditional_validators(request, cachedresponse)
+        return False
@@ -5,6 +5,7 @@
 # See documentation in:
 # http://doc.scrapy.org/en/latest/topics/items.html
 
+import scrapy
 from scrapy_djangoitem import DjangoItem
 
 from product.models import Product, ProductProperty
@@ -16,12 +17,29 @@ from region.models import Region
 
 class ProductItem(DjangoItem):
     django_model = Product
+    # Fields below are not product model fields, they are used by DealSpider.persist_item.
+    # Retailer name, used to get or create retailer on persistence if retailer is not set.
+    retailer_name = scrapy.Field()
+    image_url = scrapy.Field()
+    # Stores which provide this product, each store is a dict parsed by spider.
+    stores = scrapy.Field()
+    # List of ProductProperty
+    properties = scrapy.Field()
 
 
 class ProductPropertyItem(DjangoItem):
     django_model = ProductProperty
 
 
+class ProductPropertyMergeItem(scrapy.Item):
+    """
+    Values to merge into a comma separated property of a stored product, see ProductRepository.merge_prod_property.
+    """
+    landing_page = scrapy.Field()
+    name = scrapy.Field()
+    values = scrapy.Field()
+
+
 class StoreItem(DjangoItem):
     django_model = Store
 
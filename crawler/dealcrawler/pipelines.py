@@ -5,7 +5,63 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://doc.scrapy.org/en/latest/topics/item-pipeline.html
 
+from django.db import connection
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+
 
 class SupermaketCrawlerPipeline(object):
     def process_item(self, item, spider):
         return item
+
+
+class DealPersistencePipeline(object):
+    """
+    Persist items of deal spiders (see DealSpider.persist_item) off the reactor thread.
+
+    Items are written by a bounded thread pool, and at most PERSISTENCE_MAX_PENDING_ITEMS items
+    are in flight. process_item returns a deferred which fires after the item is written, Scrapy
+    keeps the response of a pending item in scraper slot and stops scheduling new downloads when
+    the slot is full, so slow database writes apply backpressure on crawling.
+    """
+
+    def __init__(self, pool_size, max_pending_items):
+        self.pool_size = pool_size
+        self.pending_items = defer.DeferredSemaphore(max_pending_items)
+        self.threadpool = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(settings.getint('PERSISTENCE_POOL_SIZE', 1),
+                   settings.getint('PERSISTENCE_MAX_PENDING_ITEMS', 100))
+
+    def open_spider(self, spider):
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=self.pool_size, name='persistence')
+        self.threadpool.start()
+
+    def close_spider(self, spider):
+        d = threads.deferToThreadPool(reactor, self.threadpool, self._close_spider_in_thread, spider)
+        d.addBoth(self._stop_threadpool)
+        return d
+
+    def process_item(self, item, spider):
+        if not hasattr(spider, 'persist_item'):
+            return item
+        d = self.pending_items.run(
+            threads.deferToThreadPool, reactor, self.threadpool, spider.persist_item, item)
+        d.addCallback(lambda _: item)
+        return d
+
+    @staticmethod
+    def _close_spider_in_thread(spider):
+        try:
+            if hasattr(spider, 'flush_pending_writes'):
+                spider.flush_pending_writes()
+        finally:
+            # Django opens one connection per thread.
+            connection.close()
+
+    def _stop_threadpool(self, result):
+        self.threadpool.stop()
+        return result
@@ -38,7 +38,8 @@ ROBOTSTXT_OBEY = True
 # Configure a delay for requests for the same website (default: 0)
 # See https://doc.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
-DOWNLOAD_DELAY = 3
+# Delay is adjusted per site by dealcrawler.throttle.AdaptiveThrottle, see ADAPTIVE_THROTTLE_* settings.
+# DOWNLOAD_DELAY = 3
 # The download delay setting will honor only one of:
 # CONCURRENT_REQUESTS_PER_DOMAIN = 16
 # CONCURRENT_REQUESTS_PER_IP = 16
@@ -69,19 +70,24 @@ DOWNLOAD_DELAY = 3
 
 # Enable or disable extensions
 # See https://doc.scrapy.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    'scrapy.extensions.telnet.TelnetConsole': None,
-# }
+EXTENSIONS = {
+   'dealcrawler.throttle.AdaptiveThrottle': 0,
+}
 
 # Configure item pipelines
 # See https://doc.scrapy.org/en/latest/topics/item-pipeline.html
-# ITEM_PIPELINES = {
-#    'dealcrawler.pipelines.DealCrawlerPipeline': 300,
-#}
+ITEM_PIPELINES = {
+   'dealcrawler.pipelines.DealPersistencePipeline': 300,
+}
+# Threads to write items to database, see DealPersistencePipeline.
+# Keep it 1 unless repositories are safe for concurrent creation of same retailer or store.
+PERSISTENCE_POOL_SIZE = 1
+# Max items waiting to be written before crawling is paused.
+PERSISTENCE_MAX_PENDING_ITEMS = 100
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://doc.scrapy.org/en/latest/topics/autothrottle.html
-AUTOTHROTTLE_ENABLED = True
+# AUTOTHROTTLE_ENABLED = True
 # The initial download delay
 # AUTOTHROTTLE_START_DELAY = 5
 # The maximum download delay to be set in case of high latencies
@@ -92,6 +98,43 @@ AUTOTHROTTLE_ENABLED = True
 # Enable showing throttling stats for every response received:
 # AUTOTHROTTLE_DEBUG = False
 
+# Adaptive per-site throttling, it replaces AutoThrottle, see dealcrawler.throttle.AdaptiveThrottle.
+ADAPTIVE_THROTTLE_ENABLED = True
+# Delay of a site before its first response.
+ADAPTIVE_THROTTLE_START_DELAY = 1.0
+# Delay never goes below this (or robots.txt Crawl-delay), nor above max.
+ADAPTIVE_THROTTLE_MIN_DELAY = 0.0
+ADAPTIVE_THROTTLE_MAX_DELAY = 60.0
+# Concurrent requests of a site once its delay is 0.
+ADAPTIVE_THROTTLE_MIN_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 8
+# A site is slowed down when its average latency (seconds) is above this.
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 2.0
+# A site isn't sped up when the 429/5xx rate of its recent responses is above this.
+ADAPTIVE_THROTTLE_MAX_ERROR_RATE = 0.1
+# Number of recent responses of the error rate.
+ADAPTIVE_THROTTLE_WINDOW = 20
+# Log every adjustment.
+ADAPTIVE_THROTTLE_DEBUG = False
+
+# Crawl jobs, run a spider with -s JOBDIR=<dir> to stop and resume it (see https://doc.scrapy.org/en/latest/topics/jobs.html).
+# Model instances in request meta are stored by primary key on disk.
+SCHEDULER_DISK_QUEUE = 'dealcrawler.squeues.ModelRefPickleLifoDiskQueue'
+
+# Shared crawl frontier, uncomment SCHEDULER to split a crawl across many workers (see dealcrawler.frontier).
+# Run the same spider with the same FRONTIER_CRAWL on each worker, e.g. -s FRONTIER_CRAWL=lasoo-2018-03-01
+# SCHEDULER = 'dealcrawler.frontier.FrontierScheduler'
+# Crawl name, spider name and today's date by default.
+# FRONTIER_CRAWL = None
+# Django database alias of the frontier.
+FRONTIER_DATABASE = 'default'
+# Min seconds between two requests of a host across all workers.
+FRONTIER_HOST_DELAY = 0.0
+# Seconds a worker can hold a request before it is given to another worker.
+FRONTIER_CLAIM_TIMEOUT = 600
+# Max times a request is given to workers.
+FRONTIER_MAX_ATTEMPTS = 3
+
 # Enable and configure HTTP caching (disabled by default)
 # See https://doc.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
 # HTTPCACHE_ENABLED = True
@@ -101,6 +144,22 @@ AUTOTHROTTLE_ENABLED = True
 # HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
 
 
+# Buffered product writes, see ProductRepository.
+# Pending products are written in batch when there are PRODUCT_WRITE_BATCH_SIZE pending products
+# or PRODUCT_WRITE_FLUSH_INTERVAL seconds passed since last write, and when spider closed.
+PRODUCT_WRITE_BATCH_SIZE = 200
+PRODUCT_WRITE_FLUSH_INTERVAL = 30
+
+# Offer images are downloaded and resized by a worker pool, see dealcrawler.common.image.
+IMAGE_POOL_SIZE = 4
+# Images are resized by a process pool, 0 to use one process per core.
+IMAGE_RENDER_POOL_SIZE = 0
+# Seconds to wait for an image download.
+IMAGE_DOWNLOAD_TIMEOUT = 30
+# Store near duplicate images (resized or re-encoded copies) once, by perceptual hash.
+IMAGE_PERCEPTUAL_HASH = False
+
+
 # Add django project path and settings to reuse django model
 SUPERSAVER_SERVER_PROJECT_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'supersaver')
 sys.path.append(SUPERSAVER_SERVER_PROJECT_ROOT)
@@ -3,11 +3,16 @@ import traceback
 from datetime import datetime
 
 import scrapy
+from django.conf import settings as django_settings
+from scrapy import signals
 
 from country.models import Country
-from product.models import Product
+from product.models import ActiveOffer, Product
 from region.models import Region
 from source.models import DataSource
+from common.utils.image import FORMAT_JPG, FORMAT_WEBP
+from dealcrawler.common.image import ImageProcessor
+from dealcrawler.model.items import ProductPropertyMergeItem
 from .data.product_repository import ProductRepository
 from .data.retailer_repository import RetailerRepository
 
@@ -94,22 +99,86 @@ class DealSpider (BaseSpider):
         regions = Region.objects.filter(country=self.country, active=True)
         self.region_by_name = {r.name: r for r in regions}
 
+        # Expired offers are deactivated by expire_offers command, not on spider start.
         now = int(datetime.utcnow().timestamp())
-
-        Product.objects.filter(
-            retailer__datasource=self.datasource,
-            promotion_end_date__lte=now
-        ).update(active=False)
-
         products = Product.objects.filter(
             retailer__datasource=self.datasource,
             promotion_end_date__gt=now)
-        self.prod_repo = ProductRepository(products)
+        image_processor = ImageProcessor(django_settings.MEDIA_ROOT,
+                                         django_settings.OFFER_IMAGE_RENDITION_SIZES,
+                                         {FORMAT_JPG: django_settings.IMAGE_JPG_QUALITY_PARAMS,
+                                          FORMAT_WEBP: django_settings.IMAGE_WEBP_QUALITY_PARAMS},
+                                         user_agent=self.user_agent)
+        self.prod_repo = ProductRepository(products, image_processor=image_processor)
 
         self.retailer_repo = RetailerRepository(self.datasource, self.country)
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+        spider.prod_repo.write_batch_size = settings.getint(
+            'PRODUCT_WRITE_BATCH_SIZE', spider.prod_repo.write_batch_size)
+        spider.prod_repo.write_flush_interval = settings.getfloat(
+            'PRODUCT_WRITE_FLUSH_INTERVAL', spider.prod_repo.write_flush_interval)
+        image_processor = spider.prod_repo.image_processor
+        image_processor.pool_size = settings.getint('IMAGE_POOL_SIZE', image_processor.pool_size)
+        image_processor.render_pool_size = settings.getint('IMAGE_RENDER_POOL_SIZE') or None
+        image_processor.download_timeout = settings.getfloat(
+            'IMAGE_DOWNLOAD_TIMEOUT', image_processor.download_timeout)
+        image_processor.perceptual_hash = settings.getbool('IMAGE_PERCEPTUAL_HASH', image_processor.perceptual_hash)
+        crawler.signals.connect(spider._start_image_processor, signal=signals.spider_opened)
+        return spider
+
+    def _start_image_processor(self, spider):
+        # Started on reactor thread before any item is persisted, after pool sizes are set.
+        self.prod_repo.image_processor.start()
+
+    def closed(self, reason):
+        # Write buffered products, then publish crawled offers to the active offer view,
+        # the refresh drops the offer responses cached by web workers.
+        self.flush_pending_writes()
+        self.prod_repo.image_processor.shutdown()
+        ActiveOffer.refresh()
+
+    def persist_item(self, prod_item):
+        """
+        Persist a ProductItem (or ProductPropertyMergeItem) yielded by spider callbacks.
+
+        Notes: This is called by DealPersistencePipeline in a worker thread, not on reactor thread.
+        All blocking database access for an item (retailer, stores, product) should happen here.
+        :param prod_item: ProductItem with image_url, stores and properties.
+        :return: a django product instance.
+        """
+        if isinstance(prod_item, ProductPropertyMergeItem):
+            self.prod_repo.merge_prod_property(prod_item['landing_page'], prod_item['name'], prod_item['values'])
+            return None
+        if prod_item.get('retailer') is None:
+            prod_item['retailer'] = self._get_or_create_retailer_in_db(prod_item['retailer_name'])
+        stores = self._get_or_create_stores_in_db(prod_item)
+        return self._create_or_update_prod_in_db(
+            prod_item, prod_item.get('image_url'), stores, prod_item.get('properties'))
+
+    def flush_pending_writes(self):
+        self.prod_repo.flush(wait_images=True)
+
+    def _get_or_create_stores_in_db(self, prod_item):
+        """
+        Convert the store dicts parsed by spider to django store instances.
+        Subclass should override this method if its products have stores.
+        :param prod_item: ProductItem.
+        :return: list of stores.
+        """
+        return []
+
+    def _get_or_create_retailer_in_db(self, retailer_name):
+        retailer = self.retailer_repo.get_retailer_by_name(retailer_name)
+        if retailer is None:
+            retailer = self._create_or_update_retailer_in_db(retailer_name)
+        return retailer
+
     def _create_or_update_prod_in_db(self, prod_item, prod_image_url, stores, properties=None):
-        self.prod_repo.add_or_update_prod_in_db(prod_item, prod_image_url, stores, properties)
+        return self.prod_repo.add_or_update_prod_in_db(prod_item, prod_image_url, stores, properties)
 
     def _create_or_update_retailer_in_db(self, retailer_name, website=None, logo_url=None, properties=None):
-        self.retailer_repo.add_or_update_retailer_in_db(retailer_name, website, logo_url, properties)
+        return self.retailer_repo.add_or_update_retailer_in_db(retailer_name, website, logo_url, properties)
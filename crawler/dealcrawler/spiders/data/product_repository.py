@@ -1,20 +1,102 @@
 # -*- coding: utf-8 -*-
 
-from datetime import datetime
+import hashlib
+import logging
+import struct
+import time
+from decimal import Decimal
+from uuid import UUID
+
+from django.db import transaction
+
+from common.utils.lru import LRUCache
+from dealcrawler.common.bulk import bulk_update
+from dealcrawler.common.diff import sync_m2m, sync_properties
 from dealcrawler.common.repository import Repository
 from dealcrawler.util import *
+from product.models import ImageBlob, ImageRendition, Product, ProductImage, ProductProperty
 from supersaver.settings import STATIC_URL
 
+logger = logging.getLogger(__name__)
+
+# Flush pending writes when there are this many pending products.
+DEFAULT_WRITE_BATCH_SIZE = 200
+# Flush pending writes when the oldest pending write is older than this (seconds).
+DEFAULT_WRITE_FLUSH_INTERVAL = 30
+# Max number of full product instances kept in memory.
+DEFAULT_HYDRATED_CACHE_SIZE = 1000
+# Max number of products fetched in one query when hydrating.
+HYDRATE_BATCH_SIZE = 500
+# Separator of values in a merged property, see merge_prod_property.
+PROPERTY_VALUE_SEPARATOR = ','
+
+PRODUCT_UPDATE_FIELDS = (
+    'title', 'description', 'price', 'unit', 'saved',
+    'promotion_start_date', 'promotion_end_date',
+    'landing_page', 'fast_buy_link', 'ready', 'active', 'content_hash', 'updated_time',
+)
+# Repository index value: product id (16 bytes), content hash (8 bytes), listing (price in cents and
+# promotion end date of an active product, 0 if inactive).
+_PRODUCT_ID_SIZE = 16
+_CONTENT_HASH_SIZE = 8
+_INDEX_LISTING = struct.Struct('>qQ')
+_NO_PRICE = -1
+
 
 class ProductRepository (Repository):
+    """
+    Product repository with a buffered writer.
+
+    Only a compact landing_page -> (product id, content hash, price, end date) index is preloaded, full product
+    instances are fetched on demand in batches (see get_items) and a limited number of them are kept in an LRU.
+    Updating a known product needs no product row, the new values come from the crawled item.
+    A crawled product with the same content hash as the stored one is not written at all.
 
-    def __init__(self, products):
-        super().__init__(products, lambda p: p.landing_page)
+    Products, images, properties and product stores are collected in memory
+    and written to database in batches (see flush()).
+    New images are processed by image processor in background, a product becomes ready
+    when its image is processed, it is written on a later flush.
+    Product primary key is generated on client side (uuid4), so a product instance
+    can be referenced before it is written.
+    """
+
+    def __init__(self, products,
+                 write_batch_size=DEFAULT_WRITE_BATCH_SIZE,
+                 write_flush_interval=DEFAULT_WRITE_FLUSH_INTERVAL,
+                 hydrated_cache_size=DEFAULT_HYDRATED_CACHE_SIZE,
+                 image_processor=None):
+        """
+        :param products: product QuerySet of the products to index.
+        :param image_processor: ImageProcessor of new images, images are not processed if it is None.
+        """
+        super().__init__([], lambda p: p.landing_page)
+        # landing page -> product id, content hash and listing (see _index_value), a few dozen bytes per product.
+        # A product not ready (its image failed) is indexed without content hash, so it is written again
+        # and its image is processed again when it is crawled.
+        self._index = {landing_page: self.__class__._index_value(prod_id, content_hash if ready else None,
+                                                                 price, end_date, active)
+                       for landing_page, prod_id, content_hash, ready, price, end_date, active
+                       in products.values_list('landing_page', 'id', 'content_hash', 'ready',
+                                               'price', 'promotion_end_date', 'active').iterator()}
+        self._hydrated = LRUCache(hydrated_cache_size)
+        self.write_batch_size = write_batch_size
+        self.write_flush_interval = write_flush_interval
+        self.last_flush_time = time.time()
+        self.image_processor = image_processor
+        self._processing_images = {}    # (product pk, image url) submitted to image processor -> landing page
+        # Pending writes
+        self._new_prods = {}        # product pk -> product
+        self._updated_prods = {}    # product pk -> product
+        self._images = {}           # (product pk, image url) -> product
+        self._props = {}            # (product pk, property name) -> property
+        self._stores = {}           # (product pk, store pk) -> store
+        self._merged_props = {}     # (product pk, property name) -> set of values to merge
 
     def add_or_update_prod_in_db(self, prod_item, prod_image_url, stores=None, properties=None):
         """
         Create or update product (or deal) in database and update repository memory store.
 
+        Notes: The changes are buffered, they are written to database in next flush.
         :param prod_item: a ProductItem for django.
 
         It includes fields:
@@ -25,83 +107,354 @@ class ProductRepository (Repository):
         :param properties: additional properties of this product.
         :return: a django product instance.
         """
-        db_prod = self.get_item(prod_item['landing_page'])
-        if db_prod is None:
-            db_prod = prod_item.save()
-        else:
-            db_prod.title = prod_item['title']
-            db_prod.description = empty_str_if_not_in(prod_item, 'description')
-            db_prod.price = prod_item['price']
-            db_prod.unit = empty_str_if_not_in(prod_item, 'unit')
-            db_prod.saved = none_if_not_in(prod_item, 'saved')
-            db_prod.promotion_start_date = prod_item['promotion_start_date']
-            db_prod.promotion_end_date = prod_item['promotion_end_date']
-            db_prod.landing_page = prod_item['landing_page']
-            db_prod.fast_buy_link = none_if_not_in(prod_item, 'fast_buy_link')
-            db_prod.active = True
-            db_prod.save()
-            # Not safe
-            prod_item._instance = db_prod
-        self.add_or_update_item(db_prod)
-
-        # Update product images
-        if prod_image_url and not db_prod.product_images.filter(original_url=prod_image_url).exists():
-            # TODO: Hash
-            unique_hash = str(datetime.utcnow().timestamp())
-            self.__class__._save_product_image(db_prod, prod_image_url)
-            db_prod.product_images.create(unique_hash=unique_hash,
-                                          original_url=prod_image_url)
-        if stores:
-            self.__class__._update_prod_stores_in_db(db_prod, stores)
-        if properties:
-            self.__class__._update_prod_props_in_db(db_prod, properties)
+        with self.item_access_lock:
+            index_value = self._index.get(prod_item['landing_page'])
+            db_prod = prod_item.save(commit=False)
+            db_prod.content_hash = self.__class__.calculate_content_hash(db_prod, prod_image_url, stores, properties)
+            # Product with image is ready after its image is processed, see flush.
+            db_prod.ready = not prod_image_url
+            if index_value is None:
+                self._new_prods[db_prod.pk] = db_prod
+            else:
+                # Known product, all updated fields are in the item, no need to load it.
+                db_prod.id = UUID(bytes=index_value[:_PRODUCT_ID_SIZE])
+                if index_value[_PRODUCT_ID_SIZE:_PRODUCT_ID_SIZE + _CONTENT_HASH_SIZE] \
+                        == bytes.fromhex(db_prod.content_hash) \
+                        and self.__class__._is_indexed_active(index_value) \
+                        and db_prod.pk not in self._new_prods:
+                    # Unchanged since last crawl, an inactive product is updated to be active again.
+                    db_prod._state.adding = False
+                    self._hydrated.set(db_prod.landing_page, db_prod)
+                    return db_prod
+                db_prod.active = True
+                if db_prod.pk in self._new_prods:
+                    self._new_prods[db_prod.pk] = db_prod
+                else:
+                    db_prod._state.adding = False
+                    self._updated_prods[db_prod.pk] = db_prod
+            self.add_or_update_item(db_prod)
+
+            if prod_image_url:
+                self._images[(db_prod.pk, prod_image_url)] = db_prod
+            if stores:
+                self._add_prod_stores(db_prod, stores)
+            if properties:
+                for prop in properties:
+                    prop.product = db_prod
+                    self._props[(db_prod.pk, prop.name)] = prop
+            self._flush_if_needed()
         return db_prod
 
+    def merge_prod_property(self, landing_page, name, values):
+        """
+        Merge values into a comma separated property of a known product, without the product item,
+        e.g. regions of a deal which is not crawled again as it is unchanged.
+
+        Notes: The changes are buffered, they are written to database in next flush.
+        :param landing_page: landing page of product, values of an unknown product are ignored.
+        :param name: property name.
+        :param values: property values.
+        :return: True if product is known.
+        """
+        with self.item_access_lock:
+            index_value = self._index.get(landing_page)
+            if index_value is None:
+                return False
+            prod_id = UUID(bytes=index_value[:_PRODUCT_ID_SIZE])
+            self._merged_props.setdefault((prod_id, name), set()).update(values)
+            return True
+
+    def add_or_update_item(self, item):
+        with self.item_access_lock:
+            self._index[item.landing_page] = self.__class__._index_value(
+                item.pk, item.content_hash, item.price, item.promotion_end_date, item.active)
+            self._hydrated.set(item.landing_page, item)
+
     @staticmethod
-    def _update_prod_stores_in_db(db_prod, stores):
-        if not stores:
-            return
-        ex_stores = list(db_prod.stores.all())
+    def calculate_content_hash(prod, image_url=None, stores=None, properties=None):
+        """
+        Calculate a stable fingerprint of crawled product content.
+        It covers the product fields which are updated by crawlers, image url, stores and properties,
+        so an unchanged fingerprint means nothing needs to be written.
+        :param prod: product instance.
+        :return: hex string of 8 bytes hash.
+        """
+        values = [
+            prod.title, prod.description, ProductRepository._normalize_price(prod.price), prod.unit, prod.saved,
+            prod.promotion_start_date, prod.promotion_end_date, prod.fast_buy_link, image_url,
+        ]
+        if stores:
+            values.extend(sorted(str(store.pk) for store in stores))
+        if properties:
+            values.extend(sorted('{0}={1}'.format(p.name, p.value) for p in properties))
+        content = '\x1f'.join('' if v is None else str(v) for v in values)
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+    def find_unchanged(self, listed_prices, now):
+        """
+        Find listed products which are known, active and have the same price as listed,
+        e.g. to skip their detail pages in an incremental crawl.
+
+        Notes: It is answered from the in-memory index without lock, it doesn't wait for database
+        or a flush in progress, so it can be called on reactor thread.
+        :param listed_prices: dict of landing page -> price in product listing.
+        :param now: timestamp, products end before it are not unchanged.
+        :return: set of landing pages.
+        """
+        unchanged = set()
+        for landing_page, price in listed_prices.items():
+            # A dict lookup is atomic, the index may be updated by pipeline thread meanwhile.
+            index_value = self._index.get(landing_page)
+            if index_value is None:
+                continue
+            indexed_price, end_date = _INDEX_LISTING.unpack_from(index_value, _PRODUCT_ID_SIZE + _CONTENT_HASH_SIZE)
+            if end_date > now and indexed_price == self.__class__._price_in_cents(price):
+                unchanged.add(landing_page)
+        return unchanged
+
+    def get_item(self, key):
+        """
+        Get product by landing page, it is loaded from database if it is not in memory.
+        :param key: landing page.
+        :return: product if found, otherwise None.
+        """
+        return self.get_items([key]).get(key)
+
+    def get_items(self, keys):
+        """
+        Get products by landing pages, products not in memory are loaded with batched queries.
+        :param keys: landing pages.
+        :return: dict of landing page -> product, unknown landing pages are not included.
+        """
+        with self.item_access_lock:
+            found, missing = {}, {}
+            for key in keys:
+                prod = self._hydrated.get(key)
+                if prod is not None:
+                    found[key] = prod
+                elif key in self._index:
+                    prod_id = UUID(bytes=self._index[key][:_PRODUCT_ID_SIZE])
+                    prod = self._new_prods.get(prod_id) or self._updated_prods.get(prod_id)
+                    if prod is not None:
+                        found[key] = prod
+                    else:
+                        missing[prod_id] = key
+            missing_ids = list(missing)
+            for i in range(0, len(missing_ids), HYDRATE_BATCH_SIZE):
+                for prod in Product.objects.filter(id__in=missing_ids[i:i + HYDRATE_BATCH_SIZE]):
+                    found[missing[prod.pk]] = prod
+                    self._hydrated.set(missing[prod.pk], prod)
+            return found
+
+    def all_items(self):
+        return list(self.get_items(list(self._index)).values())
+
+    def flush(self, wait_images=False):
+        """
+        Write all pending changes to database.
+        :param wait_images: wait for the images in processing and write them too.
+        """
+        with self.item_access_lock:
+            new_prods, self._new_prods = list(self._new_prods.values()), {}
+            updated_prods, self._updated_prods = list(self._updated_prods.values()), {}
+            images, self._images = self._images, {}
+            props, self._props = self._props, {}
+            stores, self._stores = self._stores, {}
+            merged_props, self._merged_props = self._merged_props, {}
+            self.last_flush_time = time.time()
+            new_images = []
+            if new_prods or updated_prods or images or props or stores or merged_props:
+                with transaction.atomic():
+                    new_images, linked_images = self._find_prod_images(images)
+                    if new_prods:
+                        Product.objects.bulk_create(new_prods, batch_size=self.write_batch_size)
+                        for prod in new_prods:
+                            prod._state.adding = False
+                    if updated_prods:
+                        bulk_update(Product, updated_prods, PRODUCT_UPDATE_FIELDS)
+                    if props:
+                        self.__class__._write_prod_props(props)
+                    if merged_props:
+                        # After properties of product items, so values are merged into them.
+                        self.__class__._write_merged_prod_props(merged_props)
+                    if stores:
+                        self.__class__._write_prod_stores(stores)
+                    if linked_images:
+                        self.__class__._write_linked_images(linked_images)
+            if self.image_processor is not None:
+                # Images are submitted after products are committed, image rows reference them.
+                for key in new_images:
+                    self._processing_images[key] = images[key].landing_page
+                    self.image_processor.submit(*key)
+                if wait_images:
+                    self.image_processor.wait()
+                self._write_processed_images()
+
+    def _add_prod_stores(self, db_prod, stores):
         for store in stores:
-            found = None
-            for ex_store in ex_stores:
-                if ex_store.value_equals_to(store):
-                    found = ex_store
-            if not found:
-                if not store.pk:
-                    store.save()
-                db_prod.stores.add(store)
-            else:
-                ex_stores.remove(found)
-        # for s in ex_stores:
-        #     db_prod.stores.remove(s)
+            if store._state.adding:
+                store.save()
+            self._stores[(db_prod.pk, store.pk)] = store
+
+    @staticmethod
+    def _normalize_price(price):
+        return None if price is None else Decimal(str(price)).quantize(Decimal('0.01'))
+
+    @staticmethod
+    def _price_in_cents(price):
+        price = ProductRepository._normalize_price(price)
+        return _NO_PRICE if price is None else int(price * 100)
+
+    @staticmethod
+    def _index_value(prod_id, content_hash, price, promotion_end_date, active):
+        content_hash = bytes.fromhex(content_hash) if content_hash else bytes(_CONTENT_HASH_SIZE)
+        listing = _INDEX_LISTING.pack(ProductRepository._price_in_cents(price),
+                                      promotion_end_date if active and promotion_end_date else 0)
+        return prod_id.bytes + content_hash + listing
 
     @staticmethod
-    def _update_prod_props_in_db(db_prod, properties):
-        if not properties:
+    def _is_indexed_active(index_value):
+        # Promotion end date of an inactive product is 0 in index.
+        _, end_date = _INDEX_LISTING.unpack_from(index_value, _PRODUCT_ID_SIZE + _CONTENT_HASH_SIZE)
+        return end_date != 0
+
+    def _forget_content_hash(self, landing_page):
+        # Next crawled item of the product is not skipped as unchanged.
+        index_value = self._index.get(landing_page)
+        if index_value is not None:
+            hash_end = _PRODUCT_ID_SIZE + _CONTENT_HASH_SIZE
+            self._index[landing_page] = \
+                index_value[:_PRODUCT_ID_SIZE] + bytes(_CONTENT_HASH_SIZE) + index_value[hash_end:]
+
+    def _flush_if_needed(self):
+        pending = len(self._new_prods) + len(self._updated_prods)
+        if pending >= self.write_batch_size \
+                or time.time() - self.last_flush_time >= self.write_flush_interval:
+            self.flush()
+
+    def _find_prod_images(self, images):
+        """
+        Find the images to process, images already stored under the same url are linked to the product
+        without downloading them again.
+        Products whose image is already stored are marked as ready.
+        :param images: dict of (product pk, image url) -> product.
+        :return: list of (product pk, image url) to process, list of ProductImage to link.
+        """
+        if not images:
+            return [], []
+        prod_ids = {prod_id for prod_id, _ in images}
+        ex_images = set(ProductImage.objects
+                        .filter(product_id__in=prod_ids)
+                        .values_list('product_id', 'original_url'))
+        missing = {key: db_prod for key, db_prod in images.items() if key not in ex_images}
+        blobs_by_url = {}
+        if missing:
+            blobs_by_url = {url: (blob_id, unique_hash) for url, blob_id, unique_hash
+                            in ProductImage.objects
+                            .filter(original_url__in={url for _, url in missing}, blob__isnull=False)
+                            .values_list('original_url', 'blob', 'unique_hash')}
+        new_images, linked_images = [], []
+        for key, db_prod in images.items():
+            prod_id, image_url = key
+            if key not in missing:
+                db_prod.ready = True
+            elif image_url in blobs_by_url:
+                db_prod.ready = True
+                blob_id, unique_hash = blobs_by_url[image_url]
+                linked_images.append(ProductImage(product_id=prod_id, unique_hash=unique_hash,
+                                                  original_url=image_url, blob_id=blob_id))
+            elif key not in self._processing_images:
+                new_images.append(key)
+        return new_images, linked_images
+
+    @staticmethod
+    def _write_linked_images(images):
+        ProductImage.objects.bulk_create(images)
+        ImageBlob.add_refs(image.blob_id for image in images)
+
+    def _write_processed_images(self):
+        for prod_id, image_url in self.image_processor.take_failed():
+            landing_page = self._processing_images.pop((prod_id, image_url), None)
+            logger.warning('Failed to process image %s of product %s, it is processed again '
+                           'when the product is crawled again.', image_url, prod_id)
+            if landing_page is not None:
+                self._forget_content_hash(landing_page)
+        processed = self.image_processor.take_processed()
+        if not processed:
             return
-        ex_props = list(db_prod.properties.all())
-        for prop in properties:
-            found = None
-            for ex_prop in ex_props:
-                if ex_prop.name == prop.name:
-                    found = ex_prop
-                    break
-            if not found:
-                # Create new props
-                prop.product = db_prod
-                prop.save()
+        for image in processed:
+            self._processing_images.pop((image.product_id, image.original_url), None)
+        with transaction.atomic():
+            blobs = self._get_or_create_blobs(processed)
+            ProductImage.objects.bulk_create([
+                ProductImage(product_id=image.product_id, unique_hash=blobs[image.unique_hash].unique_hash,
+                             original_url=image.original_url, blob=blobs[image.unique_hash])
+                for image in processed
+            ])
+            ImageBlob.add_refs(blobs[image.unique_hash].pk for image in processed)
+            Product.objects.filter(pk__in={image.product_id for image in processed}).update(ready=True)
+
+    def _get_or_create_blobs(self, processed):
+        """
+        :param processed: list of ProcessedImage.
+        :return: dict of content hash -> ImageBlob, a near duplicate image maps to the existing blob
+            with the same perceptual hash.
+        """
+        blobs = {blob.unique_hash: blob
+                 for blob in ImageBlob.objects.filter(unique_hash__in={image.unique_hash for image in processed})}
+        missing = {image.unique_hash: image for image in processed if image.unique_hash not in blobs}
+        perceptual_hashes = {image.perceptual_hash for image in missing.values() if image.perceptual_hash}
+        similar_blobs = {}
+        if perceptual_hashes:
+            for blob in ImageBlob.objects.filter(perceptual_hash__in=perceptual_hashes).order_by('pk'):
+                similar_blobs.setdefault(blob.perceptual_hash, blob)
+        for unique_hash, image in missing.items():
+            blob = similar_blobs.get(image.perceptual_hash) if image.perceptual_hash else None
+            if blob is not None:
+                # Near duplicate of a stored image, the new files are not needed.
+                self.image_processor.remove_files(image.paths)
             else:
-                if found.value != prop.value:
-                    # Update existing props
-                    found.value = prop.value
-                    found.save()
-                # Remove from pending deletion list
-                ex_props.remove(found)
-        # for p in ex_props:
-        #     p.delete()
+                _, _, (width, height), path = image.main_rendition
+                blob, created = ImageBlob.objects.get_or_create(
+                    unique_hash=unique_hash,
+                    defaults={'path': path, 'width': width, 'height': height,
+                              'perceptual_hash': image.perceptual_hash})
+                if created:
+                    ImageRendition.objects.bulk_create([
+                        ImageRendition(blob=blob, length=length, format=fmt, width=size[0], height=size[1], path=path)
+                        for length, fmt, size, path in image.renditions
+                    ])
+                if image.perceptual_hash:
+                    similar_blobs[image.perceptual_hash] = blob
+            blobs[unique_hash] = blob
+        return blobs
+
+    @staticmethod
+    def _write_prod_props(properties):
+        prod_ids = {prod_id for prod_id, _ in properties}
+        ex_props = ProductProperty.objects.filter(product_id__in=prod_ids)
+        sync_properties(ProductProperty, 'product_id', ex_props, properties.values())
+
+    @staticmethod
+    def _write_merged_prod_props(merged_props):
+        ex_props = ProductProperty.objects.filter(product_id__in={prod_id for prod_id, _ in merged_props},
+                                                  name__in={name for _, name in merged_props})
+        ex_values = {(prop.product_id, prop.name): prop.value for prop in ex_props}
+        props = []
+        for key, values in merged_props.items():
+            ex_value = ex_values.get(key)
+            if ex_value:
+                values = values.union(ex_value.split(PROPERTY_VALUE_SEPARATOR))
+            prod_id, name = key
+            props.append(ProductProperty(product_id=prod_id, name=name,
+                                         value=PROPERTY_VALUE_SEPARATOR.join(sorted(values))))
+        sync_properties(ProductProperty, 'product_id', ex_props, props)
 
     @staticmethod
-    def _save_product_image(product, image_url):
-        # TODO: Save to Disk or File server.
-        pass
+    def _write_prod_stores(stores):
+        prod_stores = Product.stores.through
+        prod_ids = {prod_id for prod_id, _ in stores}
+        ex_prod_stores = prod_stores.objects \
+            .filter(product_id__in=prod_ids) \
+            .values_list('product_id', 'store_id')
+        sync_m2m(prod_stores, 'product_id', 'store_id', ex_prod_stores, stores.keys())
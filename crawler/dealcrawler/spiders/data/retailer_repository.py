@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from dealcrawler.common.diff import sync_properties
 from dealcrawler.common.repository import Repository
-from retailer.models import Retailer
+from retailer.models import Retailer, RetailerProperty
 
 
 class RetailerRepository (Repository):
@@ -49,23 +50,7 @@ class RetailerRepository (Repository):
     def _update_retailer_props_in_db(retailer, properties):
         if not properties:
             return
-        ex_props = list(retailer.properties.all())
         for prop in properties:
-            found = None
-            for ex_prop in ex_props:
-                if ex_prop.name == prop.name:
-                    found = ex_prop
-                    break
-            if not found:
-                # Create new props
-                prop.retailer = retailer
-                prop.save()
-            else:
-                if found.value != prop.value:
-                    # Update existing props
-                    found.value = prop.value
-                    found.save()
-                # Remove from pending deletion list
-                ex_props.remove(found)
-        # for p in ex_props:
-        #     p.delete()
+            prop.retailer = retailer
+        # Retailer properties not in crawled properties are kept.
+        sync_properties(RetailerProperty, 'retailer_id', retailer.properties.all(), properties)
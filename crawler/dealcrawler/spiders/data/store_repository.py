@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from django.db.models import OuterRef, Subquery
+
+from store.models import Store, StoreProperty
+from supersaver.settings import make_internal_property_name
+
+LASOO_ID_PROPERTY_NAME = make_internal_property_name('lasoo_id')
+
+
+class LasooStoreRepository:
+    """
+    Lasoo store index of a crawl, keyed by (retailer id, lasoo id) and (retailer id, store name).
+
+    Stores of a retailer are loaded with one query when the retailer is first seen,
+    created stores are added to the index, so resolving an offer store needs no query.
+    """
+
+    def __init__(self, region):
+        self.region = region
+        self._loaded_retailer_ids = set()
+        self._by_lasoo_id = {}
+        self._by_name = {}
+        self.item_access_lock = threading.RLock()
+
+    def get_or_create_store(self, store_dict, retailer):
+        """
+        Get store of lasoo store dict (see parse_lasoo_store_js), create it if it is not found.
+        :param store_dict: lasoo store dict, includes lasoo_id, name, display_name, latitude, longitude.
+        :param retailer: retailer of the store.
+        :return: store instance.
+        """
+        # Import here to avoid circular import, lasoo util imports data repositories.
+        from dealcrawler.spiders.nz.lasoo.util import add_or_update_store_in_db
+        with self.item_access_lock:
+            self._load_retailer_stores(retailer)
+            store = self._by_lasoo_id.get((retailer.pk, store_dict['lasoo_id']))
+            if store is not None:
+                return store
+            store = self._by_name.get((retailer.pk, store_dict['name']))
+            if store is None:
+                store = Store(retailer=retailer, region=self.region, name=store_dict['name'])
+            store = add_or_update_store_in_db(store_dict, self.region, retailer, store)
+            self._add_store(store, store_dict['lasoo_id'])
+            return store
+
+    def _load_retailer_stores(self, retailer):
+        if retailer.pk in self._loaded_retailer_ids:
+            return
+        lasoo_ids = StoreProperty.objects \
+            .filter(store=OuterRef('pk'), name=LASOO_ID_PROPERTY_NAME) \
+            .values('value')[:1]
+        for store in Store.objects.filter(retailer=retailer).annotate(lasoo_id=Subquery(lasoo_ids)):
+            self._add_store(store, store.lasoo_id)
+        self._loaded_retailer_ids.add(retailer.pk)
+
+    def _add_store(self, store, lasoo_id):
+        if lasoo_id:
+            self._by_lasoo_id[(store.retailer_id, lasoo_id)] = store
+        self._by_name[(store.retailer_id, store.name)] = store
@@ -7,8 +7,7 @@ from datetime import datetime, timedelta
 from json import loads as json_loads
 
 from dateutil.parser import parse as parse_date
-
-from dealcrawler.model.items import ProductItem
+from dealcrawler.model.items import ProductItem, ProductPropertyMergeItem
 from dealcrawler.spiders.BaseSpider import DealSpider
 from dealcrawler.util import *
 from product.models import ProductProperty
@@ -16,13 +15,18 @@ from store.models import Store
 from supersaver.constants import *
 from supersaver.settings import make_internal_property_name
 
+# Deal details are crawled after listing pages, so the regions of a deal are mostly known by then.
+DEAL_DETAILS_PRIORITY = -1
+REGIONS_PROPERTY_NAME = make_internal_property_name('grabone_regions')
+
 
 class GrabOneDealSpider(DealSpider):
     name = 'grabone.co.nz'
 
     custom_settings = {
         'DEBUG': True,
-        'DOWNLOAD_DELAY': 3
+        # Only crawl new or changed deals, run with -s GRABONE_INCREMENTAL_CRAWL=0 for a full crawl.
+        'GRABONE_INCREMENTAL_CRAWL': True,
     }
 
     DEAL_IMAGE_URL_FORMAT = 'https://main-cdn.grabone.co.nz/goimage/fullsize/{0}'
@@ -36,6 +40,17 @@ class GrabOneDealSpider(DealSpider):
             *args, **kwargs)
         self.category_by_name = {}
         self.logging_level = logging.DEBUG
+        self.incremental = False
+        # Deals of the crawl, a deal listed in many regions is crawled once.
+        self._deal_regions = {}     # landing page -> regions the deal is listed in
+        self._deal_items = {}       # landing page -> crawled deal item
+        self._unchanged_deals = set()   # landing pages of the deals not crawled as they are unchanged
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.incremental = crawler.settings.getbool('GRABONE_INCREMENTAL_CRAWL')
+        return spider
 
     def parse(self, response):
         region_mapping = {name: {'region': self.region_by_name[name]} for name in self.region_by_name}
@@ -87,19 +102,48 @@ class GrabOneDealSpider(DealSpider):
             if value > pages:
                 pages = value
         self.log('#Total pages: {0} in {1}'.format(pages, response.url))
-        # Crawl paginated deals
-        for i in range(1, pages+1):
-            query = '?sortby=new&page={0}'.format(i)
-            url = response.urljoin(query)
-            yield self.create_request(
-                   url,
-                   self.parse_deals_page,
-                   meta=response.meta)
+        if self.incremental:
+            # Newest deals first, pages are crawled one by one until a page has no new or changed deals.
+            if pages > 0:
+                yield self._create_deals_page_request(response, 1, pages, self.parse_incremental_deals_page)
+        else:
+            # Crawl paginated deals
+            for i in range(1, pages+1):
+                yield self._create_deals_page_request(response, i, pages, self.parse_deals_page)
         # Crawl deals in this web page.
         for request in self.parse_deals_page(response):
             yield request
 
+    def parse_incremental_deals_page(self, response):
+        results, changed = self._parse_deals_page(response)
+        for result in results:
+            yield result
+        page, pages = response.meta['page'], response.meta['pages']
+        if changed == 0:
+            self.log('No new or changed deals in page {0}/{1}, stop paginating {2}'.format(page, pages, response.url))
+            self.crawler.stats.inc_value('grabone/pages_skipped', pages - page, spider=self)
+        elif page < pages:
+            yield self._create_deals_page_request(response, page + 1, pages, self.parse_incremental_deals_page)
+
+    def _create_deals_page_request(self, response, page, pages, callback):
+        query = '?sortby=new&page={0}'.format(page)
+        meta = dict(response.meta, page=page, pages=pages)
+        return self.create_request(response.urljoin(query), callback, meta=meta)
+
     def parse_deals_page(self, response):
+        results, _ = self._parse_deals_page(response)
+        return results
+
+    def _parse_deals_page(self, response):
+        """
+        :return: list of requests and items, number of listed deals which are new or changed.
+            A deal seen in another region is changed unless it was found unchanged there,
+            it is crawled once but the page may still have other new deals.
+        """
+        results = []
+        deals = []
+        changed = 0
+        region = response.meta['region']
         index = 0
         for deal_elem in response.xpath('//div[@id="search-grid-listings"]/article/div/a'):
             index += 1
@@ -111,21 +155,55 @@ class GrabOneDealSpider(DealSpider):
                          "Error: {2}".format(index, response.url, traceback.format_exc()))
             if data is None:
                 continue
-            data['region'] = response.meta['region']
+            landing_page = data['prod']['landing_page']
+            regions = self._deal_regions.get(landing_page)
+            if regions is not None:
+                self.crawler.stats.inc_value('grabone/deals_coalesced', spider=self)
+                unchanged = landing_page in self._unchanged_deals
+                if not unchanged:
+                    changed += 1
+                if region not in regions:
+                    regions.add(region)
+                    item = self._deal_items.get(landing_page)
+                    if item is not None:
+                        # Details were crawled before the deal was seen in this region.
+                        results.append(self._update_deal_regions(item, regions))
+                    elif unchanged:
+                        results.append(self.__class__._merge_deal_regions(landing_page, [region]))
+                continue
+            self._deal_regions[landing_page] = {region}
+            data['region'] = region
+            deals.append(data)
+        if self.incremental:
+            # Deals known with the same price needn't be crawled again.
+            unchanged = self.prod_repo.find_unchanged(
+                {data['prod']['landing_page']: data['prod']['price'] for data in deals},
+                int(datetime.now().timestamp()))
+            if unchanged:
+                self.crawler.stats.inc_value('grabone/deals_skipped', len(unchanged), spider=self)
+                self._unchanged_deals.update(unchanged)
+                # The deal is still listed in this region.
+                results.extend(self.__class__._merge_deal_regions(landing_page, [region])
+                               for landing_page in unchanged)
+                deals = [data for data in deals if data['prod']['landing_page'] not in unchanged]
+        changed += len(deals)
+        for data in deals:
             # Get deal details, store location and categories
             detail_url = data['prod']['landing_page']
-            yield self.create_request(
+            results.append(self.create_request(
                 detail_url,
                 self.parse_deal_details_page,
                 referer=response.url,
-                meta=data)
+                meta=data,
+                priority=DEAL_DETAILS_PRIORITY))
+        return results, changed
 
     def parse_deal(self, response, elem):
         retailer_name = extract_first_value_with_xpath(elem, './section/header/p[@class="listing-vendor"]/text()')
-        retailer = self._create_or_update_retailer_in_db(retailer_name)
 
         prod = ProductItem()
-        prod['retailer'] = retailer
+        # Retailer is created or updated on persistence (see DealSpider.persist_item).
+        prod['retailer_name'] = retailer_name
         url = extract_first_value_with_xpath(elem, './@href')
         prod['landing_page'] = response.urljoin(url)
         value = elem.xpath('./section/header/h3[1]/text()').extract()
@@ -215,8 +293,7 @@ class GrabOneDealSpider(DealSpider):
                 continue
             idx = script_text.find('variants')
             if idx > 0:
-                data = substr_surrounded_by_chars(script_text, ('[', ']'), idx)
-                variants = json_loads(data)
+                variants = loads_js(extract_balanced(script_text, ('[', ']'), idx))
                 if len(variants) > 0 and 'buy_link' in variants[0] and len(variants[0]['buy_link']) > 0:
                     prod['fast_buy_link'] = variants[0]['buy_link']
 
@@ -226,20 +303,46 @@ class GrabOneDealSpider(DealSpider):
                          "please check the web content {0}.".format(response.url),
                          level=logging.WARNING)
                 continue
-            data = substr_surrounded_by_chars(script_text, ('[', ']'), idx)
-            merchant_locations = json_loads(data)
+            merchant_locations = loads_js(extract_balanced(script_text, ('[', ']'), idx))
             if merchant_locations is None or len(merchant_locations) < 1:
                 continue
             for location in merchant_locations:
-                store = self.parse_store_from_location(response, prod['retailer'], location)
+                store = self.parse_store_from_location(response, prod['retailer_name'], location)
                 stores.append(store)
 
-        props = list() if prod_property is None else [prod_property]
-        self._create_or_update_prod_in_db(prod, prod_image, stores, props)
-        return None
+        prod['image_url'] = prod_image
+        prod['stores'] = stores
+        prod['properties'] = list() if prod_property is None else [prod_property]
+        landing_page = prod['landing_page']
+        self._deal_items[landing_page] = prod
+        return self._update_deal_regions(prod, self._deal_regions.get(landing_page) or {response.meta['region']})
+
+    @staticmethod
+    def _update_deal_regions(prod, regions):
+        """
+        Set the regions a deal is listed in to a copy of deal item.
+        Stores of the deal keep the region the deal was first seen in.
+        """
+        prop = ProductProperty()
+        prop.name = REGIONS_PROPERTY_NAME
+        prop.value = ','.join(sorted(region.name for region in regions))
+        item = prod.copy()
+        item['properties'] = [p for p in prod['properties'] if p.name != REGIONS_PROPERTY_NAME] + [prop]
+        return item
+
+    @staticmethod
+    def _merge_deal_regions(landing_page, regions):
+        """
+        Merge regions into the regions property of a stored deal which is not crawled again.
+        """
+        item = ProductPropertyMergeItem()
+        item['landing_page'] = landing_page
+        item['name'] = REGIONS_PROPERTY_NAME
+        item['values'] = [region.name for region in regions]
+        return item
 
-    def parse_store_from_location(self, response, retailer, location):
-        store_name = retailer.display_name
+    def parse_store_from_location(self, response, retailer_name, location):
+        store_name = retailer_name
         lat, lng, address = None, None, None    # no physical store, website only
         if ('lat' in location and len(location['lat']) > 0) \
                 and ('lng' in location and len(location['lng']) > 0):
@@ -258,21 +361,41 @@ class GrabOneDealSpider(DealSpider):
                 website = extract_first_value_with_xpath(contact_elem, './@href')
             elif len(contact_elem.xpath('./i[contains(@class, "fa-phone")]')) > 0:
                 tel = extract_first_value_with_xpath(contact_elem, './text()')
-        try:
-            store = retailer.stores.get(name=store_name, latitude=lat, longitude=lng)
-        except Store.DoesNotExist:
-            store = Store()
-        store.region = response.meta['region']
-        store.retailer = retailer
-        store.name = store_name
-        store.latitude = lat
-        store.longitude = lng
-        store.address = address
-        store.website = website
-        store.tel = tel
-        store.working_hours = location['public_opening_hours']
-        store.save()
-        return store
+        return {
+            'region': response.meta['region'],
+            'name': store_name,
+            'latitude': lat,
+            'longitude': lng,
+            'address': address,
+            'website': website,
+            'tel': tel,
+            'working_hours': location['public_opening_hours'],
+        }
+
+    def _get_or_create_stores_in_db(self, prod_item):
+        retailer = prod_item['retailer']
+        stores = []
+        for store_data in prod_item.get('stores') or []:
+            try:
+                # Store name is saved in lower case.
+                store = retailer.stores.get(name=store_data['name'].lower(),
+                                            latitude=store_data['latitude'],
+                                            longitude=store_data['longitude'])
+            except Store.DoesNotExist:
+                store = Store()
+            store.region = store_data['region']
+            store.retailer = retailer
+            store.name = store_data['name']
+            store.display_name = store_data['name']
+            store.latitude = store_data['latitude']
+            store.longitude = store_data['longitude']
+            store.address = store_data['address']
+            store.website = store_data['website']
+            store.tel = store_data['tel']
+            store.working_hours = store_data['working_hours']
+            store.save()
+            stores.append(store)
+        return stores
 
     def parse_date_range(self, date_range_str):
         tz_delta = datetime.now() - datetime.utcnow()
@@ -3,9 +3,12 @@ __author__ = 'qinpeng'
 import logging
 import random
 from datetime import datetime, timedelta
+from json import loads as json_loads
 
 import scrapy
 from dateutil import parser as dateparser
+from scrapy import signals
+from scrapy.utils.project import data_path
 
 from dealcrawler.model.items import ProductItem
 from dealcrawler.spiders.BaseSpider import DealSpider
@@ -14,9 +17,13 @@ from product.models import ProductProperty
 from region.models import Region
 from retailer.models import RetailerProperty
 from supersaver.constants import *
+from .lasoo.catalogue import CatalogueRegistry
 from .lasoo.util import *
+from ..data.store_repository import LasooStoreRepository
 
 UTC_TO_NZ_TIMEZONE_DELTA = timedelta(seconds=12*3600)
+# Key of pending catalogues in spider state of a crawl job (JOBDIR).
+CATALOGUES_STATE_KEY = 'lasoo_catalogues'
 
 
 class LasooCoNzDealSpider(DealSpider):
@@ -31,7 +38,17 @@ class LasooCoNzDealSpider(DealSpider):
     'Chrome/48.0.2564.97 Safari/537.36',
     custom_settings = {
         'ROBOTSTXT_OBEY': False,
-
+        # Responses are cached by url without the random jsonp tag and revalidated by ETag / Last-Modified.
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_STORAGE': 'dealcrawler.httpcache.CanonicalUrlCacheStorage',
+        'HTTPCACHE_POLICY': 'dealcrawler.httpcache.RevalidatingCachePolicy',
+        'HTTPCACHE_IGNORE_QUERY_PARAMS': ['jsonp'],
+        # A resumed crawl (JOBDIR) requests the same data with new jsonp tags, they are still duplicates.
+        'DUPEFILTER_CLASS': 'dealcrawler.dupefilter.CanonicalUrlDupeFilter',
+        'DUPEFILTER_IGNORE_QUERY_PARAMS': ['jsonp'],
+        # Catalogues unchanged since last finished crawl are skipped, see CatalogueRegistry.
+        'LASOO_SKIP_UNCHANGED_CATALOGUES': True,
+        'LASOO_CATALOGUE_REGISTRY': 'lasoo-catalogues.json',
     }
 
     # SVER = 'ikt3z7fsszp9rt201651'
@@ -54,6 +71,39 @@ class LasooCoNzDealSpider(DealSpider):
         random.seed(datetime.now().timestamp())
         # TODO: Identify proper region for retailer stores
         self.region = Region.objects.get(name="all new zealand")
+        self.store_repo = LasooStoreRepository(self.region)
+        self.catalogue_registry = None
+        # Retailer name -> retailer json of lasoo, retailers not in DB are created from it by persist_item.
+        self._retailers_json = {}
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+        if settings.getbool('LASOO_SKIP_UNCHANGED_CATALOGUES'):
+            spider.catalogue_registry = CatalogueRegistry(
+                data_path(settings.get('LASOO_CATALOGUE_REGISTRY'), createdir=True))
+            # Spider state of a crawl job is loaded on spider opened.
+            crawler.signals.connect(spider._restore_catalogues, signal=signals.spider_opened)
+        return spider
+
+    def closed(self, reason):
+        super().closed(reason)
+        if self.catalogue_registry is None:
+            return
+        state = getattr(self, 'state', None)
+        if reason == 'finished':
+            self.catalogue_registry.save()
+            if state is not None:
+                state.pop(CATALOGUES_STATE_KEY, None)
+        elif state is not None:
+            # Catalogues of an interrupted crawl are saved when the crawl job resumes and finishes.
+            state[CATALOGUES_STATE_KEY] = self.catalogue_registry.pending
+
+    def _restore_catalogues(self, spider):
+        state = getattr(self, 'state', None)
+        if state is not None and CATALOGUES_STATE_KEY in state:
+            self.catalogue_registry.restore(state[CATALOGUES_STATE_KEY])
 
     def parse(self, response):
         for cat_elem in response.xpath('//ul[contains(@class, "catalogue-list")]/li/div/a'):
@@ -81,31 +131,41 @@ class LasooCoNzDealSpider(DealSpider):
         if len(catalogues) == 0:
             return []
         catalogue = catalogues[0]
+        catalogue_id = response.meta['catalogue_id']
         start_date = dateparser.parse(catalogue['startDate']).timestamp()
         end_date = dateparser.parse(catalogue['expiryDate']).timestamp()
-        total_pages = catalogue['numberPages']
+        if self.catalogue_registry is not None:
+            signature = CatalogueRegistry.make_signature(catalogue)
+            if self.catalogue_registry.is_unchanged(catalogue_id, signature):
+                self.log('Skip unchanged catalogue {0}'.format(catalogue_id))
+                return []
+            self.catalogue_registry.start(catalogue_id, signature, end_date)
         retailer_data = catalogue['retailer']
-        retailer = self._get_retailer_from_json(retailer_data)
+        # Retailer is got or created in DB by persist_item in a worker thread, not on reactor thread.
+        self._retailers_json[retailer_data['name']] = retailer_data
 
         # Update jsonp for new request
         jsonp_tag = self.__class__._get_random_jsonp_tag()
-        catalogue_url = self.__class__._get_deals_url(response.meta['catalogue_id'], jsonp_tag)
+        catalogue_url = self.__class__._get_deals_url(catalogue_id, jsonp_tag)
         meta = response.meta
         meta['offer_start_date'] = start_date
         meta['offer_end_date'] = end_date
-        meta['retailer'] = retailer
+        meta['retailer_name'] = retailer_data['name']
         meta['jsonp_tag'] = jsonp_tag
         yield scrapy.Request(catalogue_url,
                              callback=self.parse_catalogue_from_response,
                              headers=self.__class__._get_http_headers(meta['referer']),
                              meta=meta)
 
-    def _get_retailer_from_json(self, retailer_json):
-        retailer_name = retailer_json['name']
+    def _get_or_create_retailer_in_db(self, retailer_name):
         retailer = self.retailer_repo.get_retailer_by_name(retailer_name)
         # Retailer normally should be already in DB, if not we create a new one.
         if retailer:
             return retailer
+        retailer_json = self._retailers_json.get(retailer_name)
+        if retailer_json is None:
+            # Catalogue was parsed before an interrupted crawl was resumed.
+            return self._create_or_update_retailer_in_db(retailer_name)
         properties = []
         prop = RetailerProperty()
         prop.name = make_internal_property_name('lasoo_id')
@@ -125,7 +185,8 @@ class LasooCoNzDealSpider(DealSpider):
         return self._create_or_update_retailer_in_db(retailer_name, None, retailer_json['smallImage'], properties)
 
     def parse_catalogue_from_response(self, response):
-        retailer = response.meta['retailer']
+        retailer_name = response.meta['retailer_name']
+        catalogue_id = response.meta['catalogue_id']
         offer_start_time = response.meta['offer_start_date']
         offer_end_time = response.meta['offer_end_date']
 
@@ -150,7 +211,7 @@ class LasooCoNzDealSpider(DealSpider):
                 if offer_data['type'] != 'offer':
                     continue
                 offer = ProductItem()
-                offer['retailer'] = retailer
+                offer['retailer_name'] = retailer_name
                 offer['title'] = offer_data['title']
                 offer['promotion_start_date'] = offer_start_time
                 offer['promotion_end_date'] = offer_end_time
@@ -164,7 +225,7 @@ class LasooCoNzDealSpider(DealSpider):
                     'offer': offer,
                     'lasoo_url': lasoo_url,
                     'referer': referer,
-                    'retailer': retailer,
+                    'catalogue_id': catalogue_id,
                 }
                 if 'offerimage' in offer_data:
                     meta['offer_image'] = offer_data['offerimage']['path']
@@ -172,10 +233,13 @@ class LasooCoNzDealSpider(DealSpider):
                 jsonp_tag = self.__class__._get_random_jsonp_tag()
                 meta['jsonp_tag'] = jsonp_tag
                 offer_json_url = self.__class__._get_offer_url(offer_data['id'], jsonp_tag)
+                self._add_catalogue_request(catalogue_id)
                 yield scrapy.Request(offer_json_url,
                                      callback=self.parse_offer_details_from_response,
                                      headers=self.__class__._get_http_headers(referer),
                                      meta=meta)
+        # Offer requests are outstanding now, the catalogue is crawled when they are finished.
+        self._finish_catalogue_request(catalogue_id)
 
     def parse_offer_details_from_response(self, response):
         # Parse Json
@@ -183,7 +247,6 @@ class LasooCoNzDealSpider(DealSpider):
         if len(data) == 0:
             self.log('Failed to get offer details {0}'.format(response.url), level=logging.WARN)
             return
-        retailer = response.meta['retailer']
         offer_data = data[0]
         offer = response.meta['offer']
         offer['price'] = offer_data['priceValue']
@@ -207,44 +270,54 @@ class LasooCoNzDealSpider(DealSpider):
             prop.name = make_internal_property_name('lasoo_url')
             prop.value = lasoo_url
             props.append(prop)
-        db_offer = self.prod_repo.add_or_update_prod_in_db(offer, offer_image, stores=None, properties=props)
+        offer['image_url'] = offer_image
+        offer['properties'] = props
         if lasoo_url:
             meta = {
-                'db_offer': db_offer,
-                'retailer': retailer,
+                'offer': offer,
+                'catalogue_id': response.meta['catalogue_id'],
             }
-            # Parse stores for this deal.
+            # Parse stores for this deal, the offer is yielded with its stores.
+            # The outstanding offer request of catalogue is finished by the stores request.
             return scrapy.Request(lasoo_url,
                                   callback=self.parse_offer_stores_response,
+                                  errback=self.parse_offer_stores_failure,
                                   headers=self.__class__._get_http_headers(response.meta['referer']),
                                   meta=meta)
         else:
+            self._finish_catalogue_request(response.meta['catalogue_id'])
             return offer
 
     def parse_offer_stores_response(self, response):
+        offer = response.meta['offer']
         # Parse store
         script = extract_first_value_with_xpath(
             response, '//section//div[@class="storemap-holder"]/following-sibling::script[1]/text()')
 
-        idx = script.find('showOfferDetailNearStoreMap')
-        if idx < 0:
-            return None
-        locations_json = substr_surrounded_by_chars(script, ('[', ']'), idx)
-        store_locations = parse_lasoo_store_js(locations_json)
-
-        offer = response.meta['db_offer']
-        retailer = response.meta['retailer']
-        for store in store_locations:
-            stores = Store.objects.filter(
-                retailer=retailer,
-                properties__name=make_internal_property_name('lasoo_id'),
-                properties__value=store['lasoo_id'])
-            if len(stores) > 0:
-                offer.stores.add(stores[0])
-            else:
-                db_store = add_or_update_store_in_db(store, self.region, retailer)
-                offer.stores.add(db_store)
+        idx = script.find('showOfferDetailNearStoreMap') if script else -1
+        if idx >= 0:
+            locations_json = extract_balanced(script, ('[', ']'), idx)
+            offer['stores'] = parse_lasoo_store_js(locations_json)
+        self._finish_catalogue_request(response.meta['catalogue_id'])
+        return offer
+
+    def parse_offer_stores_failure(self, failure):
+        self.log('Failed to get offer stores {0}'.format(failure.request.url), level=logging.WARN)
+        # Keep the offer even if we can't get its stores.
+        self._finish_catalogue_request(failure.request.meta['catalogue_id'])
+        return failure.request.meta['offer']
+
+    def _add_catalogue_request(self, catalogue_id):
+        if self.catalogue_registry is not None:
+            self.catalogue_registry.add_requests(catalogue_id)
+
+    def _finish_catalogue_request(self, catalogue_id):
+        if self.catalogue_registry is not None and self.catalogue_registry.finish_request(catalogue_id):
+            self.log('Crawled catalogue {0}'.format(catalogue_id))
 
+    def _get_or_create_stores_in_db(self, prod_item):
+        retailer = prod_item['retailer']
+        return [self.store_repo.get_or_create_store(store, retailer) for store in prod_item.get('stores') or []]
 
     @classmethod
     def _get_random_jsonp_tag(cls):
@@ -264,12 +337,10 @@ class LasooCoNzDealSpider(DealSpider):
 
     @classmethod
     def _get_jsonp_response_data(cls, response_body, jsonp_tag=None):
-        json_raw_data = response_body.decode('utf8')
         if jsonp_tag and isinstance(jsonp_tag, str):
-            last_bracket = json_raw_data.rindex(')')
-            json_raw_data = json_raw_data[len(jsonp_tag) + 1:last_bracket]
-        data = json_loads(json_raw_data)
-        return data
+            # A cached response has the jsonp tag of the request which was cached, not of this request.
+            return loads_jsonp(response_body)
+        return loads_js(response_body)
 
     @classmethod
     def _get_http_headers(cls, referer):
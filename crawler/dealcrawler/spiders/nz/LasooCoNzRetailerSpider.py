@@ -3,6 +3,7 @@ __author__ = 'qinpeng'
 
 import random
 from datetime import datetime, timedelta
+from json import loads as json_loads
 
 import scrapy
 
@@ -147,7 +148,7 @@ class LasooCoNzRetailerSpider(BaseSpider):
             script_text = elem.extract()
             idx = script_text.find("showOfferDetailNearStoreMap")
             if idx >= 0:
-                store_json = substr_surrounded_by_chars(script_text, ('[', ']'), idx)
+                store_json = extract_balanced(script_text, ('[', ']'), idx)
                 stores = parse_lasoo_store_js(store_json)
                 stores_by_id = {s['lasoo_id']: s for s in stores}
                 break
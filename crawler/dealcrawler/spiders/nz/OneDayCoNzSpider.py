@@ -128,8 +128,7 @@ class OneDayCoNzSpider(DealSpider):
             # Can't get deal image, go to deal detail page
             return self.create_request(url, self.parse_deal_image_from_response, meta={'deal': deal})
         else:
-            image_src = response.urljoin(image_src)
-            self._create_or_update_prod_in_db(deal, image_src, [self.store])
+            deal['image_url'] = response.urljoin(image_src)
             return deal
 
     def parse_deal_image_from_response(self, response):
@@ -139,10 +138,12 @@ class OneDayCoNzSpider(DealSpider):
                 response,
                 '//div[contains(@class, "product-details")]//img[@itemprop="image"]/@src')
         # We currently only need image thumbnail.
-        image_src = image_src.replace('_large', '_small')
-        self._create_or_update_prod_in_db(deal, image_src, [self.store])
+        deal['image_url'] = image_src.replace('_large', '_small')
         yield deal
 
+    def _get_or_create_stores_in_db(self, prod_item):
+        return [self.store]
+
     @classmethod
     def get_daily_deal_utc_time(cls):
 
@@ -0,0 +1,95 @@
+import json
+import os
+import time
+
+
+class CatalogueRegistry:
+    """
+    Signatures of the catalogues crawled by previous runs, saved in a json file.
+
+    A catalogue signature is its start date, expiry date and page count, a catalogue with
+    the same signature as last crawl has the same offers, so it needn't be crawled again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._crawled = {}      # catalogue id -> {'signature': ..., 'expiry': timestamp}
+        self._crawling = {}     # catalogue id -> {'signature': ..., 'expiry': ..., 'requests': outstanding}
+        self._pending = {}      # catalogue id -> {'signature': ..., 'expiry': ...} crawled but not saved
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                self._crawled = json.load(f)
+
+    @staticmethod
+    def make_signature(catalogue):
+        """
+        :param catalogue: catalogue json of lasoo.
+        """
+        return '{0}|{1}|{2}'.format(catalogue['startDate'], catalogue['expiryDate'], catalogue['numberPages'])
+
+    def is_unchanged(self, catalogue_id, signature):
+        entry = self._crawled.get(str(catalogue_id))
+        return entry is not None and entry['signature'] == signature
+
+    def start(self, catalogue_id, signature, expiry):
+        """
+        Record a catalogue being crawled, its request of catalogue pages is outstanding.
+        The catalogue is recorded as crawled when all its requests are finished, see finish_request().
+        :param expiry: timestamp when the catalogue expires.
+        """
+        self._crawling[str(catalogue_id)] = {'signature': signature, 'expiry': expiry, 'requests': 1}
+
+    def add_requests(self, catalogue_id, count=1):
+        """
+        Record more outstanding requests of a catalogue being crawled, e.g. requests of its offers.
+        """
+        entry = self._crawling.get(str(catalogue_id))
+        if entry is not None:
+            entry['requests'] += count
+
+    def finish_request(self, catalogue_id):
+        """
+        Record an outstanding request of a catalogue processed successfully.
+        A failed request is not finished, so the catalogue is crawled again by next run.
+        :return: True if all requests of the catalogue are finished, it is saved by save().
+        """
+        catalogue_id = str(catalogue_id)
+        entry = self._crawling.get(catalogue_id)
+        if entry is None:
+            # Catalogue started before an interrupted crawl was resumed, it is not recorded.
+            return False
+        entry['requests'] -= 1
+        if entry['requests'] > 0:
+            return False
+        del self._crawling[catalogue_id]
+        self._pending[catalogue_id] = {'signature': entry['signature'], 'expiry': entry['expiry']}
+        return True
+
+    @property
+    def pending(self):
+        """
+        Catalogues crawled completely but not saved yet, e.g. to resume an interrupted crawl.
+        """
+        return dict(self._pending)
+
+    def restore(self, pending):
+        """
+        Record catalogues of an interrupted crawl again.
+        :param pending: value of pending property of the interrupted crawl.
+        """
+        self._pending.update(pending)
+
+    def save(self):
+        """
+        Save the catalogues crawled completely, expired catalogues are removed.
+        """
+        now = time.time()
+        crawled = {k: v for k, v in self._crawled.items() if v['expiry'] > now}
+        crawled.update(self._pending)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(crawled, f)
+        os.replace(temp_path, self.path)
+        self._crawled = crawled
+        self._pending = {}
@@ -1,5 +1,7 @@
 import re
-from json import loads as json_loads
+
+from dealcrawler.common.diff import sync_properties
+from dealcrawler.util.jsextract import loads_js
 from store.models import Store, StoreProperty
 from supersaver.settings import make_internal_property_name
 
@@ -15,16 +17,8 @@ def parse_lasoo_store_js(lasoo_store_js):
     #     ,
     #     ...
     # ]
-    lasoo_store_js = lasoo_store_js.replace("\t", "").replace("\n", "").replace("\r", "").replace('\'"', '"')
-    if lasoo_store_js.find("\"id\"") > 0:
-        store_list = json_loads(lasoo_store_js)
-    else:
-        store_json = lasoo_store_js \
-            .replace('{id:', '{"id":') \
-            .replace(',latitude:', ',"latitude":') \
-            .replace(',longitude:', ',"longitude":') \
-            .replace(',displayName:', ',"displayName":')
-        store_list = json_loads(store_json)
+    # Unquoted keys are parsed as they are, trailing quote of display name is stripped on normalisation.
+    store_list = loads_js(lasoo_store_js)
     results = []
     for store in store_list:
         item = {}
@@ -47,18 +41,24 @@ def normalize_lasoo_store_address(raw_address):
     return re.sub(r"[\t\r\n]+", "", raw_address)
 
 
-def add_or_update_store_in_db(store_dict, region, retailer):
+def add_or_update_store_in_db(store_dict, region, retailer, store=None):
+    """
+    :param store: the store to update, or a new store instance to create.
+        If it is not given, store is looked up by name.
+    """
     store_name = store_dict['name']
-    results = retailer.stores.filter(name=store_name)
-    if len(results) > 0:
-        # Update existing store
-        store = results[0]
-    else:
-        # Create new store
-        store = Store()
-        store.retailer = retailer
-        store.region = region
-        store.name = store_name
+    if store is None:
+        results = retailer.stores.filter(name=store_name)
+        if len(results) > 0:
+            # Update existing store
+            store = results[0]
+        else:
+            # Create new store
+            store = Store()
+            store.retailer = retailer
+            store.region = region
+            store.name = store_name
+    is_new_store = store._state.adding
     store.display_name = store_dict["display_name"]
     store.latitude = None if 'latitude' not in store_dict else store_dict["latitude"]
     store.longitude = None if 'longitude' not in store_dict else store_dict["longitude"]
@@ -80,28 +80,12 @@ def add_or_update_store_in_db(store_dict, region, retailer):
         prop.name = make_internal_property_name('lasoo_url')
         prop.value = lasoo_url
         props.append(prop)
-    __update_store_props_in_db(store, props)
+    # New store has no properties in database.
+    __update_store_props_in_db(store, props, [] if is_new_store else store.properties.all())
     return store
 
 
-def __update_store_props_in_db(store, properties):
-    ex_props = list(store.properties.all())
+def __update_store_props_in_db(store, properties, ex_properties):
     for prop in properties:
-        found = None
-        for ex_prop in ex_props:
-            if ex_prop.name == prop.name:
-                found = ex_prop
-                break
-        if not found:
-            # Create new props
-            prop.store = store
-            prop.save()
-        else:
-            if found.value != prop.value:
-                # Update existing props
-                found.value = prop.value
-                found.save()
-            # Remove from pending deletion list
-            ex_props.remove(found)
-    for p in ex_props:
-        p.delete()
+        prop.store = store
+    sync_properties(StoreProperty, 'store_id', ex_properties, properties, delete_missing=True)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Scheduler disk queues which store model instances in request meta by primary key.
+# See: https://doc.scrapy.org/en/latest/topics/jobs.html
+
+import io
+import logging
+import pickle
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Model
+from queuelib import queue
+
+logger = logging.getLogger(__name__)
+
+class _ModelRefPickler(pickle.Pickler):
+
+    def persistent_id(self, obj):
+        # Unsaved instances (e.g. new properties of an item) are pickled as they are,
+        # pk is not enough, a new product or store has a uuid4 pk before it is saved.
+        if isinstance(obj, Model) and obj.pk is not None and not obj._state.adding:
+            return obj._meta.label, obj.pk
+        return None
+
+
+class _ModelRefUnpickler(pickle.Unpickler):
+
+    def __init__(self, file):
+        super().__init__(file)
+        # Model instances are loaded once per object, they are never shared by requests.
+        self._instances = {}
+
+    def persistent_load(self, pid):
+        label, pk = pid
+        instance = self._instances.get(pid)
+        if instance is None:
+            instance = apps.get_model(label).objects.get(pk=pk)
+            self._instances[pid] = instance
+        return instance
+
+
+def dumps(obj):
+    """
+    Pickle an object, saved model instances in it are replaced by their primary keys,
+    so a request doesn't carry stale copies of model instances (e.g. retailer of an offer) to disk.
+    :raise ValueError: if the object can't be pickled.
+    """
+    f = io.BytesIO()
+    try:
+        _ModelRefPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        raise ValueError(str(e))
+    return f.getvalue()
+
+
+def loads(data):
+    """
+    Unpickle an object pickled by dumps, model instances are loaded from database,
+    each call gets fresh instances.
+    :raise ObjectDoesNotExist: if a model instance was deleted.
+    """
+    return _ModelRefUnpickler(io.BytesIO(data)).load()
+
+
+class _ModelRefQueueMixin:
+
+    def push(self, obj):
+        super().push(dumps(obj))
+
+    def pop(self):
+        while True:
+            data = super().pop()
+            if not data:
+                return None
+            try:
+                return loads(data)
+            except ObjectDoesNotExist:
+                logger.warning('Dropped a request, its meta refers to a deleted model instance.', exc_info=True)
+
+
+class ModelRefPickleFifoDiskQueue (_ModelRefQueueMixin, queue.FifoDiskQueue):
+    pass
+
+
+class ModelRefPickleLifoDiskQueue (_ModelRefQueueMixin, queue.LifoDiskQueue):
+    pass
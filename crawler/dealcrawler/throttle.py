@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# Adaptive per-site throttling, it replaces scrapy AutoThrottle.
+# See: https://doc.scrapy.org/en/latest/topics/extensions.html
+
+import logging
+from collections import deque
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest latency in the moving average.
+LATENCY_SMOOTHING = 0.3
+# Delay below this is dropped to 0 when speeding up.
+MIN_NONZERO_DELAY = 0.05
+
+
+class SlotState:
+    """
+    Throttle state of a download slot (normally a host).
+    """
+
+    def __init__(self, window):
+        self.latency = None                 # exponential moving average of download latency
+        self.errors = deque(maxlen=window)  # True for each 429/5xx response of the recent responses
+        self.crawl_delay = 0                # Crawl-delay of robots.txt
+        self.successes = 0                  # successful responses since last change
+
+    def add_response(self, latency, is_error):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+        self.errors.append(is_error)
+
+    @property
+    def error_rate(self):
+        return sum(self.errors) / len(self.errors) if self.errors else 0.0
+
+
+class AdaptiveThrottle:
+    """
+    Adjust delay and concurrency of each download slot by its latency and error rate.
+
+    A slot is sped up additively while its latency is below target and error rate is low:
+    delay is decreased to the floor (robots.txt Crawl-delay or ADAPTIVE_THROTTLE_MIN_DELAY) first,
+    then concurrency is increased, one step per round of successful responses.
+    It is slowed down when latency is above target, and backed off multiplicatively on 429/5xx:
+    concurrency is decreased to the minimum first, then delay is increased (Retry-After is honored).
+    Notes: Scrapy sends one request per delay when delay is not 0, concurrency only matters without delay.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise NotConfigured
+        self.min_delay = settings.getfloat('ADAPTIVE_THROTTLE_MIN_DELAY', 0.0)
+        self.max_delay = settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY', 60.0)
+        self.start_delay = settings.getfloat('ADAPTIVE_THROTTLE_START_DELAY', 1.0)
+        self.min_concurrency = settings.getint('ADAPTIVE_THROTTLE_MIN_CONCURRENCY', 1)
+        self.max_concurrency = settings.getint('ADAPTIVE_THROTTLE_MAX_CONCURRENCY', 8)
+        self.target_latency = settings.getfloat('ADAPTIVE_THROTTLE_TARGET_LATENCY', 2.0)
+        self.max_error_rate = settings.getfloat('ADAPTIVE_THROTTLE_MAX_ERROR_RATE', 0.1)
+        self.window = settings.getint('ADAPTIVE_THROTTLE_WINDOW', 20)
+        self.debug = settings.getbool('ADAPTIVE_THROTTLE_DEBUG')
+        self.slots = {}     # slot key -> SlotState
+        crawler.signals.connect(self._spider_opened, signal=signals.spider_opened)
+        # Like AutoThrottle, every downloaded response is seen, RetryMiddleware turns 429/5xx responses
+        # into retries before response_received is sent.
+        crawler.signals.connect(self._response_downloaded, signal=signals.response_downloaded)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _spider_opened(self, spider):
+        # Delay of new download slots.
+        spider.download_delay = max(self.start_delay, self.min_delay)
+
+    def _response_downloaded(self, response, request, spider):
+        key = request.meta.get('download_slot')
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return
+        state = self.slots.get(key)
+        if state is None:
+            state = SlotState(self.window)
+            self.slots[key] = state
+            slot.concurrency = self.min_concurrency
+        if urlparse(response.url).path == '/robots.txt':
+            self._set_crawl_delay(state, slot, response, spider)
+            return
+        latency = request.meta.get('download_latency')
+        if latency is None or 'cached' in response.flags:
+            return
+        is_error = response.status == 429 or response.status >= 500
+        state.add_response(latency, is_error)
+        old_delay, old_concurrency = slot.delay, slot.concurrency
+        if is_error:
+            self._back_off(state, slot, response)
+        elif state.latency > self.target_latency:
+            self._slow_down(state, slot)
+        elif state.error_rate <= self.max_error_rate:
+            self._speed_up(state, slot)
+        if (slot.delay, slot.concurrency) != (old_delay, old_concurrency):
+            self.crawler.stats.inc_value('adaptive_throttle/adjustments')
+            if self.debug:
+                logger.info('%s: delay %.2f -> %.2f, concurrency %d -> %d, latency %.2f, error rate %.2f',
+                            key, old_delay, slot.delay, old_concurrency, slot.concurrency,
+                            state.latency, state.error_rate)
+
+    def _floor_delay(self, state):
+        return max(self.min_delay, state.crawl_delay)
+
+    def _back_off(self, state, slot, response):
+        state.successes = 0
+        if slot.concurrency > self.min_concurrency:
+            slot.concurrency = max(self.min_concurrency, slot.concurrency // 2)
+        else:
+            slot.delay = min(self.max_delay, max(slot.delay * 2, self.start_delay))
+        retry_after = self.__class__._get_retry_after(response)
+        if retry_after is not None:
+            slot.delay = min(self.max_delay, max(slot.delay, retry_after))
+        self.crawler.stats.inc_value('adaptive_throttle/backoffs')
+
+    def _slow_down(self, state, slot):
+        state.successes = 0
+        if slot.concurrency > self.min_concurrency:
+            slot.concurrency -= 1
+        else:
+            slot.delay = min(self.max_delay, max(slot.delay * 1.5, self.start_delay))
+
+    def _speed_up(self, state, slot):
+        state.successes += 1
+        # One step per round, a round is as many responses as concurrent requests.
+        if state.successes < slot.concurrency:
+            return
+        state.successes = 0
+        floor = self._floor_delay(state)
+        if slot.delay > floor:
+            delay = slot.delay * 0.5
+            # Don't keep halving a tiny delay.
+            slot.delay = max(floor, delay if delay >= MIN_NONZERO_DELAY else 0)
+        elif floor == 0 and slot.concurrency < self.max_concurrency:
+            slot.concurrency += 1
+
+    def _set_crawl_delay(self, state, slot, response, spider):
+        if response.status != 200:
+            return
+        parser = RobotFileParser()
+        try:
+            parser.parse(response.text.splitlines())
+        except (AttributeError, UnicodeDecodeError):
+            return
+        user_agent = getattr(spider, 'user_agent', None) or self.crawler.settings.get('USER_AGENT') or '*'
+        crawl_delay = parser.crawl_delay(user_agent)
+        if crawl_delay:
+            state.crawl_delay = min(float(crawl_delay), self.max_delay)
+            slot.delay = max(slot.delay, state.crawl_delay)
+            # Only one request at a time for a site asks for crawl delay.
+            slot.concurrency = self.min_concurrency
+
+    @staticmethod
+    def _get_retry_after(response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP date is not supported, the normal backoff applies.
+            return None
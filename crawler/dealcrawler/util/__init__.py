@@ -1 +1,2 @@
 from .helper import *
+from .jsextract import *
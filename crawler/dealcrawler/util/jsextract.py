@@ -0,0 +1,154 @@
+"""
+Extract JSON and relaxed JavaScript literals from scripts and JSONP responses.
+
+Text is scanned by compiled regular expressions which skip string literals (with escapes) as a whole,
+so brackets and quotes inside strings don't confuse bracket matching, and only brackets are visited
+in Python instead of every character. JSON is parsed by the C decoder, relaxed literals are rewritten
+to JSON by regex substitutions first. Both str and bytes (e.g. response.body) are supported.
+"""
+
+import json
+import re
+from functools import lru_cache
+
+__all__ = ['extract_balanced', 'loads_js', 'loads_jsonp']
+
+# String literals, unrolled loop form is much faster than an alternation per character.
+_DQ_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_SQ_STRING = r"'[^'\\]*(?:\\.[^'\\]*)*'"
+
+# String literals are split from code, so code is rewritten by a few regex substitutions without Python callbacks.
+_JS_STRING_SPLIT = re.compile('({0}|{1})'.format(_DQ_STRING, _SQ_STRING), re.DOTALL)
+# Code of all parts is joined by this char to rewrite it at once, it can't be in code outside strings.
+_CODE_SEPARATOR = '\x00'
+# Unquoted object keys, e.g. {id: 1}, the leading brace or comma makes the scan fast.
+_JS_KEY = re.compile(r'[{,]\s*[A-Za-z_$][\w$]*\s*:')
+# Keys are looked for in this many chars of code first, see _rewrite_js_code.
+_KEY_SAMPLE_SIZE = 1024
+_JS_KEY_NAME = re.compile(r'[A-Za-z_$][\w$]*')
+_JS_UNDEFINED = re.compile(r'(?<![\w$.])undefined(?![\w$])')
+_JS_TRAILING_COMMA = re.compile(r',(\s*[\]}])')
+# Escapes and double quotes in a single quoted string.
+_SQ_ESCAPE = re.compile(r'\\.|"', re.DOTALL)
+
+
+@lru_cache(maxsize=16)
+def _bracket_pattern(open_char, close_char, is_bytes):
+    pattern = '{0}|{1}|[{2}{3}]'.format(_DQ_STRING, _SQ_STRING, re.escape(open_char), re.escape(close_char))
+    return re.compile(pattern.encode('ascii') if is_bytes else pattern, re.DOTALL)
+
+
+def extract_balanced(text, char_pair=('[', ']'), offset=0):
+    """
+    Extract the first balanced open & close chars after offset, brackets inside string literals are ignored.
+    For example, 'showMap([{name: "a]"}], 1)' -> '[{name: "a]"}]'
+    :param text: str or bytes, e.g. script text or response.body.
+    :param char_pair: a tuple contains open & close char.
+    :param offset: start point to search.
+    :return: substring (or bytes) which includes open & close char.
+    """
+    open_char, close_char = char_pair
+    if len(open_char) != 1 or len(close_char) != 1:
+        raise ValueError('Invalid close tag characters, open & close tag length must be 1.')
+    if len(text) <= offset or len(text) < 2:
+        raise ValueError('Invalid offset value.')
+    is_bytes = isinstance(text, bytes)
+    if is_bytes:
+        open_token, close_token = open_char.encode('ascii'), close_char.encode('ascii')
+    else:
+        open_token, close_token = open_char, close_char
+    depth = 0
+    start = -1
+    for m in _bracket_pattern(open_char, close_char, is_bytes).finditer(text, offset):
+        token = m.group()
+        if token == open_token:
+            if depth == 0:
+                start = m.start()
+            depth += 1
+        elif token == close_token:
+            if depth == 0:
+                raise ValueError('Invalid str value, close tag before open tag')
+            depth -= 1
+            if depth == 0:
+                return text[start:m.end()]
+    if depth > 0:
+        raise ValueError('Invalid str value, open tag and close tag are not paired.')
+    # No open char after offset.
+    return text[0:0]
+
+
+def loads_js(text):
+    """
+    Parse a JSON or relaxed JavaScript literal, which may have unquoted keys, single quoted strings,
+    trailing commas and undefined. Control characters are allowed in strings.
+    :param text: str or bytes.
+    """
+    try:
+        # Most data is valid JSON, the C decoder is tried first.
+        return json.loads(text, strict=False)
+    except ValueError:
+        pass
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    if "'" in text or '\\' in text:
+        parts = _JS_STRING_SPLIT.split(text)
+        parts[1::2] = [p if p[0] == '"' else '"' + _SQ_ESCAPE.sub(_rewrite_sq_escape, p[1:-1]) + '"'
+                       for p in parts[1::2]]
+        quote = ''
+    else:
+        # Only double quoted strings without escapes, e.g. lasoo store map, they are split at quotes
+        # by str.split which is much faster than the regex, the quotes are put back on join.
+        parts = text.split('"')
+        quote = '"'
+    # Code and strings alternate, code comes first and last.
+    code = _CODE_SEPARATOR.join(parts[0::2])
+    try:
+        parts[0::2] = _rewrite_js_code(code, complete=False).split(_CODE_SEPARATOR)
+        return json.loads(quote.join(parts), strict=False)
+    except ValueError:
+        parts[0::2] = _rewrite_js_code(code, complete=True).split(_CODE_SEPARATOR)
+        return json.loads(quote.join(parts), strict=False)
+
+
+def _rewrite_js_code(code, complete):
+    """
+    Rewrite code (without strings) of a relaxed JavaScript literal to JSON.
+    :param complete: look for keys in all code and remove trailing commas. Otherwise only keys
+        in the head of code are quoted, objects in a list normally have the same keys, JSON decoder fails
+        if there are other keys.
+    """
+    end = len(code) if complete else _KEY_SAMPLE_SIZE
+    # Keys repeat in a list of objects, each distinct key is quoted by one str.replace,
+    # which is much faster than a regex substitution per key.
+    for token in set(_JS_KEY.findall(code, 0, end)):
+        name = _JS_KEY_NAME.search(token)
+        code = code.replace(token, '{0}"{1}"{2}'.format(token[:name.start()], name.group(), token[name.end():]))
+    if 'undefined' in code:
+        code = _JS_UNDEFINED.sub('null', code)
+    if complete and ',' in code:
+        code = _JS_TRAILING_COMMA.sub(r'\1', code)
+    return code
+
+
+def loads_jsonp(body):
+    """
+    Parse the data of a JSONP response, e.g. b'cb123({"a": 1});'.
+    The callback name is not checked, a cached response may have the callback of another request.
+    :param body: str or bytes, e.g. response.body.
+    """
+    if isinstance(body, bytes):
+        # JSON decoder of str is faster than of bytes, which detects encoding first.
+        body = body.decode('utf-8')
+    start, end = body.find('('), body.rfind(')')
+    if start >= 0 and end > start:
+        body = body[start + 1:end]
+    return loads_js(body)
+
+
+def _rewrite_sq_escape(m):
+    token = m.group()
+    if token == '"':
+        return '\\"'
+    if token == "\\'":
+        return "'"
+    return token
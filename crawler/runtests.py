@@ -0,0 +1,17 @@
+"""
+Run tests of crawler, in crawler directory:
+    python runtests.py [test labels]
+Tests run by the test runner of django project, on a test database.
+"""
+import sys
+
+# Add django project path and set up django, like scrapy does for spiders.
+import dealcrawler.settings
+from django.conf import settings
+from django.test.utils import get_runner
+
+
+if __name__ == '__main__':
+    runner = get_runner(settings)()
+    failures = runner.run_tests(sys.argv[1:] or ['tests'])
+    sys.exit(bool(failures))
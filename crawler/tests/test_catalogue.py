@@ -0,0 +1,62 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from dealcrawler.spiders.nz.lasoo.catalogue import CatalogueRegistry
+
+
+class CatalogueRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'catalogues.json')
+        self.expiry = time.time() + 3600
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_signature(self):
+        catalogue = {'startDate': '2018-03-01', 'expiryDate': '2018-03-07', 'numberPages': 12}
+        signature = CatalogueRegistry.make_signature(catalogue)
+        self.assertNotEqual(signature, CatalogueRegistry.make_signature(dict(catalogue, numberPages=13)))
+
+    def test_saved_when_all_requests_finished(self):
+        registry = CatalogueRegistry(self.path)
+        registry.start(1, 'sig', self.expiry)
+        registry.add_requests(1, 2)
+        self.assertFalse(registry.finish_request(1))
+        self.assertFalse(registry.finish_request(1))
+        self.assertTrue(registry.finish_request(1))
+        registry.save()
+        self.assertTrue(CatalogueRegistry(self.path).is_unchanged(1, 'sig'))
+        self.assertFalse(CatalogueRegistry(self.path).is_unchanged(1, 'other'))
+
+    def test_not_saved_when_a_request_failed(self):
+        registry = CatalogueRegistry(self.path)
+        registry.start(1, 'sig', self.expiry)
+        registry.add_requests(1)
+        registry.finish_request(1)
+        registry.save()
+        self.assertFalse(CatalogueRegistry(self.path).is_unchanged(1, 'sig'))
+
+    def test_expired_catalogues_removed(self):
+        with open(self.path, 'w') as f:
+            json.dump({'1': {'signature': 'sig', 'expiry': time.time() - 1}}, f)
+        registry = CatalogueRegistry(self.path)
+        self.assertTrue(registry.is_unchanged(1, 'sig'))
+        registry.save()
+        self.assertFalse(CatalogueRegistry(self.path).is_unchanged(1, 'sig'))
+
+    def test_restore_pending(self):
+        registry = CatalogueRegistry(self.path)
+        registry.start(1, 'sig', self.expiry)
+        registry.finish_request(1)
+        # Interrupted crawl job is resumed by a new process.
+        resumed = CatalogueRegistry(self.path)
+        resumed.restore(registry.pending)
+        resumed.save()
+        self.assertTrue(CatalogueRegistry(self.path).is_unchanged(1, 'sig'))
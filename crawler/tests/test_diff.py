@@ -0,0 +1,66 @@
+import unittest
+
+from django.db import connection
+from django.test import TestCase
+
+from country.models import Country
+from product.models import Product
+from region.models import Region
+from retailer.models import Retailer, RetailerProperty
+from source.models import DataSource
+from store.models import Store
+from dealcrawler.common.diff import sync_m2m, sync_properties
+
+
+class SyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(id=1, name='New Zealand', country_code='NZ')
+        datasource = DataSource.objects.create(id=1, name='example', display_name='Example',
+                                               site='https://example.com', country=country)
+        cls.retailer = Retailer.objects.create(name='shop', display_name='Shop', country=country,
+                                               datasource=datasource)
+        region = Region.objects.create(name='auckland', display_name='Auckland', country=country)
+        cls.stores = [Store.objects.create(retailer=cls.retailer, region=region, name=name, display_name=name)
+                      for name in ('a', 'b', 'c')]
+        cls.product = Product.objects.create(retailer=cls.retailer, title='Milk', price='3.50',
+                                             landing_page='https://example.com/milk',
+                                             promotion_start_date=1520000000, promotion_end_date=1520600000)
+
+    def make_props(self, **values):
+        return [RetailerProperty(retailer=self.retailer, name=name, value=value) for name, value in values.items()]
+
+    def test_sync_properties_adds_and_keeps(self):
+        RetailerProperty.objects.bulk_create(self.make_props(a='1', b='2'))
+        result = sync_properties(RetailerProperty, 'retailer_id', self.retailer.properties.all(),
+                                 self.make_props(a='1', c='3'))
+        self.assertEqual([p.name for p in result.added], ['c'])
+        self.assertEqual([p.name for p in result.unchanged], ['a'])
+        self.assertEqual([p.name for p in result.deleted], ['b'])
+        # Missing properties are kept by default.
+        self.assertEqual(dict(self.retailer.properties.values_list('name', 'value')), {'a': '1', 'b': '2', 'c': '3'})
+
+    def test_sync_properties_deletes_missing(self):
+        RetailerProperty.objects.bulk_create(self.make_props(a='1', b='2'))
+        sync_properties(RetailerProperty, 'retailer_id', self.retailer.properties.all(),
+                        self.make_props(a='1'), delete_missing=True)
+        self.assertEqual(dict(self.retailer.properties.values_list('name', 'value')), {'a': '1'})
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'bulk_update is implemented for PostgreSQL only.')
+    def test_sync_properties_updates(self):
+        RetailerProperty.objects.bulk_create(self.make_props(a='1', b='2'))
+        result = sync_properties(RetailerProperty, 'retailer_id', self.retailer.properties.all(),
+                                 self.make_props(a='1', b='3'))
+        self.assertEqual([(ex_prop.name, prop.value) for ex_prop, prop in result.updated], [('b', '3')])
+        self.assertEqual(dict(self.retailer.properties.values_list('name', 'value')), {'a': '1', 'b': '3'})
+
+    def test_sync_m2m_inserts_missing_links(self):
+        through = Product.stores.through
+        self.product.stores.add(self.stores[0], self.stores[1])
+        existing = through.objects.filter(product_id=self.product.pk).values_list('product_id', 'store_id')
+        incoming = [(self.product.pk, store.pk) for store in (self.stores[1], self.stores[2])]
+        result = sync_m2m(through, 'product_id', 'store_id', list(existing), incoming)
+        self.assertEqual(result.added, [(self.product.pk, self.stores[2].pk)])
+        # Links are never deleted.
+        self.assertEqual(set(self.product.stores.all()), set(self.stores))
@@ -0,0 +1,41 @@
+from django.test import SimpleTestCase
+
+from dealcrawler.util.jsextract import extract_balanced, loads_js, loads_jsonp
+
+
+class ExtractBalancedTests(SimpleTestCase):
+
+    def test_brackets_in_strings(self):
+        script = 'showMap([{name: "a]", note: \'b[\'}, [1, 2]], 1)'
+        self.assertEqual(extract_balanced(script), '[{name: "a]", note: \'b[\'}, [1, 2]]')
+
+    def test_escaped_quote(self):
+        script = 'x = {"a": "say \\"}\\"", "b": {}};'
+        self.assertEqual(extract_balanced(script, ('{', '}')), '{"a": "say \\"}\\"", "b": {}}')
+
+    def test_bytes_and_offset(self):
+        body = b'[0] cb([1, [2]]);'
+        self.assertEqual(extract_balanced(body, ('[', ']'), body.index(b'cb')), b'[1, [2]]')
+
+    def test_no_open_char(self):
+        self.assertEqual(extract_balanced('no list here'), '')
+
+    def test_unbalanced(self):
+        with self.assertRaises(ValueError):
+            extract_balanced('[[1]')
+        with self.assertRaises(ValueError):
+            extract_balanced('] [1]')
+        with self.assertRaises(ValueError):
+            extract_balanced('[1]', ('[[', ']'))
+
+    def test_loads_relaxed_js(self):
+        self.assertEqual(loads_js("{id: 1, name: 'it\\'s \"x\"', tags: [undefined, 'a',],}"),
+                         {'id': 1, 'name': 'it\'s "x"', 'tags': [None, 'a']})
+        self.assertEqual(loads_jsonp(b'mf123({"a": [1]});'), {'a': [1]})
+
+    def test_loads_keys_after_head_of_code(self):
+        items = ','.join('{{id: {0}, name: "x, y: z"}}'.format(i) for i in range(500))
+        data = loads_js('[' + items + ', {id: 500, other: [1, 2,],}]')
+        self.assertEqual(len(data), 501)
+        self.assertEqual(data[0], {'id': 0, 'name': 'x, y: z'})
+        self.assertEqual(data[-1], {'id': 500, 'other': [1, 2]})
@@ -0,0 +1,79 @@
+from django.test import SimpleTestCase, TestCase
+
+from country.models import Country
+from product.models import Product, ProductProperty
+from retailer.models import Retailer
+from source.models import DataSource
+from store.models import Store
+from dealcrawler.model.items import ProductItem
+from dealcrawler.spiders.data.product_repository import ProductRepository
+
+
+class ContentHashTests(SimpleTestCase):
+
+    def setUp(self):
+        self.prod = Product(title='Milk 2L', description='', price='3.5', unit='', saved=None,
+                            promotion_start_date=1520000000, promotion_end_date=1520600000)
+
+    def calculate(self, prod=None, **kwargs):
+        return ProductRepository.calculate_content_hash(prod or self.prod, **kwargs)
+
+    def test_stable(self):
+        self.assertEqual(len(self.calculate()), 16)
+        # Price is normalized, 3.5 from a spider and 3.50 from database are the same.
+        self.assertEqual(self.calculate(), self.calculate(Product(
+            title='Milk 2L', description='', price='3.50', unit='', saved=None,
+            promotion_start_date=1520000000, promotion_end_date=1520600000)))
+
+    def test_changed_content(self):
+        content_hash = self.calculate()
+        self.assertNotEqual(self.calculate(image_url='https://example.com/milk.jpg'), content_hash)
+        self.prod.promotion_end_date += 1
+        self.assertNotEqual(self.calculate(), content_hash)
+
+    def test_order_of_stores_and_properties(self):
+        stores = [Store(), Store()]
+        props = [ProductProperty(name='a', value='1'), ProductProperty(name='b', value='2')]
+        self.assertEqual(self.calculate(stores=stores, properties=props),
+                         self.calculate(stores=stores[::-1], properties=props[::-1]))
+        self.assertNotEqual(self.calculate(properties=props),
+                            self.calculate(properties=[ProductProperty(name='a', value='2')] + props[1:]))
+
+
+class UnchangedProductTests(TestCase):
+
+    FIELDS = {
+        'title': 'Milk 2L',
+        'description': '',
+        'price': '3.50',
+        'unit': '',
+        'landing_page': 'https://example.com/milk',
+        'promotion_start_date': 1520000000,
+        'promotion_end_date': 4000000000,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(id=1, name='New Zealand', country_code='NZ')
+        datasource = DataSource.objects.create(id=1, name='example', display_name='Example',
+                                               site='https://example.com', country=country)
+        cls.retailer = Retailer.objects.create(name='shop', display_name='Shop', country=country,
+                                               datasource=datasource)
+
+    def crawl(self, active):
+        prod = Product(retailer=self.retailer, ready=True, active=active, **self.FIELDS)
+        prod.content_hash = ProductRepository.calculate_content_hash(prod)
+        prod.save()
+        # Writes are buffered, nothing is flushed in the test.
+        repo = ProductRepository(Product.objects.all(), write_batch_size=100, write_flush_interval=3600)
+        db_prod = repo.add_or_update_prod_in_db(ProductItem(retailer=self.retailer, **self.FIELDS), None)
+        self.assertEqual(db_prod.pk, prod.pk)
+        return repo, db_prod
+
+    def test_unchanged_active_product_not_written(self):
+        repo, db_prod = self.crawl(active=True)
+        self.assertNotIn(db_prod.pk, repo._updated_prods)
+
+    def test_unchanged_inactive_product_reactivated(self):
+        repo, db_prod = self.crawl(active=False)
+        self.assertIs(repo._updated_prods[db_prod.pk].active, True)
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.test import TestCase
+
+from country.models import Country
+from dealcrawler import squeues
+
+
+class ModelRefPickleTests(TestCase):
+
+    def setUp(self):
+        self.country = Country.objects.create(id=1, name='New Zealand', country_code='NZ')
+
+    def test_saved_instance_loaded_fresh(self):
+        data = squeues.dumps({'country': self.country})
+        Country.objects.filter(pk=1).update(name='Aotearoa')
+        self.assertEqual(squeues.loads(data)['country'].name, 'Aotearoa')
+
+    def test_instances_not_shared_by_loads(self):
+        data = squeues.dumps([self.country, self.country])
+        first, second = squeues.loads(data)
+        self.assertIs(first, second)
+        self.assertIsNot(squeues.loads(data)[0], first)
+
+    def test_unsaved_instance_pickled_by_value(self):
+        # Primary key is set before the instance is saved.
+        country = Country(id=2, name='Australia', country_code='AU')
+        loaded = squeues.loads(squeues.dumps({'country': country}))['country']
+        self.assertEqual((loaded.pk, loaded.name), (2, 'Australia'))
+        self.assertFalse(Country.objects.filter(pk=2).exists())
+
+    def test_deleted_instance(self):
+        data = squeues.dumps({'country': self.country})
+        self.country.delete()
+        with self.assertRaises(ObjectDoesNotExist):
+            squeues.loads(data)
+
+    def test_queue_drops_request_of_deleted_instance(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            q = squeues.ModelRefPickleFifoDiskQueue(os.path.join(temp_dir, 'q'))
+            q.push({'url': 'a', 'meta': {'country': self.country}})
+            q.push({'url': 'b'})
+            self.country.delete()
+            with self.assertLogs('dealcrawler.squeues', level='WARNING'):
+                self.assertEqual(q.pop(), {'url': 'b'})
+            self.assertIsNone(q.pop())
+            q.close()
+        finally:
+            shutil.rmtree(temp_dir)
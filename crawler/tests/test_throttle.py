@@ -0,0 +1,93 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request, TextResponse
+from scrapy.settings import Settings
+
+from dealcrawler.throttle import AdaptiveThrottle
+
+
+class _Slot:
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.concurrency = 1
+
+
+class AdaptiveThrottleTests(SimpleTestCase):
+
+    SLOT = 'www.example.com'
+
+    def setUp(self):
+        self.slot = _Slot(1.0)
+        self.crawler = mock.Mock()
+        self.crawler.settings = Settings({
+            'ADAPTIVE_THROTTLE_ENABLED': True,
+            'ADAPTIVE_THROTTLE_MAX_CONCURRENCY': 4,
+        })
+        self.crawler.engine.downloader.slots = {self.SLOT: self.slot}
+        self.throttle = AdaptiveThrottle.from_crawler(self.crawler)
+
+    def download(self, status=200, latency=0.1, path='/deals', headers=None, flags=None, body=b''):
+        url = 'https://{0}{1}'.format(self.SLOT, path)
+        request = Request(url, meta={'download_slot': self.SLOT, 'download_latency': latency})
+        response = TextResponse(url, status=status, headers=headers, flags=flags, body=body, encoding='utf-8')
+        self.throttle._response_downloaded(response, request, mock.Mock(user_agent='test'))
+
+    def test_not_enabled(self):
+        self.crawler.settings = Settings()
+        with self.assertRaises(NotConfigured):
+            AdaptiveThrottle.from_crawler(self.crawler)
+
+    def test_speed_up_delay_first_then_concurrency(self):
+        delays = []
+        for _ in range(5):
+            self.download()
+            delays.append(self.slot.delay)
+        self.assertEqual(delays, [0.5, 0.25, 0.125, 0.0625, 0])
+        self.assertEqual(self.slot.concurrency, 1)
+        self.download()
+        self.assertEqual(self.slot.concurrency, 2)
+        # One step per round of as many responses as concurrent requests.
+        self.download()
+        self.assertEqual(self.slot.concurrency, 2)
+        self.download()
+        self.assertEqual(self.slot.concurrency, 3)
+        for _ in range(20):
+            self.download()
+        self.assertEqual(self.slot.concurrency, 4)
+
+    def test_back_off_concurrency_first_then_delay(self):
+        self.download()
+        self.slot.delay, self.slot.concurrency = 0, 4
+        self.download(status=503)
+        self.assertEqual((self.slot.delay, self.slot.concurrency), (0, 2))
+        self.download(status=503)
+        self.assertEqual((self.slot.delay, self.slot.concurrency), (0, 1))
+        self.download(status=503)
+        self.assertEqual((self.slot.delay, self.slot.concurrency), (1.0, 1))
+        self.download(status=429)
+        self.assertEqual(self.slot.delay, 2.0)
+
+    def test_retry_after(self):
+        self.download(status=429, headers={'Retry-After': '10'})
+        self.assertEqual(self.slot.delay, 10)
+        # HTTP date is not supported.
+        self.download(status=429, headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertEqual(self.slot.delay, 20)
+
+    def test_slow_down_on_high_latency(self):
+        self.download(latency=5)
+        self.assertEqual(self.slot.delay, 1.5)
+
+    def test_cached_response_ignored(self):
+        self.download(flags=['cached'])
+        self.assertEqual(self.slot.delay, 1.0)
+
+    def test_crawl_delay_is_floor(self):
+        self.download(path='/robots.txt', body=b'User-agent: *\nCrawl-delay: 3\n')
+        self.assertEqual(self.slot.delay, 3)
+        for _ in range(5):
+            self.download()
+        self.assertEqual((self.slot.delay, self.slot.concurrency), (3, 1))
@@ -19,7 +19,7 @@ class Property (models.Model):
         return cls.objects.filter(name__startswith=cls.INTERNAL_PROPERTY_PREFIX, **kwargs)
 
     def value_equals_to(self, other):
-        if other is not Property:
+        if not isinstance(other, Property):
             return False
         return self.name == other.name \
                and self.value == other.value
@@ -1,21 +1,27 @@
 import hashlib
 
+# Bytes read at a time when hashing a file object.
+HASH_CHUNK_SIZE = 64 * 1024
 
-def calculate_hash(obj):
+
+def calculate_hash(obj, algorithm='sha256'):
     """
-    Calculate obj md5 hash
+    Calculate obj hash, file object is hashed incrementally, it is never read into memory at once.
     :param obj: a str/bytes/file object.
+    :param algorithm: hashlib algorithm name.
     :return: hash string.
     """
+    hash_calc = hashlib.new(algorithm)
     if isinstance(obj, str):
-        obj_bytes = str.encode('utf-8')
-    elif isinstance(obj, bytes):
-        obj_bytes = bytes
+        hash_calc.update(obj.encode('utf-8'))
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        hash_calc.update(obj)
     elif hasattr(obj, 'seek') and callable(obj.seek) and hasattr(obj, 'read') and callable(obj.read):
         obj.seek(0)
-        obj_bytes = obj.read()
+        for chunk in iter(lambda: obj.read(HASH_CHUNK_SIZE), b''):
+            hash_calc.update(chunk)
+        # Leave file at the start for next reader.
+        obj.seek(0)
     else:
         raise ValueError('Unsupported target object for hashing.')
-    hash_calc = hashlib.md5()
-    hash_calc.update(obj_bytes)
     return hash_calc.hexdigest()
@@ -0,0 +1,152 @@
+import os
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+from common.func import calculate_size_by_long_edge, calculate_size_by_short_edge
+
+# Perceptual hash (dHash) compares adjacent pixels of a DHASH_SIZE x DHASH_SIZE grayscale image.
+DHASH_SIZE = 8
+
+# Rendition length is the length of the long or the short edge.
+EDGE_LONG = 'long'
+EDGE_SHORT = 'short'
+
+FORMAT_JPG = 'jpg'
+FORMAT_WEBP = 'webp'
+_PIL_FORMATS = {
+    FORMAT_JPG: 'JPEG',
+    FORMAT_WEBP: 'WEBP',
+}
+
+
+def open_image(obj):
+    """
+    :param obj: image bytes or file object.
+    :return: PIL image.
+    """
+    if isinstance(obj, (bytes, bytearray)):
+        obj = BytesIO(obj)
+    return Image.open(obj)
+
+
+def rendition_size(size, length, edge=EDGE_LONG):
+    """
+    Size of image resized to a rendition length, images are never enlarged.
+    :param size: (width, height) of image.
+    :param length: length of the long or short edge.
+    :param edge: EDGE_LONG or EDGE_SHORT.
+    :return: (width, height).
+    """
+    if edge == EDGE_SHORT:
+        if min(size) <= length:
+            return size
+        return calculate_size_by_short_edge(size, length)
+    if max(size) <= length:
+        return size
+    return calculate_size_by_long_edge(size, length)
+
+
+def plan_renditions(size, lengths, edge, formats):
+    """
+    :param size: (width, height) of original image.
+    :param lengths: rendition lengths, e.g. (160, 320, 640).
+    :param edge: EDGE_LONG or EDGE_SHORT.
+    :param formats: rendition formats, e.g. (FORMAT_JPG, FORMAT_WEBP).
+    :return: list of (length, format, (width, height)), lengths which would produce the same size
+        as a smaller length (image is smaller than them) are skipped.
+    """
+    renditions = []
+    seen_sizes = set()
+    for length in sorted(lengths):
+        new_size = rendition_size(size, length, edge)
+        if new_size in seen_sizes:
+            continue
+        seen_sizes.add(new_size)
+        renditions.extend((length, fmt, new_size) for fmt in formats)
+    return renditions
+
+
+def encode_image(image, fmt, params):
+    """
+    :param image: PIL image.
+    :param fmt: FORMAT_JPG or FORMAT_WEBP.
+    :param params: save params, e.g. IMAGE_JPG_QUALITY_PARAMS.
+    :return: encoded bytes.
+    """
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, _PIL_FORMATS[fmt], **params)
+    return output.getvalue()
+
+
+def make_renditions(image, lengths, edge, format_params):
+    """
+    Resize an image to several lengths and encode each size in several formats.
+    Each size is resized from the previous larger size, which is much faster than resizing from original.
+    :param image: PIL image.
+    :param lengths: rendition lengths, e.g. (160, 320, 640).
+    :param edge: EDGE_LONG or EDGE_SHORT.
+    :param format_params: dict of format -> save params, e.g. {FORMAT_JPG: IMAGE_JPG_QUALITY_PARAMS}.
+    :return: list of (length, format, (width, height), bytes).
+    """
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    planned = plan_renditions(image.size, lengths, edge, list(format_params))
+    renditions = []
+    resized = image
+    # Largest first.
+    for length, fmt, size in sorted(planned, key=lambda r: r[0], reverse=True):
+        if resized.size != size:
+            resized = resized.resize(size, Image.LANCZOS)
+        renditions.append((length, fmt, size, encode_image(resized, fmt, format_params[fmt])))
+    return renditions
+
+
+def calculate_dhash(image):
+    """
+    Calculate difference hash of an image, resized or re-encoded copies of an image have the same hash.
+    :param image: PIL image.
+    :return: hex string of 64 bits hash.
+    """
+    pixels = list(image.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(DHASH_SIZE):
+        for col in range(DHASH_SIZE):
+            i = row * (DHASH_SIZE + 1) + col
+            value = (value << 1) | (pixels[i] > pixels[i + 1])
+    return '{0:016x}'.format(value)
+
+
+def save_renditions(data, targets, edge, format_params, perceptual_hash=False):
+    """
+    Make renditions of an image and write them to files.
+    It is a top level function with plain arguments, so it can run in a process pool.
+    :param data: original image bytes.
+    :param targets: dict of (length, format) -> file path, see plan_renditions.
+    :param edge: EDGE_LONG or EDGE_SHORT.
+    :param format_params: dict of format -> save params.
+    :param perceptual_hash: calculate dHash of the image.
+    :return: dHash if perceptual_hash is True, otherwise None.
+    """
+    with open_image(data) as image:
+        dhash = calculate_dhash(image) if perceptual_hash else None
+        if targets:
+            lengths = {length for length, _ in targets}
+            formats = {fmt: params for fmt, params in format_params.items() if any(f == fmt for _, f in targets)}
+            for length, fmt, _, content in make_renditions(image, lengths, edge, formats):
+                file_path = targets.get((length, fmt))
+                if file_path is not None:
+                    _write_file(file_path, content)
+    return dhash
+
+
+def _write_file(file_path, data):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # Write to a temp file then rename, readers never see a partial image.
+    temp_path = '{0}.{1}.{2}.tmp'.format(file_path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, file_path)
@@ -54,7 +54,7 @@ def decrypt_code(signed_code, secret):
         data_bytes = base64.urlsafe_b64decode(encoded_data_bytes)
         sig_bytes = base64.urlsafe_b64decode(encoded_sig_bytes)
     except Exception as e:
-        raise InvalidSignature(e.message)
+        raise InvalidSignature(str(e))
     # HMAC can only handle ascii (byte) strings
     # http://bugs.python.org/issue5285
     secret_bytes = secret.encode('ascii')
@@ -63,7 +63,7 @@ def decrypt_code(signed_code, secret):
         raise InvalidSignature('Invalid signature in secret code.')
 
     data_dict = json.loads(data_bytes.decode('utf-8'))
-    if 'data' not in data_dict or 'algo' not in data_dict:
+    if not isinstance(data_dict, dict) or 'data' not in data_dict or 'algo' not in data_dict:
         raise InvalidSignature('Invalid data in secret code.')
     algo = data_dict['algo']
     if algo != ALGO_HMAC_SHA256:
@@ -1,8 +1,13 @@
 from functools import wraps
 
-from .exception import UnauthorizedUser, UnsupportedHttpMethod
+from django.http import HttpResponse
+
+from .exception import ApiError, UnauthorizedUser, UnsupportedHttpMethod
+from .result import ApiResult
+
+CONTENT_TYPE_JSON = "application/json"
+
 
-ß
 def login_required(func):
     @wraps(func)
     def check_user_login(request, *args, **kwargs):
@@ -38,3 +43,20 @@ def redirect_after_signin(func):
         return resp
 
     return inner
+
+
+def api_error_response(func):
+    """
+    Return the ApiError raised by view as an ApiResult response with the http status code of the error,
+    e.g. 400 for InvalidInput and 404 for ObjectNotFound.
+    ApiErrorMiddleware is not installed (MIDDLEWARE_CLASSES is ignored by Django 2.x),
+    so views handle their errors with this decorator.
+    """
+    @wraps(func)
+    def inner(request, *args, **kwargs):
+        try:
+            return func(request, *args, **kwargs)
+        except ApiError as error:
+            result = ApiResult(code=error.error_code, message=error.public_message)
+            return HttpResponse(result.to_json(), content_type=CONTENT_TYPE_JSON, status=error.http_status_code)
+    return inner
@@ -1,4 +1,4 @@
-from django.http import HttpResponse, HttpResponseServerError
+from django.http import HttpResponse, HttpResponseServerError, StreamingHttpResponse
 
 from ..exception import ApiError, UnknownError
 from ..result import ApiResult
@@ -17,7 +17,7 @@ class ApiResponseMiddleware:
         if isinstance(response, ApiResult):
             content = response.to_json()
             return HttpResponse(content, content_type=CONTENT_TYPE_JSON)
-        elif isinstance(response, HttpResponse):
+        elif isinstance(response, (HttpResponse, StreamingHttpResponse)):
             return response
         else:
             # Response middleware happens after view & exception middleware.
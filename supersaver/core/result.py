@@ -1,37 +1,98 @@
-import json  # Compare performance between json and simplejson
-
+from django.db.models import Model
 from django.db.models.query import QuerySet
 
-from common.func import convert_model_to_dict, convert_models_to_dict_list
+from common.func import convert_model_to_dict
+from .serializer import ModelSerializer, dumps
 
 API_SUCCESS_MESSAGE = "success"
 API_SUCCESS_CODE = 0
+# Number of rows in one chunk of streamed response.
+STREAM_CHUNK_ROWS = 100
 
 
 class ApiResult(object):
 
-    def __init__(self, data=None, code: int=API_SUCCESS_CODE, message: str=API_SUCCESS_MESSAGE):
+    def __init__(self, data=None, code: int=API_SUCCESS_CODE, message: str=API_SUCCESS_MESSAGE,
+                 next_cursor: str=None, model=None):
+        """
+        :param data: a model instance, a dict, a list of them or a QuerySet.
+        :param model: model class of the rows, required when data are QuerySet.values() dicts.
+        """
         self.code = code
         self.message = message
+        # Continuation token of next page for keyset paged result, None if there is no more page.
+        self.next_cursor = next_cursor
+        self.data = None
+        # Rows of a list result, they are converted when result is serialized.
+        self._rows = None
+        self._serializer = None
         if data is None:
-            self.data = None
             return
-        if isinstance(data, (list, tuple)):
-            self.data = convert_models_to_dict_list(data)
-        elif isinstance(data, QuerySet):
-            # Get data only when iterate QuerySet.
-            results = list(data)
-            self.data = convert_models_to_dict_list(results)
+        if isinstance(data, QuerySet):
+            serializer = ModelSerializer.for_model(data.model)
+            if data._fields is None:
+                # Fetch only the serialized columns.
+                data = data.values(*serializer.field_names)
+            self._rows = data
+            self._serializer = serializer
+        elif isinstance(data, (list, tuple)):
+            self._rows = data
+            if model is not None:
+                self._serializer = ModelSerializer.for_model(model)
+        elif isinstance(data, Model):
+            self.data = ModelSerializer.for_model(type(data)).encode_instance(data)
         else:
             self.data = convert_model_to_dict(data)
 
     def to_json(self):
-        data = self.data
-        if data is None:
-            data = {}
+        result = self._header()
+        if self._rows is not None:
+            result['data'] = list(self._iter_rows())
+        else:
+            result['data'] = self.data if self.data is not None else {}
+        return dumps(result)
+
+    def iter_json(self):
+        """
+        Serialize result to json in chunks, for StreamingHttpResponse.
+        Rows of a QuerySet are fetched with a server side cursor, the whole result is never in memory.
+        """
+        if self._rows is None:
+            yield self.to_json()
+            return
+        header = dumps(self._header())
+        # Rows are the last member, so they can be written after the other members.
+        yield header[:-1] + ',"data":['
+        chunk = []
+        first = True
+        for row in self._iter_rows(streaming=True):
+            chunk.append(dumps(row))
+            if len(chunk) >= STREAM_CHUNK_ROWS:
+                yield ('' if first else ',') + ','.join(chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield ('' if first else ',') + ','.join(chunk)
+        yield ']}'
+
+    def _header(self):
         result = {
             'code': self.code,
             'message': self.message,
-            'data': data
         }
-        return json.dumps(result)
+        if self.next_cursor is not None:
+            result['next_cursor'] = self.next_cursor
+        return result
+
+    def _iter_rows(self, streaming=False):
+        rows = self._rows
+        if streaming and isinstance(rows, QuerySet):
+            rows = rows.iterator()
+        serializer = self._serializer
+        for row in rows:
+            if isinstance(row, Model):
+                yield ModelSerializer.for_model(type(row)).encode_instance(row)
+            elif serializer is not None and isinstance(row, dict):
+                yield serializer.encode_values(row)
+            else:
+                yield convert_model_to_dict(row)
@@ -0,0 +1,105 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models
+
+from common.utils.datetime import to_client_timestamp
+
+try:
+    # Optional fast json backend.
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, escape_forward_slashes=False)
+except ImportError:
+    import json
+
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _str_or_none(value):
+    return None if value is None else str(value)
+
+
+def _timestamp_or_none(value):
+    # Client can not handle 6 digit microseconds in date time iso format.
+    return None if value is None else to_client_timestamp(value)
+
+
+def _isoformat_or_none(value):
+    return None if value is None else value.isoformat()
+
+
+class ModelSerializer(object):
+    """
+    Convert model instances or QuerySet.values() rows to json compatible dicts.
+
+    The field list and the converter of each field are resolved once per model (see for_model),
+    instead of checking value types of each field in each row.
+    Relations and search vectors are not serialized.
+    """
+
+    _serializers = {}
+
+    def __init__(self, model):
+        self.model = model
+        fields = []
+        for field in model._meta.concrete_fields:
+            if field.is_relation or isinstance(field, SearchVectorField):
+                continue
+            fields.append((field.name, field.attname, self.__class__._get_converter(field)))
+        self.fields = tuple(fields)
+        self.field_names = tuple(name for name, _, _ in fields)
+
+    @classmethod
+    def for_model(cls, model):
+        """
+        Get the cached serializer of a model.
+        :param model: django model class.
+        :return: ModelSerializer instance.
+        """
+        serializer = cls._serializers.get(model)
+        if serializer is None:
+            serializer = cls(model)
+            cls._serializers[model] = serializer
+        return serializer
+
+    def encode_instance(self, obj):
+        """
+        Convert a model instance to dict.
+        :param obj: model instance.
+        :return: dict with field names as keys.
+        """
+        values = obj.__dict__
+        result = {}
+        for name, attname, convert in self.fields:
+            if attname not in values:
+                # Deferred field
+                continue
+            value = values[attname]
+            result[name] = value if convert is None else convert(value)
+        return result
+
+    def encode_values(self, row):
+        """
+        Convert a QuerySet.values() row to dict, fields not in the row are ignored.
+        :param row: dict with field names as keys.
+        :return: dict with field names as keys.
+        """
+        result = {}
+        for name, _, convert in self.fields:
+            if name not in row:
+                continue
+            value = row[name]
+            result[name] = value if convert is None else convert(value)
+        return result
+
+    @staticmethod
+    def _get_converter(field):
+        if isinstance(field, models.DateTimeField):
+            return _timestamp_or_none
+        if isinstance(field, models.DateField):
+            return _isoformat_or_none
+        if isinstance(field, (models.UUIDField, models.DecimalField)):
+            return _str_or_none
+        if isinstance(field, models.FileField):
+            return lambda value: field.storage.url(str(value)) if value else None
+        return None
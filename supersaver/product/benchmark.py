@@ -0,0 +1,205 @@
+"""
+Benchmarks of offer query and serialization hot path, see benchmark_offers command.
+
+Notes:
+    Run benchmarks against a local database, seeding inserts millions of rows.
+    All seeded data belong to retailers whose name starts with BENCHMARK_RETAILER_PREFIX.
+"""
+import math
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.result import ApiResult
+from country.models import Country
+from region.models import Region
+from retailer.models import Retailer
+from source.models import DataSource
+from store.models import Store
+from .models import ActiveOffer, Product
+from .views import OFFER_FIELDS
+
+BENCHMARK_RETAILER_PREFIX = 'benchmark-retailer-'
+BENCHMARK_LANDING_PAGE_PREFIX = 'https://benchmark.supersaver.local/offers/'
+
+_WORDS = (
+    'milk', 'bread', 'cheese', 'butter', 'yoghurt', 'apple', 'banana', 'orange', 'grape', 'kiwifruit',
+    'chicken', 'beef', 'lamb', 'pork', 'salmon', 'coffee', 'tea', 'juice', 'water', 'wine',
+    'beer', 'chocolate', 'biscuit', 'cereal', 'rice', 'pasta', 'sauce', 'soap', 'shampoo', 'tissue',
+    'organic', 'fresh', 'frozen', 'value', 'premium', 'family', 'pack', 'classic', 'natural', 'light',
+)
+SEARCH_KEYWORDS = ('milk', 'organic chicken', 'chocolate biscuit', 'fresh salmon', 'frozen')
+
+
+def seed(num_products, num_retailers=10, stores_per_retailer=5, expired_ratio=0.2, batch_size=5000, log=print):
+    """
+    Insert synthetic retailers, stores and products.
+    :param num_products: number of products to insert.
+    :param expired_ratio: ratio of expired products.
+    :return: number of inserted products.
+    """
+    rand = random.Random(num_products)
+    country = Country.objects.get(country_code='NZ')
+    datasource = DataSource.objects.order_by('id').first()
+    region = Region.objects.filter(country=country).order_by('id').first()
+    retailers, stores = [], []
+    for i in range(num_retailers):
+        retailer, _ = Retailer.objects.get_or_create(
+            name=BENCHMARK_RETAILER_PREFIX + str(i),
+            defaults={'display_name': 'Benchmark Retailer {0}'.format(i), 'country': country,
+                      'datasource': datasource})
+        retailers.append(retailer)
+        for j in range(stores_per_retailer):
+            store, _ = Store.objects.get_or_create(
+                retailer=retailer, name='benchmark store {0}'.format(j),
+                defaults={'display_name': 'Benchmark Store {0}'.format(j), 'region': region})
+            stores.append(store)
+    now = int(datetime.now().timestamp())
+    prod_stores = Product.stores.through
+    inserted = 0
+    while inserted < num_products:
+        products, links = [], []
+        for i in range(inserted, min(inserted + batch_size, num_products)):
+            title = ' '.join(rand.choice(_WORDS) for _ in range(rand.randint(2, 6)))
+            if rand.random() < expired_ratio:
+                start, end = now - 30 * 86400, now - rand.randint(1, 20 * 86400)
+            else:
+                start, end = now - rand.randint(0, 7 * 86400), now + rand.randint(3600, 14 * 86400)
+            store = rand.choice(stores)
+            product = Product(retailer_id=store.retailer_id, title=title.capitalize(),
+                              description=' '.join(rand.choice(_WORDS) for _ in range(8)),
+                              price=Decimal(rand.randint(50, 50000)) / 100, unit='ea',
+                              landing_page=BENCHMARK_LANDING_PAGE_PREFIX + str(i),
+                              promotion_start_date=start, promotion_end_date=end)
+            products.append(product)
+            links.append(prod_stores(product_id=product.id, store_id=store.id))
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            prod_stores.objects.bulk_create(links)
+        inserted += len(products)
+        log('Inserted {0}/{1} products.'.format(inserted, num_products))
+    ActiveOffer.refresh()
+    return inserted
+
+
+def clean(log=print):
+    """
+    Delete all seeded data.
+    """
+    retailers = Retailer.objects.filter(name__startswith=BENCHMARK_RETAILER_PREFIX)
+    with transaction.atomic():
+        products = Product.objects.filter(retailer__in=retailers)
+        Product.stores.through.objects.filter(product__in=products).delete()
+        deleted, _ = products.delete()
+        Store.objects.filter(retailer__in=retailers).delete()
+        retailers.delete()
+    ActiveOffer.refresh()
+    log('Deleted {0} rows.'.format(deleted))
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest rank percentile.
+    """
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100.0 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def measure(func, iterations, warmup=3):
+    """
+    Measure latency, database queries and memory allocation of a function.
+    Latency is measured without query capturing and tracemalloc, they slow down the function.
+    :return: result dict.
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    timings.sort()
+    # One more call to count queries and allocations.
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'iterations': iterations,
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'mean_ms': sum(timings) / len(timings),
+        'queries': len(queries),
+        'peak_alloc_bytes': peak,
+    }
+
+
+def get_scenarios(page_size, deep_page):
+    """
+    :return: list of (name, function) to benchmark.
+    """
+    manager = ActiveOffer.objects
+    keywords = SEARCH_KEYWORDS
+    state = {'i': 0}
+
+    def next_keywords():
+        state['i'] += 1
+        return keywords[state['i'] % len(keywords)]
+
+    return [
+        ('recent_offers_page_1', lambda: list(manager.recent_offers(1, page_size))),
+        ('recent_offers_page_deep', lambda: list(manager.recent_offers(deep_page, page_size))),
+        ('search_by_relevance_page_1', lambda: list(manager.search_by_relevance(next_keywords(), 1, page_size))),
+        ('search_by_relevance_page_deep',
+         lambda: list(manager.search_by_relevance(next_keywords(), deep_page, page_size))),
+        ('search_by_price_page_1', lambda: list(manager.search_by_price(next_keywords(), 1, page_size))),
+        ('search_by_price_page_deep', lambda: list(manager.search_by_price(next_keywords(), deep_page, page_size))),
+        ('recent_offers_by_cursor', lambda: manager.recent_offers_by_cursor(None, page_size, OFFER_FIELDS)),
+        ('search_by_relevance_by_cursor',
+         lambda: manager.search_by_relevance_by_cursor(next_keywords(), None, page_size, OFFER_FIELDS)),
+        ('api_result_to_json_models',
+         lambda: ApiResult(list(manager.recent_offers(1, page_size))).to_json()),
+        ('api_result_to_json_values',
+         lambda: ApiResult(manager.recent_offers_by_cursor(None, page_size, OFFER_FIELDS)[0],
+                           model=ActiveOffer).to_json()),
+    ]
+
+
+def run(iterations, page_size, deep_page, only=None, log=print):
+    """
+    Run benchmarks.
+    :param only: names of scenarios to run, all by default.
+    :return: report dict which can be dumped as json.
+    """
+    results = {}
+    for name, func in get_scenarios(page_size, deep_page):
+        if only and name not in only:
+            continue
+        log('Running {0}'.format(name))
+        results[name] = measure(func, iterations)
+    return {
+        'commit': _git_commit(),
+        'time': datetime.utcnow().replace(microsecond=0).isoformat(),
+        'products': Product.objects.count(),
+        'active_offers': ActiveOffer.objects.count(),
+        'page_size': page_size,
+        'deep_page': deep_page,
+        'results': results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,168 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from common.utils.datetime import from_utc_timestamp
+from common.utils.lru import LRUCache
+from .models import ActiveOffer, OfferGeneration
+
+
+class OfferCacheState(object):
+    """
+    Snapshot of what offer responses depend on: the offer generation and the promotion boundaries.
+    It is also the validator of conditional requests (version as ETag, last_modified as Last-Modified).
+    """
+
+    def __init__(self, generation, generation_time, last_boundary, boundary, checked_time, refreshed_time=None):
+        self.generation = generation
+        # Start time of the last active offer view refresh, None if it is unknown.
+        self.refreshed_time = refreshed_time
+        # Timestamps when the live offer set changed last and changes next, None if there is no such boundary.
+        self.last_boundary = last_boundary
+        self.boundary = boundary
+        self.checked_time = checked_time
+        self.version = '{0}.{1}'.format(generation, boundary or 0)
+        # Offer responses don't change unless generation is increased or a promotion boundary passed.
+        self.last_modified = generation_time
+        if last_boundary is not None:
+            self.last_modified = max(generation_time, from_utc_timestamp(last_boundary))
+
+
+class OfferCache(object):
+    """
+    Cache of serialized offer responses.
+
+    Responses are cached in a local in-process LRU tier, and in a shared tier (a django cache alias)
+    if it is configured, so other workers can reuse them.
+    An entry is valid only in the state it was created in, it expires when
+    1. offer generation is increased, crawlers do it when they finish (see invalidate).
+    2. next promotion boundary passed, an offer started or expired.
+    3. it is older than max ttl.
+    The state is read from database at most once per state check interval, cache hits do no other database work.
+    """
+
+    def __init__(self, max_entries, max_ttl, state_check_interval, shared_alias=None):
+        self.max_ttl = max_ttl
+        self.state_check_interval = state_check_interval
+        self.local = LRUCache(max_entries)
+        self.shared = caches[shared_alias] if shared_alias else None
+        self._state = None
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Make cache key from request parts, e.g. endpoint, cursor, keywords and sort order.
+        """
+        raw = '\x1f'.join('' if p is None else str(p) for p in parts)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Get cached response payload.
+        :param key: key from make_key.
+        :return: payload string, None if not cached.
+        """
+        state = self.current_state()
+        now = time.time()
+        entry = self.local.get(key)
+        if entry is not None:
+            version, expire_time, payload = entry
+            if version == state.version and expire_time > now:
+                return payload
+            self.local.pop(key)
+        if self.shared is None:
+            return None
+        entry = self.shared.get(self.__class__._shared_key(state.version, key))
+        if entry is None:
+            return None
+        expire_time, payload = entry
+        self.local.set(key, (state.version, expire_time, payload))
+        return payload
+
+    def set(self, key, payload, state=None):
+        """
+        Cache response payload.
+        :param key: key from make_key.
+        :param payload: serialized response.
+        :param state: the state which payload was created in, current state by default.
+        """
+        if state is None:
+            state = self.current_state()
+        now = time.time()
+        expire_time = now + self.max_ttl
+        if state.boundary is not None:
+            expire_time = min(expire_time, state.boundary)
+        if expire_time <= now:
+            return
+        self.local.set(key, (state.version, expire_time, payload))
+        if self.shared is not None:
+            self.shared.set(self.__class__._shared_key(state.version, key),
+                            (expire_time, payload), timeout=int(expire_time - now) + 1)
+
+    def stream(self, key, chunks):
+        """
+        Pass response chunks through and cache the whole payload after the last chunk.
+        :param key: key from make_key.
+        :param chunks: iterable of serialized response chunks.
+        """
+        state = self.current_state()
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        self.set(key, ''.join(parts), state)
+
+    def current_state(self):
+        state = self._state
+        now = time.time()
+        if state is not None and now < state.checked_time + self.state_check_interval \
+                and (state.boundary is None or now < state.boundary):
+            return state
+        generation = OfferGeneration.current()
+        if state is not None and state.generation == generation.generation \
+                and (state.boundary is None or now < state.boundary):
+            last_boundary, boundary = state.last_boundary, state.boundary
+        else:
+            last_boundary = ActiveOffer.objects.last_promotion_boundary(int(now))
+            boundary = ActiveOffer.objects.next_promotion_boundary(int(now))
+        state = OfferCacheState(generation.generation, generation.updated_time, last_boundary, boundary, now,
+                                generation.refreshed_time)
+        self._state = state
+        return state
+
+    def invalidate(self):
+        """
+        Invalidate cached responses of all processes.
+        """
+        OfferGeneration.increase()
+        self._state = None
+        self.local.clear()
+
+    @staticmethod
+    def _shared_key(version, key):
+        return 'offers:{0}:{1}'.format(version, key)
+
+
+_offer_cache = None
+
+
+def get_offer_cache():
+    """
+    :return: the offer cache of current process.
+    """
+    global _offer_cache
+    if _offer_cache is None:
+        _offer_cache = OfferCache(settings.OFFER_CACHE_MAX_ENTRIES,
+                                  settings.OFFER_CACHE_MAX_TTL,
+                                  settings.OFFER_CACHE_STATE_CHECK_INTERVAL,
+                                  settings.OFFER_CACHE_SHARED_ALIAS)
+    return _offer_cache
+
+
+def invalidate_offer_cache():
+    """
+    Invalidate offer responses after offers are changed, e.g. a crawl finished.
+    """
+    get_offer_cache().invalidate()
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from product import benchmark
+from product.settings import OFFERS_PER_PAGE
+
+
+class Command(BaseCommand):
+    help = 'Benchmark offer queries and serialization. Only run it against a local database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Insert this many synthetic products before benchmarking.')
+        parser.add_argument('--clean', action='store_true', default=False,
+                            help='Delete synthetic data and exit.')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=OFFERS_PER_PAGE)
+        parser.add_argument('--deep-page', type=int, default=500,
+                            help='Page number of deep page benchmarks.')
+        parser.add_argument('--only', nargs='*', help='Names of benchmarks to run.')
+        parser.add_argument('--output', help='Write report json to this file.')
+        parser.add_argument('--compare', help='Report json of a previous run to compare with.')
+
+    def handle(self, *args, **options):
+        log = self.stdout.write
+        if options['clean']:
+            benchmark.clean(log)
+            return
+        if options['seed'] > 0:
+            benchmark.seed(options['seed'], log=log)
+        report = benchmark.run(options['iterations'], options['page_size'], options['deep_page'],
+                               options['only'], log)
+        content = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(content)
+        else:
+            log(content)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self._compare(json.load(f), report)
+
+    def _compare(self, base, report):
+        self.stdout.write('Compare with {0}'.format(base.get('commit')))
+        for name, result in sorted(report['results'].items()):
+            base_result = base.get('results', {}).get(name)
+            if base_result is None:
+                continue
+            self.stdout.write('{0}: p50 {1:+.1f}%, p95 {2:+.1f}%, p99 {3:+.1f}%, queries {4:+d}, alloc {5:+d} bytes'.format(
+                name,
+                self.__class__._change(base_result['p50_ms'], result['p50_ms']),
+                self.__class__._change(base_result['p95_ms'], result['p95_ms']),
+                self.__class__._change(base_result['p99_ms'], result['p99_ms']),
+                result['queries'] - base_result['queries'],
+                result['peak_alloc_bytes'] - base_result['peak_alloc_bytes']))
+
+    @staticmethod
+    def _change(old, new):
+        return (new - old) * 100.0 / old if old else 0.0
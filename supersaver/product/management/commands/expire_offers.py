@@ -0,0 +1,43 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from product.managers import DEFAULT_EXPIRE_BATCH_SIZE
+from product.models import ActiveOffer, Product
+
+# Max seconds to wait between two sweeps in watch mode.
+DEFAULT_MAX_SWEEP_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Deactivate expired offers, optionally keep sweeping at promotion boundaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', default=False,
+                            help='Keep running and sweep right after each offer expires.')
+        parser.add_argument('--max-interval', type=int, default=DEFAULT_MAX_SWEEP_INTERVAL,
+                            help='Max seconds between two sweeps in watch mode.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_EXPIRE_BATCH_SIZE,
+                            help='Max number of offers deactivated by one statement.')
+
+    def handle(self, *args, **options):
+        while True:
+            now = int(datetime.now().timestamp())
+            start = time.perf_counter()
+            expired = Product.objects.expire_offers(now, options['batch_size'])
+            if expired > 0:
+                # Keep the view small, expired offers are already hidden from queries by end date.
+                # The refresh also publishes products written since last refresh and increases offer generation.
+                ActiveOffer.refresh()
+            self.stdout.write('Deactivated {0} expired offers in {1:.3f}s at {2}.'.format(
+                expired, time.perf_counter() - start, now))
+            if not options['watch']:
+                return
+            boundary = Product.objects.filter(active=True, promotion_end_date__gt=now) \
+                .order_by('promotion_end_date').values_list('promotion_end_date', flat=True).first()
+            wait = options['max_interval']
+            if boundary is not None:
+                # Sweep right after the next offer expired.
+                wait = min(wait, boundary - now + 1)
+            time.sleep(max(wait, 1))
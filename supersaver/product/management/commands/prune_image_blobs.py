@@ -0,0 +1,39 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from product.models import ImageBlob, ImageRendition, ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Recount image blob references and delete the blobs which are not referenced by any product image.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Only recount references, do not delete anything.')
+
+    def handle(self, *args, **options):
+        # Product images are deleted by cascade without touching blobs, so counts are recalculated here.
+        refs = ProductImage.objects.filter(blob=OuterRef('pk')).order_by() \
+            .values('blob').annotate(refs=Count('*')).values('refs')
+        with transaction.atomic():
+            ImageBlob.objects.update(ref_count=Coalesce(Subquery(refs, output_field=IntegerField()), 0))
+            unreferenced = list(ImageBlob.objects.select_for_update().filter(ref_count=0))
+            if options['dry_run']:
+                self.stdout.write('{0} image blobs are not referenced.'.format(len(unreferenced)))
+                return
+            blob_ids = [blob.pk for blob in unreferenced]
+            paths = {blob.path for blob in unreferenced}
+            paths.update(ImageRendition.objects.filter(blob_id__in=blob_ids).values_list('path', flat=True))
+            # Renditions are deleted by cascade.
+            ImageBlob.objects.filter(pk__in=blob_ids).delete()
+        for path in paths:
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, path))
+            except FileNotFoundError:
+                pass
+        self.stdout.write('Deleted {0} image blobs.'.format(len(unreferenced)))
@@ -0,0 +1,34 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from product.models import ActiveOffer, Product
+
+# Max seconds to wait between two refreshes in watch mode.
+DEFAULT_MAX_REFRESH_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Refresh active offer view, optionally keep refreshing it at promotion boundaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', default=False,
+                            help='Keep running and refresh the view at each promotion boundary.')
+        parser.add_argument('--max-interval', type=int, default=DEFAULT_MAX_REFRESH_INTERVAL,
+                            help='Max seconds between two refreshes in watch mode.')
+
+    def handle(self, *args, **options):
+        while True:
+            # Offer generation is increased by refresh, cached offer responses are invalidated.
+            ActiveOffer.refresh()
+            now = int(datetime.now().timestamp())
+            self.stdout.write('Active offers refreshed at {0}.'.format(now))
+            if not options['watch']:
+                return
+            boundary = Product.objects.next_promotion_boundary(now)
+            wait = options['max_interval']
+            if boundary is not None:
+                # Refresh right after the boundary passed.
+                wait = min(wait, boundary - now + 1)
+            time.sleep(max(wait, 1))
@@ -1,10 +1,20 @@
 from datetime import datetime
 
-from django.contrib.postgres.search import SearchRank
 from django.core.paginator import Paginator
-from django.db.models import expressions
+from django.db.models import Max, Min, Q
 from django.db.models import manager
 
+from .pagination import encode_cursor, decode_cursor, peek_cursor_kind, seek_condition
+from .search import SEARCH_MODE_WEB, search, fuzzy_search
+
+CURSOR_RECENT = 'recent'
+CURSOR_RELEVANCE = 'relevance'
+CURSOR_PRICE = 'price'
+# Suffix of cursor kind for the pages of fuzzy search results.
+CURSOR_FUZZY_SUFFIX = '~'
+# Max number of offers deactivated by one statement, see expire_offers.
+DEFAULT_EXPIRE_BATCH_SIZE = 5000
+
 
 class ProductManager (manager.Manager):
     """
@@ -41,6 +51,53 @@ class ProductManager (manager.Manager):
         query_set = self._search_by_keywords_no_sort(keywords)
         return self._paged_offers(query_set.order_by("price"), page_num, page_size)
 
+    def recent_offers_by_cursor(self, cursor, page_size, fields=None):
+        """
+        Recent offers order by promotion end date, paged by keyset instead of offset.
+        :param cursor: continuation token returned with previous page, None for first page.
+        :param page_size: max number of offers in a page.
+        :param fields: fetch only these fields as dicts (QuerySet.values), model instances by default.
+        :return: tuple of (offers, next page cursor), next page cursor is None on last page.
+        """
+        now = datetime.now().timestamp()
+        products = self.filter(active=True, promotion_start_date__lte=now, promotion_end_date__gt=now)
+        return self._seek_offers(products, CURSOR_RECENT, ('promotion_end_date', 'id'), cursor, page_size, fields)
+
+    def search_by_relevance_by_cursor(self, keywords, cursor, page_size, fields=None, mode=SEARCH_MODE_WEB):
+        """
+        search product by keyword order by relevance (desc), paged by keyset.
+        Titles similar to keywords are returned if nothing matches keywords.
+        :param keywords: search keyword.
+        :param cursor: continuation token returned with previous page, None for first page.
+        :param fields: fetch only these fields as dicts (QuerySet.values), model instances by default.
+        :param mode: search mode, see product.search.SEARCH_MODES.
+        :return: tuple of (offers, next page cursor).
+        """
+        return self._search_by_cursor(keywords, mode, CURSOR_RELEVANCE, ('-rank', 'id'), cursor, page_size, fields)
+
+    def search_by_price_by_cursor(self, keywords, cursor, page_size, fields=None, mode=SEARCH_MODE_WEB):
+        """
+        search product by keyword order by price (asc), paged by keyset.
+        Titles similar to keywords are returned if nothing matches keywords.
+        :param keywords: search keyword.
+        :param cursor: continuation token returned with previous page, None for first page.
+        :param fields: fetch only these fields as dicts (QuerySet.values), model instances by default.
+        :param mode: search mode, see product.search.SEARCH_MODES.
+        :return: tuple of (offers, next page cursor).
+        """
+        return self._search_by_cursor(keywords, mode, CURSOR_PRICE, ('price', 'id'), cursor, page_size, fields)
+
+    def _search_by_cursor(self, keywords, mode, cursor_kind, ordering, cursor, page_size, fields):
+        fuzzy_kind = cursor_kind + CURSOR_FUZZY_SUFFIX
+        if not cursor or peek_cursor_kind(cursor) != fuzzy_kind:
+            offers, next_cursor = self._seek_offers(
+                self._search_by_keywords_no_sort(keywords, mode), cursor_kind, ordering, cursor, page_size, fields)
+            if offers or cursor:
+                return offers, next_cursor
+        # Nothing matched, keywords may be misspelled.
+        return self._seek_offers(
+            self._fuzzy_search_no_sort(keywords), fuzzy_kind, ordering, cursor, page_size, fields)
+
     @staticmethod
     def _paged_offers(page_queryset, page_num, page_size):
         if page_num <= 0:
@@ -51,14 +108,86 @@ class ProductManager (manager.Manager):
         page = paged_products.get_page(page_num)
         return page.object_list
 
-    def _search_by_keywords_no_sort(self, keywords):
+    @staticmethod
+    def _seek_offers(page_queryset, cursor_kind, ordering, cursor, page_size, fields=None):
+        """
+        Keyset (seek) pagination, no COUNT(*) and no OFFSET scan.
+        The last field in ordering must be unique (primary key) to make the order stable.
+        """
+        if page_size <= 0:
+            return [], None
+        keys = [f.lstrip('-') for f in ordering]
+        if cursor:
+            values = decode_cursor(cursor, cursor_kind, len(ordering))
+            page_queryset = page_queryset.filter(seek_condition(ordering, values))
+        if fields is not None:
+            # Sort keys are needed to create next cursor.
+            page_queryset = page_queryset.values(*fields, *[k for k in keys if k not in fields])
+        # Fetch one more row to know whether there is a next page.
+        offers = list(page_queryset.order_by(*ordering)[:page_size + 1])
+        if len(offers) <= page_size:
+            return offers, None
+        offers = offers[:page_size]
+        last = offers[-1]
+        if fields is not None:
+            next_cursor = encode_cursor(cursor_kind, [last[k] for k in keys])
+        else:
+            next_cursor = encode_cursor(cursor_kind, [getattr(last, k) for k in keys])
+        return offers, next_cursor
+
+    def next_promotion_boundary(self, now=None):
+        """
+        Get the nearest future time when the live offer set changes, an offer starts or expires.
+        :param now: timestamp, current time by default.
+        :return: timestamp of next promotion boundary, None if there is no more boundary.
+        """
+        if now is None:
+            now = int(datetime.now().timestamp())
+        result = self.filter(active=True, promotion_end_date__gt=now).aggregate(
+            next_start=Min('promotion_start_date', filter=Q(promotion_start_date__gt=now)),
+            next_end=Min('promotion_end_date'))
+        boundaries = [v for v in result.values() if v is not None]
+        return min(boundaries) if boundaries else None
+
+    def last_promotion_boundary(self, now=None):
+        """
+        Get the latest past time when the live offer set changed, an offer started or expired.
+        :param now: timestamp, current time by default.
+        :return: timestamp of last promotion boundary, None if there is no boundary before now.
+        """
+        if now is None:
+            now = int(datetime.now().timestamp())
+        result = self.filter(active=True).aggregate(
+            last_start=Max('promotion_start_date', filter=Q(promotion_start_date__lte=now)),
+            last_end=Max('promotion_end_date', filter=Q(promotion_end_date__lte=now)))
+        boundaries = [v for v in result.values() if v is not None]
+        return max(boundaries) if boundaries else None
+
+    def expire_offers(self, now=None, batch_size=DEFAULT_EXPIRE_BATCH_SIZE):
+        """
+        Deactivate expired offers which are still active, one batch per statement,
+        so a sweep never holds row locks on a whole datasource history.
+        Expired offers are found by the (active, promotion_end_date) index.
+        :param now: timestamp, current time by default.
+        :param batch_size: max number of offers deactivated by one statement.
+        :return: number of deactivated offers.
+        """
+        if now is None:
+            now = int(datetime.now().timestamp())
+        total = 0
+        while True:
+            batch = self.filter(active=True, promotion_end_date__lte=now).values('pk')[:batch_size]
+            updated = self.filter(pk__in=batch).update(active=False)
+            total += updated
+            if updated < batch_size:
+                return total
+
+    def _search_by_keywords_no_sort(self, keywords, mode=SEARCH_MODE_WEB):
+        now = datetime.now().timestamp()
+        products = self.filter(active=True, promotion_start_date__lte=now, promotion_end_date__gt=now)
+        return search(products, keywords, mode)
+
+    def _fuzzy_search_no_sort(self, keywords):
         now = datetime.now().timestamp()
-        # Use expressions.Value to represent search_vector column.
-        # This can avoid create the search vector for each request.
-        # The search_vector has already added as a SearchVectorField and updated by the trigger, we can use it directly.
-        products = self.annotate(rank=SearchRank(expressions.Value('search_vector'), keywords)) \
-            .filter(active=True,
-                    promotion_start_date__lte=now,
-                    promotion_end_date__gt=now,
-                    search_vector=keywords)
-        return products
+        products = self.filter(active=True, promotion_start_date__lte=now, promotion_end_date__gt=now)
+        return fuzzy_search(products, keywords)
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+import django.contrib.postgres.search
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retailer', '0002_insert_init_data'),
+        ('product', '0002_create_search_vector_update_trigger'),
+    ]
+
+    operations = [
+        # Active offer projection, only holds active and unexpired offers when refreshed.
+        # Unique index on id is required by REFRESH MATERIALIZED VIEW CONCURRENTLY.
+        migrations.RunSQL(
+            """
+            CREATE MATERIALIZED VIEW product_active_offer AS
+                SELECT id, retailer_id, title, description, price, unit, saved,
+                    landing_page, fast_buy_link, promotion_start_date, promotion_end_date,
+                    ready, created_time, updated_time, active, search_vector
+                FROM product_product
+                WHERE active AND promotion_end_date > extract(epoch from now());
+
+            CREATE UNIQUE INDEX product_active_offer_id_index ON product_active_offer (id);
+            CREATE INDEX product_active_offer_end_date_index ON product_active_offer (promotion_end_date, id);
+            CREATE INDEX product_active_offer_price_index ON product_active_offer (price, id);
+            CREATE INDEX product_active_offer_search_index ON product_active_offer USING gin (search_vector);
+            """,
+            reverse_sql="DROP MATERIALIZED VIEW product_active_offer;"),
+        migrations.CreateModel(
+            name='ActiveOffer',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=256)),
+                ('description', models.CharField(max_length=512)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=11)),
+                ('unit', models.CharField(max_length=32)),
+                ('saved', models.CharField(max_length=64, null=True)),
+                ('landing_page', models.CharField(max_length=512)),
+                ('fast_buy_link', models.CharField(max_length=512, null=True)),
+                ('promotion_start_date', models.PositiveIntegerField()),
+                ('promotion_end_date', models.PositiveIntegerField()),
+                ('ready', models.BooleanField()),
+                ('created_time', models.DateTimeField()),
+                ('updated_time', models.DateTimeField()),
+                ('active', models.BooleanField()),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField()),
+                ('retailer', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='retailer.Retailer')),
+            ],
+            options={
+                'db_table': 'product_active_offer',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_create_active_offer_view'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferGeneration',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, editable=False, primary_key=True, serialize=False)),
+                ('generation', models.BigIntegerField(default=0)),
+                ('updated_time', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0004_offergeneration'),
+    ]
+
+    operations = [
+        # Fuzzy search on offer titles, see product/search.py
+        TrigramExtension(),
+        migrations.RunSQL(
+            """
+            CREATE INDEX product_active_offer_title_trgm_index
+                ON product_active_offer USING gin (title gin_trgm_ops);
+            """,
+            reverse_sql="DROP INDEX product_active_offer_title_trgm_index;"),
+    ]
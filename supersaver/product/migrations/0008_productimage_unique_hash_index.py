@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0007_product_active_end_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='unique_hash',
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0009_imageblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageRendition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('length', models.PositiveSmallIntegerField()),
+                ('format', models.CharField(max_length=8)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('path', models.CharField(max_length=256)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions',
+                                           to='product.ImageBlob')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='imagerendition',
+            unique_together={('blob', 'format', 'length')},
+        ),
+    ]
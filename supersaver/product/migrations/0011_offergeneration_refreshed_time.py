@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0010_imagerendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offergeneration',
+            name='refreshed_time',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+    ]
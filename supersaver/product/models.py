@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
 
@@ -45,6 +47,8 @@ class Product (models.Model):
     updated_time = models.DateTimeField(auto_now=True)
 
     active = models.BooleanField(default=True)
+    # Fingerprint of crawled content, crawlers skip writing a product if it is unchanged.
+    content_hash = models.CharField(max_length=16, null=True, blank=False, default=None)
     # Custom manager to facilitate product query.
     objects = ProductManager()
 
@@ -52,7 +56,9 @@ class Product (models.Model):
 
     class Meta:
         indexes = [
-            GinIndex(fields=['search_vector'], name='product_search_index')
+            GinIndex(fields=['search_vector'], name='product_search_index'),
+            # Expiry sweep looks up active offers by end date, see expire_offers.
+            models.Index(fields=['active', 'promotion_end_date'], name='product_active_end_date_idx'),
         ]
 
     def __repr__(self):
@@ -66,6 +72,58 @@ class Product (models.Model):
                     self.landing_page, self.fast_buy_link)
 
 
+class ActiveOffer (models.Model):
+    """
+    Active offer projection, a materialized view holds the active and unexpired rows of product table.
+    Product table keeps growing with expired deals, while the live offers are a small fraction of it.
+    The view is refreshed when crawls finish and at promotion boundaries (see refresh_active_offers command).
+    Notes:
+        Offers expired after the last refresh are still in the view, always filter by promotion date.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    retailer = models.ForeignKey(Retailer, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False)
+    title = models.CharField(max_length=256)
+    description = models.CharField(max_length=512)
+    price = models.DecimalField(max_digits=11, decimal_places=2)
+    unit = models.CharField(max_length=32)
+    saved = models.CharField(max_length=64, null=True)
+    landing_page = models.CharField(max_length=512)
+    fast_buy_link = models.CharField(max_length=512, null=True)
+    promotion_start_date = models.PositiveIntegerField()
+    promotion_end_date = models.PositiveIntegerField()
+    ready = models.BooleanField()
+    created_time = models.DateTimeField()
+    updated_time = models.DateTimeField()
+    active = models.BooleanField()
+
+    objects = ProductManager()
+
+    search_vector = SearchVectorField()
+
+    class Meta:
+        managed = False
+        db_table = 'product_active_offer'
+
+    @classmethod
+    def refresh(cls):
+        """
+        Refresh active offer view without blocking readers, and increase offer generation.
+        The view publishes every product written since last refresh (including the products of a crawl
+        in progress), so offer responses cached before are invalid.
+        """
+        # Products updated before the refresh started are in the view.
+        refreshed_time = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY {0}'.format(cls._meta.db_table))
+        OfferGeneration.increase(refreshed_time)
+
+    def __repr__(self):
+        return 'ActiveOffer: id={0}, retailer={1}, title={2}, price={3}, ' \
+               'prom_start={4}, prom_end={5}' \
+            .format(self.id, self.retailer_id, self.title, self.price,
+                    self.promotion_start_date, self.promotion_end_date)
+
+
 class ProductProperty (Property):
     """
     Product property bag.
@@ -77,15 +135,124 @@ class ProductProperty (Property):
             self.pk, self.name, self.value, self.product_id)
 
 
+class ImageBlob (models.Model):
+    """
+    Content addressed image file under MEDIA_ROOT, shared by all product images with the same content.
+    """
+    # Hex SHA-256 of original image bytes.
+    unique_hash = models.CharField(max_length=64, unique=True, null=False, blank=False)
+    # Optional dHash of image, near duplicate images (resized or re-encoded) have the same perceptual hash.
+    perceptual_hash = models.CharField(max_length=16, null=True, blank=False, default=None, db_index=True)
+    # Path of the largest JPEG rendition relative to MEDIA_ROOT, see make_path.
+    path = models.CharField(max_length=256, null=False, blank=False)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    # Number of product images reference this blob, it is reconciled by prune_image_blobs command.
+    ref_count = models.PositiveIntegerField(default=0)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def make_path(unique_hash, ext='jpg', length=None):
+        """
+        Sharded path of a blob, e.g. product/ab/cd/abcd....jpg, so no directory holds too many files.
+        :param length: rendition length, e.g. product/ab/cd/abcd..._320.webp
+        """
+        name = unique_hash if length is None else '{0}_{1}'.format(unique_hash, length)
+        return 'product/{0}/{1}/{2}.{3}'.format(unique_hash[:2], unique_hash[2:4], name, ext)
+
+    @classmethod
+    def add_refs(cls, blob_ids):
+        """
+        Increase reference count of blobs.
+        :param blob_ids: blob ids, an id is counted as many times as it appears.
+        """
+        counts = {}
+        for blob_id in blob_ids:
+            counts[blob_id] = counts.get(blob_id, 0) + 1
+        ids_by_count = {}
+        for blob_id, count in counts.items():
+            ids_by_count.setdefault(count, []).append(blob_id)
+        for count, ids in ids_by_count.items():
+            cls.objects.filter(pk__in=ids).update(ref_count=F('ref_count') + count)
+
+    def __repr__(self):
+        return 'ImageBlob: id={0}, hash={1}, path={2}, refs={3}'.format(
+            self.pk, self.unique_hash, self.path, self.ref_count)
+
+
+class ImageRendition (models.Model):
+    """
+    A resized and encoded copy of an image blob.
+    """
+    blob = models.ForeignKey(ImageBlob, on_delete=models.CASCADE, null=False, related_name='renditions')
+    # Nominal length of the rendition, e.g. 320, the image may be smaller.
+    length = models.PositiveSmallIntegerField()
+    # jpg or webp
+    format = models.CharField(max_length=8, null=False, blank=False)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    path = models.CharField(max_length=256, null=False, blank=False)
+
+    class Meta:
+        unique_together = (('blob', 'format', 'length'),)
+
+    def __repr__(self):
+        return 'ImageRendition: id={0}, blob={1}, length={2}, format={3}, path={4}'.format(
+            self.pk, self.blob_id, self.length, self.format, self.path)
+
+
 class ProductImage (models.Model):
     """
     Product image
     """
     # Pak'n save product has no image. (a product may have 0 or more images.)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=False, related_name='product_images')
-    unique_hash = models.CharField(max_length=64, unique=True, null=False, blank=False)
+    # SHA-256 of image content, products with the same image have the same hash.
+    unique_hash = models.CharField(max_length=64, db_index=True, null=False, blank=False)
     original_url = models.CharField(max_length=512, null=False, blank=False)
+    blob = models.ForeignKey(ImageBlob, on_delete=models.PROTECT, null=True, related_name='images')
 
     def __repr__(self):
         return 'ProductImage: id={0}, hash={1}, product={2}, origin={3}'.format(
             self.pk, self.unique_hash, self.product_id, self.original_url)
+
+
+class OfferGeneration (models.Model):
+    """
+    Generation counter of offer data (single row).
+    It is increased when crawlers finish or active offer view is refreshed,
+    offer response caches are only valid for the generation they are created in.
+    """
+    CURRENT_ID = 1
+
+    id = models.PositiveSmallIntegerField(primary_key=True, default=CURRENT_ID, editable=False)
+    generation = models.BigIntegerField(default=0)
+    updated_time = models.DateTimeField(auto_now=True)
+    # Start time of the last active offer view refresh, None if it is unknown.
+    refreshed_time = models.DateTimeField(null=True, default=None)
+
+    @classmethod
+    def current(cls):
+        """
+        :return: current OfferGeneration instance.
+        """
+        generation, _ = cls.objects.get_or_create(id=cls.CURRENT_ID)
+        return generation
+
+    @classmethod
+    def increase(cls, refreshed_time=None):
+        """
+        Increase offer generation atomically.
+        :param refreshed_time: start time of the active offer view refresh which changed offers, if any.
+        """
+        values = {'generation': F('generation') + 1, 'updated_time': timezone.now()}
+        defaults = {'generation': 1}
+        if refreshed_time is not None:
+            values['refreshed_time'] = defaults['refreshed_time'] = refreshed_time
+        updated = cls.objects.filter(id=cls.CURRENT_ID).update(**values)
+        if updated == 0:
+            cls.objects.get_or_create(id=cls.CURRENT_ID, defaults=defaults)
+
+    def __repr__(self):
+        return 'OfferGeneration: generation={0}, updated={1}, refreshed={2}'.format(
+            self.generation, self.updated_time, self.refreshed_time)
@@ -0,0 +1,78 @@
+from decimal import Decimal
+from uuid import UUID
+
+from django.conf import settings
+from django.db.models import Q
+
+from core.crypt import encrypt_code, decrypt_code
+from core.exception import InvalidInput, InvalidSignature
+
+
+def encode_cursor(kind, values):
+    """
+    Encode the sort key values of the last row in a page as an opaque continuation token.
+    :param kind: cursor kind, a cursor can only be used with the query which created it.
+    :param values: sort key values (list) of the last row.
+    :return: signed cursor string.
+    """
+    data = {
+        'k': kind,
+        'v': [str(v) if isinstance(v, (UUID, Decimal)) else v for v in values]
+    }
+    return encrypt_code(data, settings.SECRET_KEY)
+
+
+def decode_cursor(cursor, kind, num_values):
+    """
+    Decode a continuation token created by encode_cursor.
+    :param cursor: signed cursor string from client.
+    :param kind: expected cursor kind.
+    :param num_values: expected number of sort key values.
+    :return: list of sort key values.
+    """
+    try:
+        data = decrypt_code(cursor, settings.SECRET_KEY)
+    except (InvalidSignature, ValueError):
+        # ValueError: cursor is not ascii.
+        raise InvalidInput('Invalid cursor.')
+    if not isinstance(data, dict) or data.get('k') != kind:
+        raise InvalidInput('Invalid cursor.')
+    values = data.get('v')
+    if not isinstance(values, list) or len(values) != num_values:
+        raise InvalidInput('Invalid cursor.')
+    return values
+
+
+def peek_cursor_kind(cursor):
+    """
+    Get the kind of a continuation token created by encode_cursor.
+    :param cursor: signed cursor string from client.
+    :return: cursor kind.
+    """
+    try:
+        data = decrypt_code(cursor, settings.SECRET_KEY)
+    except (InvalidSignature, ValueError):
+        # ValueError: cursor is not ascii.
+        raise InvalidInput('Invalid cursor.')
+    if not isinstance(data, dict):
+        raise InvalidInput('Invalid cursor.')
+    return data.get('k')
+
+
+def seek_condition(ordering, values):
+    """
+    Build the keyset (seek) condition to get rows after the given sort key values.
+    For ordering ('a', '-b', 'id') and values (x, y, z), the condition is:
+    a > x OR (a = x AND b < y) OR (a = x AND b = y AND id > z)
+    :param ordering: order_by field names, prefix '-' for descending order.
+    :param values: sort key values of the last row in previous page.
+    :return: Q object.
+    """
+    condition = Q()
+    equals = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = '{0}__lt' if field.startswith('-') else '{0}__gt'
+        condition |= Q(**equals, **{lookup.format(name): value})
+        equals[name] = value
+    return condition
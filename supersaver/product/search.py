@@ -0,0 +1,108 @@
+"""
+Offer full text search on the trigger maintained search_vector column.
+
+Notes:
+    websearch_to_tsquery requires PostgreSQL 11 or later.
+    Fuzzy search requires pg_trgm extension (see migration 0005).
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import DecimalField, F
+from django.db.models import expressions
+
+# Must be the same as the config used by product_update_trigger.
+SEARCH_CONFIG = 'pg_catalog.english'
+
+SEARCH_MODE_WEB = 'web'
+SEARCH_MODE_PREFIX = 'prefix'
+SEARCH_MODES = (SEARCH_MODE_WEB, SEARCH_MODE_PREFIX)
+
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+class RoundedRank (expressions.Func):
+    """
+    Round search rank (real) to a fixed scale numeric.
+    Float rank can't survive the round trip to client and back exactly,
+    keyset pagination needs an exact value to seek on.
+    """
+    function = 'ROUND'
+    template = '%(function)s((%(expressions)s)::numeric, 6)'
+    output_field = DecimalField(max_digits=12, decimal_places=6)
+
+
+class TsQuery (SearchQuery):
+    """
+    Search query parsed by a PostgreSQL tsquery function.
+    """
+    function = 'plainto_tsquery'
+
+    def __init__(self, value, config=SEARCH_CONFIG):
+        super().__init__(value)
+        self.search_config = config
+
+    def as_sql(self, compiler, connection):
+        template = '{0}(%s::regconfig, %s)'.format(self.function)
+        return template, [self.search_config, self.value]
+
+
+class WebSearchQuery (TsQuery):
+    """
+    Web search engine syntax, e.g. "sparkling water" -lemon or soda
+    """
+    function = 'websearch_to_tsquery'
+
+
+class PrefixQuery (TsQuery):
+    """
+    Match words start with the keywords, for type-ahead search.
+    """
+    function = 'to_tsquery'
+
+    def __init__(self, value, config=SEARCH_CONFIG):
+        super().__init__(self.__class__.to_prefix_tsquery(value), config)
+
+    @staticmethod
+    def to_prefix_tsquery(keywords):
+        # Only word characters are kept, tsquery operators in keywords can't break the query.
+        words = _WORD_PATTERN.findall(keywords)
+        return ' & '.join(w + ':*' for w in words)
+
+
+def make_search_query(keywords, mode=SEARCH_MODE_WEB):
+    """
+    :param keywords: search keywords from user.
+    :param mode: one of SEARCH_MODES.
+    :return: tsquery expression.
+    """
+    if mode == SEARCH_MODE_PREFIX:
+        return PrefixQuery(keywords)
+    return WebSearchQuery(keywords)
+
+
+def search(queryset, keywords, mode=SEARCH_MODE_WEB):
+    """
+    Filter rows match the keywords and annotate rank.
+    Filter is answered by the GIN index on search_vector, rank is only calculated for matched rows.
+    :param queryset: product or active offer queryset.
+    :param keywords: search keywords from user.
+    :param mode: one of SEARCH_MODES.
+    :return: queryset annotated with rank.
+    """
+    query = make_search_query(keywords, mode)
+    return queryset.filter(search_vector=query) \
+        .annotate(rank=RoundedRank(SearchRank(F('search_vector'), query)))
+
+
+def fuzzy_search(queryset, keywords):
+    """
+    Filter rows whose title is similar to the keywords, for misspelled keywords.
+    Filter uses pg_trgm % operator which is answered by the trigram index on title,
+    rank is the title similarity.
+    :param queryset: product or active offer queryset.
+    :param keywords: search keywords from user.
+    :return: queryset annotated with rank.
+    """
+    return queryset.filter(title__trigram_similar=keywords) \
+        .annotate(rank=RoundedRank(TrigramSimilarity('title', keywords)))
@@ -1,3 +1,18 @@
 
 OFFER_IMAGE_SIZE = 640
+# Long edge lengths of offer image renditions, clients get the smallest one fits the device.
+OFFER_IMAGE_RENDITION_SIZES = (160, 320, OFFER_IMAGE_SIZE)
 OFFERS_PER_PAGE = 20
+OFFER_SORT_BY_RELEVANCE = 'relevance'
+OFFER_SORT_BY_PRICE = 'price'
+# Offer response cache, see product/cache.py
+OFFER_CACHE_MAX_ENTRIES = 1024
+# Max seconds to keep a cached response.
+OFFER_CACHE_MAX_TTL = 3600
+# Max seconds before a change of offer generation is noticed by a web worker.
+OFFER_CACHE_STATE_CHECK_INTERVAL = 5
+# Django cache alias of the shared cache tier (e.g. memcached), None to use local cache only.
+OFFER_CACHE_SHARED_ALIAS = None
+# Search suggestions, see product/suggest.py
+OFFER_SUGGESTIONS_LIMIT = 10
+OFFER_SUGGESTIONS_MAX_LIMIT = 50
@@ -0,0 +1,221 @@
+"""
+Search suggestions (autocomplete) served from memory.
+
+Suggestions are active offer titles, retailer display names and category names.
+Each text is indexed by the start of each of its words, so "blue" suggests "Anchor Blue Milk 2L".
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from heapq import merge
+
+from django.conf import settings
+
+from category.models import Category
+from retailer.models import Retailer
+from .cache import get_offer_cache
+from .models import ActiveOffer
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_TYPE_OFFER = 'offer'
+SUGGESTION_TYPE_RETAILER = 'retailer'
+SUGGESTION_TYPE_CATEGORY = 'category'
+
+# Max number of offer ids in one query of titles.
+TITLE_BATCH_SIZE = 500
+# Only index the first words of a text, words at the end of long titles are rarely typed.
+MAX_INDEXED_WORDS = 8
+
+
+def normalize_text(text):
+    return ' '.join(text.lower().split())
+
+
+class SuggestionIndex(object):
+    """
+    Immutable prefix index, a sorted key array searched with bisect.
+    """
+
+    def __init__(self, items=()):
+        """
+        :param items: sorted (key, text, type) tuples, see make_items.
+        """
+        items = list(items)
+        self._keys = [key for key, _, _ in items]
+        self._items = items
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def make_items(text, suggestion_type):
+        """
+        :return: sorted index items of text.
+        """
+        words = normalize_text(text).split(' ')
+        return sorted((' '.join(words[i:]), text, suggestion_type)
+                      for i in range(min(len(words), MAX_INDEXED_WORDS)) if words[i])
+
+    def updated(self, added, removed):
+        """
+        Make a new index with items of some texts added and removed.
+        :param added: set of (text, type) to add.
+        :param removed: set of (text, type) to remove.
+        :return: new SuggestionIndex.
+        """
+        items = self._items
+        if removed:
+            items = [item for item in items if (item[1], item[2]) not in removed]
+        new_items = []
+        for text, suggestion_type in added:
+            new_items.extend(self.__class__.make_items(text, suggestion_type))
+        new_items.sort()
+        return self.__class__(merge(items, new_items))
+
+    def suggest(self, prefix, limit):
+        """
+        :param prefix: text typed by user.
+        :param limit: max number of suggestions.
+        :return: list of (text, type), texts have a word starts with prefix.
+        """
+        prefix = normalize_text(prefix)
+        if not prefix or limit <= 0:
+            return []
+        keys, items = self._keys, self._items
+        results = []
+        seen = set()
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix):
+            _, text, suggestion_type = items[i]
+            if (text, suggestion_type) not in seen:
+                seen.add((text, suggestion_type))
+                results.append((text, suggestion_type))
+                if len(results) >= limit:
+                    break
+            i += 1
+        return results
+
+
+class OfferSuggester(object):
+    """
+    Keep the suggestion index in sync with active offers.
+
+    Suggestions are answered from the current index only, a request never touches database or waits for an update.
+    A background thread of each process checks offer cache state every update interval, and builds a new index
+    when the state changed (a crawl finished or a promotion boundary passed). Only titles of new offers and offers
+    updated since the view refresh the index was built from are loaded from database. Crawlers update products
+    for hours before the view is refreshed, so the time of the sync can't be used.
+    """
+
+    def __init__(self, update_interval):
+        """
+        :param update_interval: seconds between checks of offer cache state.
+        """
+        self.update_interval = update_interval
+        self.index = SuggestionIndex()
+        self._version = None
+        self._refreshed_time = None     # view refresh time of the offers in index
+        self._offer_titles = {}     # offer id -> title
+        self._text_counts = {}      # (text, type) -> number of sources
+        self._update_lock = threading.Lock()
+        self._updater_pid = None    # process the updater thread runs in
+
+    def suggest(self, prefix, limit):
+        self.start()
+        return self.index.suggest(prefix, limit)
+
+    def start(self):
+        """
+        Start the updater thread of this process if it isn't started, e.g. in a web worker forked
+        from the process which loaded the index (see wsgi.py), threads don't survive a fork.
+        """
+        pid = os.getpid()
+        if self._updater_pid == pid:
+            return
+        self._updater_pid = pid
+        threading.Thread(target=self._run_updater, name='offer-suggester', daemon=True).start()
+
+    def load(self):
+        """
+        Build the index now, e.g. when the web application is loaded, and start the updater thread.
+        """
+        try:
+            self.update_if_needed()
+        except Exception:
+            logger.exception('Failed to load offer suggestions.')
+        self.start()
+
+    def update_if_needed(self):
+        """
+        Build a new index if offer cache state changed. The current index is served meanwhile.
+        :return: False if another thread is updating the index.
+        """
+        if not self._update_lock.acquire(blocking=False):
+            return False
+        try:
+            state = get_offer_cache().current_state()
+            if state.version != self._version:
+                self._update(state.refreshed_time)
+                self._version = state.version
+        finally:
+            self._update_lock.release()
+        return True
+
+    def _run_updater(self):
+        while True:
+            try:
+                self.update_if_needed()
+            except Exception:
+                # Suggestions are served from the last index, it is updated on next check.
+                logger.exception('Failed to update offer suggestions.')
+            time.sleep(self.update_interval)
+
+    def _update(self, refreshed_time):
+        """
+        :param refreshed_time: view refresh time read before offers are queried, the view may be newer.
+        """
+        now = int(datetime.now().timestamp())
+        offers = ActiveOffer.objects.filter(active=True, promotion_start_date__lte=now, promotion_end_date__gt=now)
+        texts = {}
+        live_ids = set(offers.values_list('id', flat=True))
+        offer_titles = {i: t for i, t in self._offer_titles.items() if i in live_ids}
+        if self._refreshed_time is None:
+            offer_titles.update(offers.values_list('id', 'title'))
+        else:
+            # Offers updated since the refresh of last sync, then offers started since last sync.
+            offer_titles.update(offers.filter(updated_time__gte=self._refreshed_time).values_list('id', 'title'))
+            new_ids = list(live_ids - offer_titles.keys())
+            for i in range(0, len(new_ids), TITLE_BATCH_SIZE):
+                offer_titles.update(
+                    ActiveOffer.objects.filter(id__in=new_ids[i:i + TITLE_BATCH_SIZE]).values_list('id', 'title'))
+        for title in offer_titles.values():
+            key = (title, SUGGESTION_TYPE_OFFER)
+            texts[key] = texts.get(key, 0) + 1
+        for name in Retailer.objects.values_list('display_name', flat=True):
+            texts[(name, SUGGESTION_TYPE_RETAILER)] = 1
+        for name in Category.objects.filter(active=True).values_list('display_name', flat=True):
+            texts[(name, SUGGESTION_TYPE_CATEGORY)] = 1
+        added = texts.keys() - self._text_counts.keys()
+        removed = self._text_counts.keys() - texts.keys()
+        if added or removed:
+            self.index = self.index.updated(added, removed)
+        self._offer_titles = offer_titles
+        self._text_counts = texts
+        self._refreshed_time = refreshed_time
+
+
+_offer_suggester = None
+
+
+def get_offer_suggester():
+    """
+    :return: the offer suggester of current process.
+    """
+    global _offer_suggester
+    if _offer_suggester is None:
+        _offer_suggester = OfferSuggester(settings.OFFER_CACHE_STATE_CHECK_INTERVAL)
+    return _offer_suggester
@@ -1,3 +1,215 @@
-from django.test import TestCase
+import json
+import os
+from decimal import Decimal
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from common.utils.lru import LRUCache
+from core.exception import ErrorCode, InvalidInput
+from country.models import Country
+from region.models import Region
+from .cache import OfferCache
+from .models import OfferGeneration
+from .pagination import decode_cursor, encode_cursor, peek_cursor_kind, seek_condition
+from .suggest import SUGGESTION_TYPE_OFFER, SUGGESTION_TYPE_RETAILER, OfferSuggester, SuggestionIndex
+
+
+class OfferApiErrorTests(TestCase):
+    """
+    Invalid client input is answered with the http status code of the error, not 500.
+    """
+
+    def assertApiError(self, response, error_code):
+        code, http_status_code = error_code
+        self.assertEqual(response.status_code, http_status_code)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['code'], code)
+
+    def test_garbage_cursor(self):
+        response = self.client.get(reverse('recent_deals'), {'cursor': 'garbage'})
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_tampered_cursor(self):
+        response = self.client.get(reverse('recent_deals'), {'cursor': 'eyJkYXRhIjogMX0$AAAA'})
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_non_ascii_cursor(self):
+        response = self.client.get(reverse('recent_deals'), {'cursor': 'café$x'})
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_search_garbage_cursor(self):
+        response = self.client.get(reverse('search_deals'), {'q': 'coffee', 'cursor': 'garbage'})
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_search_without_keywords(self):
+        response = self.client.get(reverse('search_deals'))
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_search_invalid_mode(self):
+        response = self.client.get(reverse('search_deals'), {'q': 'coffee', 'mode': 'unknown'})
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_search_invalid_sort(self):
+        response = self.client.get(reverse('search_deals'), {'q': 'coffee', 'sort': 'unknown'})
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_suggest_invalid_limit(self):
+        response = self.client.get(reverse('suggest_deals'), {'q': 'co', 'limit': 'ten'})
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_offer_image_invalid_width(self):
+        response = self.client.get(reverse('offer_image', args=[str(uuid4())]), {'w': 'wide'})
+        self.assertApiError(response, ErrorCode.InvalidInput)
+
+    def test_offer_image_not_found(self):
+        response = self.client.get(reverse('offer_image', args=[str(uuid4())]))
+        self.assertApiError(response, ErrorCode.ObjectNotFound)
+
+
+class CursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        offer_id = uuid4()
+        cursor = encode_cursor('recent', [1520000000, Decimal('9.90'), offer_id])
+        self.assertEqual(peek_cursor_kind(cursor), 'recent')
+        self.assertEqual(decode_cursor(cursor, 'recent', 3), [1520000000, '9.90', str(offer_id)])
+
+    def test_other_kind(self):
+        cursor = encode_cursor('recent', [1, 2])
+        with self.assertRaises(InvalidInput):
+            decode_cursor(cursor, 'search', 2)
+
+    def test_other_number_of_values(self):
+        cursor = encode_cursor('recent', [1, 2])
+        with self.assertRaises(InvalidInput):
+            decode_cursor(cursor, 'recent', 3)
+
+
+class SeekConditionTests(TestCase):
+
+    ORDERING = ('display_name', '-name', 'id')
+
+    @classmethod
+    def setUpTestData(cls):
+        country = Country.objects.create(id=1, name='New Zealand', country_code='NZ')
+        for display_name in ('b', 'a', 'b', 'c'):
+            for name in ('x', 'y'):
+                Region.objects.create(name=name, display_name=display_name, country=country)
+
+    def test_rows_after_each_row(self):
+        rows = list(Region.objects.order_by(*self.ORDERING).values_list(*[f.lstrip('-') for f in self.ORDERING]))
+        for i, values in enumerate(rows):
+            after = Region.objects.filter(seek_condition(self.ORDERING, values)).order_by(*self.ORDERING)
+            self.assertEqual(list(after.values_list('display_name', 'name', 'id')), rows[i + 1:])
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_pop_and_default(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertEqual(cache.get('a', 'missing'), 'missing')
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            LRUCache(0)
+
+
+class OfferCacheTests(TestCase):
+
+    def setUp(self):
+        # State is read from database on every access.
+        self.cache = OfferCache(max_entries=10, max_ttl=60, state_check_interval=0)
+
+    def test_cached_in_current_generation(self):
+        key = OfferCache.make_key('recent', None)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, '[]')
+        self.assertEqual(self.cache.get(key), '[]')
+
+    def test_expired_by_new_generation(self):
+        key = OfferCache.make_key('recent', None)
+        self.cache.set(key, '[]')
+        version = self.cache.current_state().version
+        # Another process refreshed offers.
+        OfferGeneration.increase()
+        self.assertNotEqual(self.cache.current_state().version, version)
+        self.assertIsNone(self.cache.get(key))
+
+    def test_stream_caches_whole_payload(self):
+        key = OfferCache.make_key('search', 'milk')
+        self.assertEqual(list(self.cache.stream(key, ['[', '1', ']'])), ['[', '1', ']'])
+        self.assertEqual(self.cache.get(key), '[1]')
+
+    def test_make_key(self):
+        self.assertEqual(OfferCache.make_key('search', 'milk'), OfferCache.make_key('search', 'milk'))
+        self.assertNotEqual(OfferCache.make_key('search', 'milk'), OfferCache.make_key('search', None))
+
+
+class SuggestionIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        items = SuggestionIndex.make_items('Anchor Blue Milk 2L', SUGGESTION_TYPE_OFFER) + \
+            SuggestionIndex.make_items('Blue Bird', SUGGESTION_TYPE_RETAILER)
+        self.index = SuggestionIndex(sorted(items))
+
+    def test_prefix_of_any_word(self):
+        self.assertEqual(self.index.suggest('mil', 10), [('Anchor Blue Milk 2L', SUGGESTION_TYPE_OFFER)])
+        self.assertEqual(self.index.suggest('  ANCHOR  b', 10), [('Anchor Blue Milk 2L', SUGGESTION_TYPE_OFFER)])
+
+    def test_limit(self):
+        self.assertEqual(len(self.index.suggest('blue', 10)), 2)
+        self.assertEqual(len(self.index.suggest('blue', 1)), 1)
+        self.assertEqual(self.index.suggest('blue', 0), [])
+        self.assertEqual(self.index.suggest(' ', 10), [])
+
+    def test_updated(self):
+        index = self.index.updated({('Blueberry Muffin', SUGGESTION_TYPE_OFFER)},
+                                   {('Blue Bird', SUGGESTION_TYPE_RETAILER)})
+        self.assertEqual(index.suggest('blue', 10), [('Anchor Blue Milk 2L', SUGGESTION_TYPE_OFFER),
+                                                     ('Blueberry Muffin', SUGGESTION_TYPE_OFFER)])
+        # The index is immutable.
+        self.assertEqual(len(self.index.suggest('blue', 10)), 2)
+        self.assertIn(('Blue Bird', SUGGESTION_TYPE_RETAILER), self.index.suggest('bird', 10))
+
+
+class OfferSuggesterTests(SimpleTestCase):
+    """
+    Suggestions never touch database, SimpleTestCase fails on any query.
+    """
+
+    def setUp(self):
+        self.suggester = OfferSuggester(update_interval=5)
+        self.suggester.index = SuggestionIndex(SuggestionIndex.make_items('Blue Bird', SUGGESTION_TYPE_RETAILER))
+
+    @mock.patch('product.suggest.threading.Thread')
+    def test_suggest_from_current_index(self, thread_class):
+        self.assertEqual(self.suggester.suggest('bir', 10), [('Blue Bird', SUGGESTION_TYPE_RETAILER)])
+        self.assertEqual(self.suggester.suggest('blu', 10), [('Blue Bird', SUGGESTION_TYPE_RETAILER)])
+        # One updater thread per process.
+        self.assertEqual(thread_class.return_value.start.call_count, 1)
+
+    @mock.patch('product.suggest.threading.Thread')
+    def test_updater_started_again_in_forked_process(self, thread_class):
+        self.suggester.start()
+        with mock.patch('product.suggest.os.getpid', return_value=os.getpid() + 1):
+            self.suggester.start()
+        self.assertEqual(thread_class.return_value.start.call_count, 2)
+
+    def test_update_skipped_while_another_thread_updates(self):
+        with self.suggester._update_lock:
+            self.assertFalse(self.suggester.update_if_needed())
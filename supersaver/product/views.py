@@ -1,21 +1,117 @@
+from django.conf import settings
 from django.shortcuts import render
-from .models import Product
-from .settings import OFFERS_PER_PAGE
+from .cache import get_offer_cache
+from .models import ActiveOffer, ImageRendition
+from .search import SEARCH_MODE_WEB, SEARCH_MODES
+from .settings import OFFERS_PER_PAGE, OFFER_SORT_BY_RELEVANCE, OFFER_SORT_BY_PRICE, OFFER_IMAGE_SIZE
+from .settings import OFFER_SUGGESTIONS_LIMIT, OFFER_SUGGESTIONS_MAX_LIMIT
+from .suggest import get_offer_suggester
+from common.utils.image import FORMAT_JPG, FORMAT_WEBP
+from core.decorator import api_error_response
+from core.exception import InvalidInput, ObjectNotFound
 from core.result import ApiResult
-from django.http import HttpResponse
+from core.serializer import ModelSerializer
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
 # Create your views here.
 
 
 CONTENT_TYPE_JSON = "application/json"
+OFFER_FIELDS = ModelSerializer.for_model(ActiveOffer).field_names
 
 
+def offers_etag(request, *args, **kwargs):
+    return get_offer_cache().current_state().version
+
+
+def offers_last_modified(request, *args, **kwargs):
+    return get_offer_cache().current_state().last_modified
+
+
+# Offer responses only change with offer cache state, conditional requests are answered
+# with 304 before the view runs, the validators cost no database query in most requests.
+@api_error_response
+@condition(etag_func=offers_etag, last_modified_func=offers_last_modified)
 def get_deals(request):
-    response = ApiResult(Product.objects.recent_offers(1, OFFERS_PER_PAGE))
-    return HttpResponse(response.to_json(), content_type=CONTENT_TYPE_JSON)
+    cursor = request.GET.get('cursor')
+    cache = get_offer_cache()
+    cache_key = cache.make_key('offers', cursor)
+    payload = cache.get(cache_key)
+    if payload is not None:
+        return HttpResponse(payload, content_type=CONTENT_TYPE_JSON)
+    offers, next_cursor = ActiveOffer.objects.recent_offers_by_cursor(cursor, OFFERS_PER_PAGE, OFFER_FIELDS)
+    response = ApiResult(offers, next_cursor=next_cursor, model=ActiveOffer)
+    return StreamingHttpResponse(cache.stream(cache_key, response.iter_json()), content_type=CONTENT_TYPE_JSON)
 
 
+@api_error_response
+@condition(etag_func=offers_etag, last_modified_func=offers_last_modified)
 def search_deals(request):
-    keywords = 'grey'
-    response = ApiResult(Product.objects.search_by_price(keywords, 1, OFFERS_PER_PAGE))
+    keywords = request.GET.get('q', '').strip()
+    if not keywords:
+        raise InvalidInput('Search keywords are required.')
+    cursor = request.GET.get('cursor')
+    sort_by = request.GET.get('sort', OFFER_SORT_BY_RELEVANCE)
+    mode = request.GET.get('mode', SEARCH_MODE_WEB)
+    if mode not in SEARCH_MODES:
+        raise InvalidInput('Unsupported search mode {0}.'.format(mode))
+    cache = get_offer_cache()
+    # Search is case insensitive.
+    cache_key = cache.make_key('offers/search', ' '.join(keywords.lower().split()), sort_by, mode, cursor)
+    payload = cache.get(cache_key)
+    if payload is not None:
+        return HttpResponse(payload, content_type=CONTENT_TYPE_JSON)
+    if sort_by == OFFER_SORT_BY_RELEVANCE:
+        offers, next_cursor = ActiveOffer.objects.search_by_relevance_by_cursor(
+            keywords, cursor, OFFERS_PER_PAGE, OFFER_FIELDS, mode)
+    elif sort_by == OFFER_SORT_BY_PRICE:
+        offers, next_cursor = ActiveOffer.objects.search_by_price_by_cursor(
+            keywords, cursor, OFFERS_PER_PAGE, OFFER_FIELDS, mode)
+    else:
+        raise InvalidInput('Unsupported sort order {0}.'.format(sort_by))
+    response = ApiResult(offers, next_cursor=next_cursor, model=ActiveOffer)
+    return StreamingHttpResponse(cache.stream(cache_key, response.iter_json()), content_type=CONTENT_TYPE_JSON)
+
+
+@api_error_response
+def suggest_deals(request):
+    prefix = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', OFFER_SUGGESTIONS_LIMIT))
+    except ValueError:
+        raise InvalidInput('Invalid limit.')
+    limit = max(0, min(limit, OFFER_SUGGESTIONS_MAX_LIMIT))
+    suggestions = get_offer_suggester().suggest(prefix, limit)
+    response = ApiResult([{'text': text, 'type': suggestion_type} for text, suggestion_type in suggestions])
     return HttpResponse(response.to_json(), content_type=CONTENT_TYPE_JSON)
 
+
+# Seconds clients may cache the redirect of an offer image.
+OFFER_IMAGE_REDIRECT_MAX_AGE = 86400
+
+
+@api_error_response
+def get_offer_image(request, offer_id):
+    """
+    Redirect to the smallest rendition of offer image which fits the device.
+    Query param w is the pixel width the client displays the image at (CSS width x device pixel ratio),
+    WebP is returned if client accepts it.
+    """
+    try:
+        width = int(request.GET.get('w', OFFER_IMAGE_SIZE))
+    except ValueError:
+        raise InvalidInput('Invalid width.')
+    fmt = FORMAT_WEBP if 'image/webp' in request.META.get('HTTP_ACCEPT', '') else FORMAT_JPG
+    renditions = sorted(ImageRendition.objects
+                        .filter(blob__images__product_id=offer_id, format=fmt)
+                        .values_list('length', 'path')
+                        .distinct())
+    if not renditions:
+        raise ObjectNotFound('Offer image is not found.')
+    # The smallest one not smaller than requested width, or the largest one.
+    path = next((p for length, p in renditions if length >= width), renditions[-1][1])
+    response = HttpResponseRedirect(settings.MEDIA_URL + path)
+    patch_vary_headers(response, ('Accept',))
+    patch_cache_control(response, public=True, max_age=OFFER_IMAGE_REDIRECT_MAX_AGE)
+    return response
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from source.models import CrawlHost, CrawlRequest
+
+# Crawls without new requests for this many days are deleted.
+DEFAULT_KEEP_DAYS = 7
+
+
+class Command(BaseCommand):
+    help = 'Delete frontier requests and hosts of crawls which have had no new requests for some days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DEFAULT_KEEP_DAYS,
+                            help='Delete crawls without new requests for this many days.')
+        parser.add_argument('--database', default='default', help='Database alias of the frontier.')
+
+    def handle(self, *args, **options):
+        db = options['database']
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        crawls = list(CrawlRequest.objects.using(db).values('crawl').order_by()
+                      .annotate(last_created_time=Max('created_time'))
+                      .filter(last_created_time__lt=cutoff).values_list('crawl', flat=True))
+        with transaction.atomic(using=db):
+            deleted, _ = CrawlRequest.objects.using(db).filter(crawl__in=crawls).delete()
+            CrawlHost.objects.using(db).filter(crawl__in=crawls).delete()
+        self.stdout.write('Deleted {0} requests of {1} crawls.'.format(deleted, len(crawls)))
@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, Min, OuterRef
+from django.db.models import manager
+from django.utils import timezone
+
+
+class CrawlRequestManager (manager.Manager):
+    """
+    Shared crawl frontier, requests of a crawl are pulled by many crawler workers.
+
+    On PostgreSQL requests are claimed by SELECT ... FOR UPDATE SKIP LOCKED, so workers never wait for each other.
+    A claim is also conditional on request state, so databases without row locks (e.g. SQLite) never hand out
+    a request twice either.
+    """
+
+    def add(self, crawl, fingerprint, host, priority, data):
+        """
+        Add a request unless a request with the same fingerprint was added to the crawl.
+        :param crawl: crawl name, workers of the same crawl share requests.
+        :param fingerprint: request fingerprint.
+        :param host: request host, requests of a host are fetched no faster than host delay, see claim.
+        :param data: serialized request.
+        :return: True if added.
+        """
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(crawl=crawl, fingerprint=fingerprint, host=host, priority=priority, data=data)
+        except IntegrityError:
+            return False
+        return True
+
+    def requeue(self, request_id, fingerprint, priority, data):
+        """
+        Put a claimed request back to the queue with new data, e.g. to retry it.
+        :return: True if the request was claimed and has the same fingerprint.
+        """
+        return self.filter(pk=request_id, fingerprint=fingerprint, state=self.model.STATE_CLAIMED) \
+            .update(state=self.model.STATE_PENDING, priority=priority, data=data, claimed_time=None) > 0
+
+    def claim(self, crawl, host_delay):
+        """
+        Claim the pending request with the highest priority of a host which is due.
+        :param host_delay: seconds between two requests of a host.
+        :return: tuple of (request, seconds to wait), request is None if no request can be claimed now,
+            seconds to wait is None unless there are pending requests of hosts which are not due.
+        """
+        from .models import CrawlHost
+        now = timezone.now()
+        pending = self.filter(crawl=crawl, host=OuterRef('host'), state=self.model.STATE_PENDING)
+        hosts = CrawlHost.objects.db_manager(self.db).filter(crawl=crawl) \
+            .annotate(has_pending=Exists(pending)).filter(has_pending=True)
+        with transaction.atomic(using=self.db):
+            host = hosts.filter(next_fetch_time__lte=now).select_for_update(skip_locked=True) \
+                .order_by('next_fetch_time').first()
+            if host is None:
+                due = hosts.aggregate(due=Min('next_fetch_time'))['due']
+                return None, None if due is None else max(0.0, (due - now).total_seconds())
+            request = self.filter(crawl=crawl, host=host.host, state=self.model.STATE_PENDING) \
+                .select_for_update(skip_locked=True).order_by('-priority', 'id').first()
+            if request is None or not self.filter(pk=request.pk, state=self.model.STATE_PENDING).update(
+                    state=self.model.STATE_CLAIMED, claimed_time=now, attempts=F('attempts') + 1):
+                # Claimed by another worker.
+                return None, 0.0
+            CrawlHost.objects.db_manager(self.db).filter(pk=host.pk) \
+                .update(next_fetch_time=now + timedelta(seconds=host_delay))
+        return request, None
+
+    def finish(self, request_ids):
+        """
+        Mark claimed requests done.
+        """
+        return self.filter(pk__in=request_ids, state=self.model.STATE_CLAIMED).update(state=self.model.STATE_DONE)
+
+    def release_expired(self, crawl, timeout, max_attempts):
+        """
+        Put requests claimed for longer than timeout back to the queue, e.g. their worker died or failed to download.
+        Requests claimed max attempts times are marked failed instead.
+        :param timeout: seconds a request can be claimed.
+        :return: number of requests put back.
+        """
+        expired = self.filter(crawl=crawl, state=self.model.STATE_CLAIMED,
+                              claimed_time__lt=timezone.now() - timedelta(seconds=timeout))
+        expired.filter(attempts__gte=max_attempts).update(state=self.model.STATE_FAILED)
+        return expired.filter(attempts__lt=max_attempts).update(state=self.model.STATE_PENDING, claimed_time=None)
+
+    def has_unfinished(self, crawl):
+        """
+        :return: True if the crawl has requests pending or being fetched by any worker.
+        """
+        return self.filter(crawl=crawl, state__in=(self.model.STATE_PENDING, self.model.STATE_CLAIMED)).exists()
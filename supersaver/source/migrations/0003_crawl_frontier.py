@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('source', '0002_insert_init_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlHost',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('crawl', models.CharField(max_length=128)),
+                ('host', models.CharField(max_length=256)),
+                ('next_fetch_time', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('crawl', 'host')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CrawlRequest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('crawl', models.CharField(max_length=128)),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('host', models.CharField(max_length=256)),
+                ('priority', models.IntegerField(default=0)),
+                ('state', models.SmallIntegerField(
+                    choices=[(0, 'Pending'), (1, 'Claimed'), (2, 'Done'), (3, 'Failed')], default=0)),
+                ('attempts', models.SmallIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('claimed_time', models.DateTimeField(default=None, null=True)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('crawl', 'fingerprint')},
+                'index_together': {('crawl', 'host', 'state', 'priority')},
+            },
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
+from django.utils import timezone
 
 from country.models import Country
+from .managers import CrawlRequestManager
 
 
 class DataSource (models.Model):
@@ -21,3 +23,65 @@ class DataSource (models.Model):
             .format(self.id, self.name, self.display_name,
                     self.site, self.logo_url, self.country_id)
 
+
+
+class CrawlHost (models.Model):
+    """
+    Host of crawl requests, it keeps requests of the host apart by host delay across crawler workers.
+    """
+    crawl = models.CharField(max_length=128, null=False, blank=False)
+    host = models.CharField(max_length=256, null=False, blank=False)
+    # Earliest time to fetch next request of the host.
+    next_fetch_time = models.DateTimeField(null=False)
+
+    class Meta:
+        unique_together = ('crawl', 'host')
+
+    @classmethod
+    def ensure(cls, crawl, host, using='default'):
+        cls.objects.using(using).get_or_create(crawl=crawl, host=host, defaults={'next_fetch_time': timezone.now()})
+
+    def __repr__(self):
+        return 'CrawlHost: id={0}, crawl={1}, host={2}, next_fetch_time={3}'.format(
+            self.pk, self.crawl, self.host, self.next_fetch_time)
+
+
+class CrawlRequest (models.Model):
+    """
+    Request in the shared crawl frontier, see CrawlRequestManager.
+    A request is kept after it is done, so the same request is not added again in the crawl.
+    """
+    STATE_PENDING = 0
+    STATE_CLAIMED = 1
+    STATE_DONE = 2
+    STATE_FAILED = 3
+    STATE_CHOICES = (
+        (STATE_PENDING, 'Pending'),
+        (STATE_CLAIMED, 'Claimed'),
+        (STATE_DONE, 'Done'),
+        (STATE_FAILED, 'Failed'),
+    )
+
+    # Workers of the same crawl share requests, e.g. lasoo.co.nz:2018-03-01.
+    crawl = models.CharField(max_length=128, null=False, blank=False)
+    # Hex SHA-1 request fingerprint.
+    fingerprint = models.CharField(max_length=40, null=False, blank=False)
+    host = models.CharField(max_length=256, null=False, blank=False)
+    priority = models.IntegerField(default=0)
+    state = models.SmallIntegerField(choices=STATE_CHOICES, default=STATE_PENDING)
+    # Number of times the request was claimed.
+    attempts = models.SmallIntegerField(default=0)
+    # Serialized scrapy request.
+    data = models.BinaryField()
+    claimed_time = models.DateTimeField(null=True, default=None)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    objects = CrawlRequestManager()
+
+    class Meta:
+        unique_together = ('crawl', 'fingerprint')
+        index_together = ('crawl', 'host', 'state', 'priority')
+
+    def __repr__(self):
+        return 'CrawlRequest: id={0}, crawl={1}, host={2}, state={3}, attempts={4}'.format(
+            self.pk, self.crawl, self.host, self.state, self.attempts)
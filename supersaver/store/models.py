@@ -31,7 +31,7 @@ class Store(models.Model):
         super().save(**kwargs)
 
     def value_equals_to(self, other):
-        if other is not Store:
+        if not isinstance(other, Store):
             return False
         return self.name == other.name \
             and self.longitude == other.longitude \
@@ -188,6 +188,11 @@ IMAGE_JPG_QUALITY_PARAMS = {
     'progressive': True
 }
 
+IMAGE_WEBP_QUALITY_PARAMS = {
+    'quality': 80,
+    'method': 4
+}
+
 INTERNAL_PROPERTY_NAME_PREFIX = '__'
 
 
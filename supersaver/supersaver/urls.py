@@ -24,6 +24,8 @@ from product import views as product_views
 web_1_0_urlpatterns = [
     url(r'^offers/$', product_views.get_deals, name='recent_deals'),
     url(r'^offers/search/$', product_views.search_deals, name='search_deals'),
+    url(r'^offers/suggest/$', product_views.suggest_deals, name='suggest_deals'),
+    url(r'^offers/(?P<offer_id>[0-9a-f-]{36})/image/$', product_views.get_offer_image, name='offer_image'),
 ]
 
 urlpatterns = [
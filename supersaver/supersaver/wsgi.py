@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "supersaver.settings")
 
 application = get_wsgi_application()
+
+# Load offer suggestions before the first request, web workers forked from this process inherit them.
+from product.suggest import get_offer_suggester
+get_offer_suggester().load()